@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "movies.apps.MoviesConfig",
     "members.apps.MembersConfig",
 ]
@@ -133,3 +134,19 @@ STATIC_URL = "/static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "members.User"
+
+# Пересчитывать movies_filmsummary после каждой транзакции, изменившей фильмы, жанры или состав.
+# Пересчёт идёт по всему представлению внутри запроса админки, поэтому по умолчанию выключен:
+# сводку обновляет manage.py refresh_film_summary по расписанию
+FILM_SUMMARY_REFRESH_ON_CHANGE = env.bool("FILM_SUMMARY_REFRESH_ON_CHANGE", default=False)
+
+# Сколько секунд страницы автодополнения фильмов, людей и ролей хранятся в кеше
+AUTOCOMPLETE_CACHE_TIMEOUT = env.int("AUTOCOMPLETE_CACHE_TIMEOUT", default=60)
+
+# Пока планировщик ожидает меньше строк, списки в админке считают их точно через COUNT(*),
+# а начиная с этого количества показывают оценку
+ADMIN_EXACT_COUNT_LIMIT = env.int("ADMIN_EXACT_COUNT_LIMIT", default=10_000)
+
+# Сколько секунд роль пользователя хранится в кеше. При изменении Membership она удаляется из кеша сразу,
+# но в других процессах — только если кеш общий (Redis, Memcached), иначе через это время
+MEMBERSHIP_ROLE_CACHE_TIMEOUT = env.int("MEMBERSHIP_ROLE_CACHE_TIMEOUT", default=300)
@@ -15,7 +15,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
+from movies.views import autocomplete
 
 urlpatterns = [
+    path(
+        "admin/movies/autocomplete/<str:source_name>/", admin.site.admin_view(autocomplete), name="movies-autocomplete"
+    ),
     path("admin/", admin.site.urls),
 ]
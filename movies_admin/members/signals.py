@@ -0,0 +1,16 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from members.models import Membership
+from members.utils import role_cache_key
+
+
+def forget_role(sender, instance, **kwargs):
+    # После коммита: иначе параллельный запрос успел бы положить в кеш ещё старую роль
+    transaction.on_commit(partial(cache.delete, role_cache_key(instance.user_id)))
+
+
+post_save.connect(forget_role, sender=Membership, dispatch_uid="membership_role_save")
+post_delete.connect(forget_role, sender=Membership, dispatch_uid="membership_role_delete")
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from members.models import Membership, User
+
+# Запросы на главную админки, когда роль уже в кеше: сессия, пользователь и последние действия.
+# Проверки прав всех ModelAdmin не должны добавлять к ним ни одного
+INDEX_QUERY_BUDGET = 3
+
+
+class AdminIndexQueriesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            "editor", "editor@example.com", "password", is_staff=True, is_superuser=True
+        )
+        self.membership = Membership.objects.create(user=self.user, role=Membership.Roles.MOVIES_ADMIN)
+        self.client.force_login(self.user)
+
+    def get_index(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin:index"))
+        self.assertEqual(response.status_code, 200)
+        return response, [query["sql"] for query in queries]
+
+    def test_query_budget(self):
+        # Первый запрос читает роль, дальше она берётся из кеша
+        _, queries = self.get_index()
+        self.assertLessEqual(len(queries), INDEX_QUERY_BUDGET + 1, "\n".join(queries))
+        _, queries = self.get_index()
+        self.assertLessEqual(len(queries), INDEX_QUERY_BUDGET, "\n".join(queries))
+        self.assertFalse([sql for sql in queries if Membership._meta.db_table in sql])
+
+    def test_role_change_invalidates_cache(self):
+        response, _ = self.get_index()
+        models = {model["object_name"] for app in response.context["app_list"] for model in app["models"]}
+        self.assertIn("FilmWork", models)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.membership.role = Membership.Roles.SECURITY_OFFICER
+            self.membership.save()
+
+        response, _ = self.get_index()
+        models = {model["object_name"] for app in response.context["app_list"] for model in app["models"]}
+        self.assertNotIn("FilmWork", models)
+        self.assertIn("User", models)
@@ -1,19 +1,84 @@
+from typing import FrozenSet, Optional
+
+from django.conf import settings
+from django.core.cache import cache
 from members.models import Membership
 
+# Права ролей по приложениям. Пользователь без Membership может всё
+PERMISSIONS = {
+    Membership.Roles.MOVIES_VIEW: {"movies": frozenset({"view"})},
+    Membership.Roles.MOVIES_ADMIN: {
+        "movies": frozenset({"view", "add", "change", "delete"}),
+        "members": frozenset({"view"}),
+    },
+    Membership.Roles.SECURITY_OFFICER: {"members": frozenset({"view", "add", "change", "delete"})},
+}
+
+# В кеше нельзя отличить сохранённый None от отсутствующего ключа
+NO_MEMBERSHIP = 0
+
+
+def role_cache_key(user_id) -> str:
+    return f"members:role:{user_id}"
+
+
+def get_role(user) -> Optional[int]:
+    """
+    Роль пользователя или None, если Membership у него нет.
+    За запрос роль читается один раз и запоминается на объекте пользователя,
+    между запросами хранится в кеше до изменения Membership, см. members.signals.
+    """
+    if not getattr(user, "is_authenticated", False):
+        return None
+    if hasattr(user, "_membership_role"):
+        return user._membership_role
+    role = cache.get(role_cache_key(user.pk))
+    if role is None:
+        role = Membership.objects.filter(user_id=user.pk).values_list("role", flat=True).first() or NO_MEMBERSHIP
+        cache.set(role_cache_key(user.pk), role, settings.MEMBERSHIP_ROLE_CACHE_TIMEOUT)
+    user._membership_role = None if role == NO_MEMBERSHIP else role
+    return user._membership_role
+
+
+def role_permissions(user, app_label: str) -> Optional[FrozenSet[str]]:
+    """Действия, разрешённые пользователю в приложении, или None, если ограничений нет"""
+    role = get_role(user)
+    if role is None:
+        return None
+    return PERMISSIONS.get(role, {}).get(app_label, frozenset())
+
+
+def has_role_permission(user, app_label: str, action: str) -> bool:
+    allowed = role_permissions(user, app_label)
+    return allowed is None or action in allowed
+
 
 def is_admin(user) -> bool:
-    if getattr(user, "membership", None):
-        return user.membership.role == Membership.Roles.MOVIES_ADMIN
-    return True
+    role = get_role(user)
+    return role is None or role == Membership.Roles.MOVIES_ADMIN
 
 
 def is_view_only(user) -> bool:
-    if getattr(user, "membership", None):
-        return user.membership.role == Membership.Roles.MOVIES_VIEW
-    return True
+    role = get_role(user)
+    return role is None or role == Membership.Roles.MOVIES_VIEW
 
 
 def is_security_officer(user) -> bool:
-    if getattr(user, "membership", None):
-        return user.membership.role == Membership.Roles.SECURITY_OFFICER
-    return True
+    role = get_role(user)
+    return role is None or role == Membership.Roles.SECURITY_OFFICER
+
+
+class RolePermissionsMixin:
+    """Права ModelAdmin по PERMISSIONS для роли пользователя в приложении модели"""
+
+    def has_view_permission(self, request, obj=None):
+        return has_role_permission(request.user, self.opts.app_label, "view")
+
+    def has_add_permission(self, request):
+        return has_role_permission(request.user, self.opts.app_label, "add")
+
+    def has_change_permission(self, request, obj=None):
+        return has_role_permission(request.user, self.opts.app_label, "change")
+
+    def has_delete_permission(self, request, obj=None):
+        return has_role_permission(request.user, self.opts.app_label, "delete")
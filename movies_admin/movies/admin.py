@@ -1,19 +1,36 @@
+import uuid
+from contextlib import suppress
+
 from django import forms
 from django.contrib import admin
-from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F
 from django.utils.translation import gettext_lazy as _
-from members.utils import is_admin, is_view_only
+from members.utils import RolePermissionsMixin
+from movies.changelist import LargeTableAdminMixin
+from movies.filters import GenreFacetFilter, RatingFacetFilter, TypeFacetFilter, YearFacetFilter
 from movies.models import FilmWork, Genre, Person
+from movies.search import trigram_search
+from movies.widgets import KeysetAutocompleteSelect, KeysetAutocompleteSelectMultiple
 
 
 class CastInlineAdmin(admin.TabularInline):
     model = FilmWork.people.through
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # Обычный select на каждой строке выводил бы всех людей и делал по запросу на строку
+        if db_field.name in ("person", "role"):
+            kwargs["widget"] = KeysetAutocompleteSelect(db_field.related_model._meta.model_name)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 
 @admin.register(FilmWork)
-class MovieAdmin(admin.ModelAdmin):
-    list_display = ("title", "type", "creation_date", "rating", "created", "modified")
-    list_filter = ("created", "title")
+class MovieAdmin(RolePermissionsMixin, LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ("title", "type", "creation_date", "rating", "genres_list", "created", "modified")
+    # Жанры берутся из movies_filmsummary одним соединением, а не запросом на каждый фильм
+    list_select_related = ("summary",)
+    # Варианты жанра, типа, рейтинга и года с количеством фильмов берутся из movies_filmfacet
+    list_filter = ("created", GenreFacetFilter, TypeFacetFilter, RatingFacetFilter, YearFacetFilter)
     search_fields = ("title", "description", "id")
     inlines = (CastInlineAdmin,)
 
@@ -28,24 +45,53 @@ class MovieAdmin(admin.ModelAdmin):
         "genres",
     )
 
-    def has_view_permission(self, request, obj=None):
-        return is_admin(request.user) or is_view_only(request.user)
-
-    def has_add_permission(self, request):
-        return is_admin(request.user)
-
-    def has_change_permission(self, request, obj=None):
-        return is_admin(request.user)
-
-    def has_delete_permission(self, request, obj=None):
-        return is_admin(request.user)
+    def get_queryset(self, request):
+        # tsvector нужен только для поиска: в список и форму он не загружается
+        return super().get_queryset(request).defer("search_vector")
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Полнотекстовый поиск по search_vector вместо ILIKE '%...%' по search_fields:
+        запрос идёт по GIN-индексу, результаты упорядочены по релевантности.
+        Число или uuid ищутся точным совпадением по первичному ключу или uuid.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        # str.isdigit() истинно и для символов вроде "²", которые int() не принимает;
+        # число больше bigint первичного ключа Postgres не сравнит с ним и вернёт ошибку
+        if search_term.isascii() and search_term.isdigit() and int(search_term) < 2**63:
+            exact = queryset.filter(pk=int(search_term))
+            if exact.exists():
+                return exact, False
+        with suppress(ValueError):
+            return queryset.filter(uuid=uuid.UUID(search_term)), False
+
+        # websearch понимает кавычки, OR и минус, как поисковики, и не падает на спецсимволах
+        query = SearchQuery(search_term, config="russian", search_type="websearch") | SearchQuery(
+            search_term, config="english", search_type="websearch"
+        )
+        queryset = (
+            queryset.filter(search_vector=query)
+            .annotate(search_rank=SearchRank(F("search_vector"), query))
+            .order_by("-search_rank")
+        )
+        return queryset, False
+
+    @admin.display(description=_("жанры"))
+    def genres_list(self, obj):
+        # Фильма нет в сводке, пока она не пересчитана после его создания
+        summary = getattr(obj, "summary", None)
+        return ", ".join(summary.genres) if summary else ""
 
 
 class PersonAdminForm(forms.ModelForm):
     film_works = forms.ModelMultipleChoiceField(
-        queryset=FilmWork.objects.all(),
+        queryset=FilmWork.objects.defer("search_vector"),
         required=False,
-        widget=FilteredSelectMultiple(verbose_name=_("кинопроизведения"), is_stacked=False),
+        label=_("кинопроизведения"),
+        widget=KeysetAutocompleteSelectMultiple("filmwork"),
     )
 
     class Meta:
@@ -72,38 +118,20 @@ class PersonAdminForm(forms.ModelForm):
 
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(RolePermissionsMixin, LargeTableAdminMixin, admin.ModelAdmin):
     form = PersonAdminForm
 
     search_fields = ("first_name", "last_name")
 
-    def has_view_permission(self, request, obj=None):
-        return is_admin(request.user) or is_view_only(request.user)
-
-    def has_add_permission(self, request):
-        return is_admin(request.user)
-
-    def has_change_permission(self, request, obj=None):
-        return is_admin(request.user)
-
-    def has_delete_permission(self, request, obj=None):
-        return is_admin(request.user)
+    def get_search_results(self, request, queryset, search_term):
+        # Полное имя целиком сравнивается по триграммам вместо ILIKE по каждому слову в каждой колонке
+        return trigram_search(queryset, search_term, "first_name", "last_name"), False
 
 
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
+class GenreAdmin(RolePermissionsMixin, LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ("genre", "id")
-    list_filter = ("genre",)
     search_fields = ("genre",)
 
-    def has_view_permission(self, request, obj=None):
-        return is_admin(request.user) or is_view_only(request.user)
-
-    def has_add_permission(self, request):
-        return is_admin(request.user)
-
-    def has_change_permission(self, request, obj=None):
-        return is_admin(request.user)
-
-    def has_delete_permission(self, request, obj=None):
-        return is_admin(request.user)
+    def get_search_results(self, request, queryset, search_term):
+        return trigram_search(queryset, search_term, "genre"), False
@@ -0,0 +1,72 @@
+import json
+from typing import Dict, NamedTuple, Optional, Tuple, Type
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import F, Q
+from movies.models import FilmWork, Person, Role
+from movies.search import SearchName, normalize_term
+
+PAGE_SIZE = 20
+
+
+class Source(NamedTuple):
+    """Модель для автодополнения и поля, из которых складывается искомая строка"""
+
+    model: Type[models.Model]
+    fields: Tuple[str, ...]
+
+
+# Ключи — имена моделей, по ним виджет строит адрес запроса
+SOURCES: Dict[str, Source] = {
+    "filmwork": Source(FilmWork, ("title",)),
+    "person": Source(Person, ("first_name", "last_name")),
+    "role": Source(Role, ("role",)),
+}
+
+
+class InvalidCursor(ValueError):
+    """Курсор следующей страницы не получен из ответа autocomplete_page"""
+
+
+def autocomplete_page(source: Source, term: str = "", after: Optional[str] = None) -> dict:
+    """
+    Страница вариантов в формате Select2 и курсор следующей страницы.
+    Страницы идут по ключу (search_name, pk), а не через OFFSET и COUNT(*):
+    следующая страница начинается сразу за последней строкой предыдущей,
+    поэтому любая страница читает из индекса не больше PAGE_SIZE + 1 строк.
+    Индексы по ключу и триграммные индексы для поиска — в миграциях 0004 и 0005.
+    """
+    queryset = (
+        source.model.objects.only(*source.fields)
+        .annotate(search_name=SearchName(*(F(field) for field in source.fields)))
+        .order_by("search_name", "pk")
+    )
+    term = normalize_term(term)
+    if term:
+        queryset = queryset.filter(search_name__contains=term)
+    if after:
+        name, pk = _parse_cursor(source.model, after)
+        # Первое условие повторяет второе, но только его планировщик может передать в индекс
+        queryset = queryset.filter(search_name__gte=name).filter(Q(search_name__gt=name) | Q(pk__gt=pk))
+
+    rows = list(queryset[: PAGE_SIZE + 1])
+    page = rows[:PAGE_SIZE]
+    return {
+        "results": [{"id": str(row.pk), "text": str(row)} for row in page],
+        "next": json.dumps([page[-1].search_name, str(page[-1].pk)]) if len(rows) > PAGE_SIZE else None,
+    }
+
+
+def _parse_cursor(model: Type[models.Model], after: str) -> Tuple[str, object]:
+    """
+    Имя и pk последней строки страницы. pk приводится к типу первичного ключа здесь же:
+    иначе чужое значение дошло бы до filter(pk__gt=...) и упало там, а не как InvalidCursor
+    """
+    try:
+        name, pk = json.loads(after)
+        if not isinstance(name, str) or not isinstance(pk, str):
+            raise TypeError("cursor must hold two strings")
+        return name, model._meta.pk.to_python(pk)
+    except (TypeError, ValueError, ValidationError) as error:
+        raise InvalidCursor(f"invalid cursor {after!r}") from error
@@ -0,0 +1,131 @@
+import json
+
+from django.conf import settings
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ALL_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+# Параметры адреса списка: страница после или перед строкой с этим pk и точный подсчёт строк
+AFTER_VAR = "after"
+BEFORE_VAR = "before"
+EXACT_COUNT_VAR = "exact"
+KEYSET_PARAMS = (AFTER_VAR, BEFORE_VAR, EXACT_COUNT_VAR)
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """
+    Количество строк по оценке планировщика, без чтения таблицы.
+    Для списка без фильтров это reltuples из pg_class, пересчитанная на текущий размер таблицы,
+    для отфильтрованного — оценка селективности условий по статистике столбцов.
+    """
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    # psycopg2 разбирает json сам, но только если тип результата известен как json
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, который не делает COUNT(*) по большим выборкам:
+    если планировщик ожидает не меньше ADMIN_EXACT_COUNT_LIMIT строк, count — это его оценка.
+    """
+
+    def __init__(self, *args, exact: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exact = exact
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        if not self.exact:
+            estimate = estimate_count(self.object_list)
+            if estimate >= settings.ADMIN_EXACT_COUNT_LIMIT:
+                self.estimated = True
+                return estimate
+        return super().count
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Список, который при сортировке по первичному ключу листается по ключу, а не через OFFSET:
+    следующая страница — строки после последнего pk текущей, поэтому любая страница
+    читает из индекса первичного ключа не больше list_per_page + 1 строк.
+    При сортировке по другим столбцам и в поиске остаются обычные номера страниц.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.keyset = False
+        self.next_url = self.previous_url = self.show_all_url = None
+        super().__init__(request, *args, **kwargs)
+        self.exact_count_url = self.get_query_string({EXACT_COUNT_VAR: "1"})
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        for name in KEYSET_PARAMS:
+            lookup_params.pop(name, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Сортировка, фильтры и поиск начинают список с первой страницы
+        return super().get_query_string({AFTER_VAR: None, BEFORE_VAR: None, **(new_params or {})}, remove)
+
+    def get_results(self, request):
+        super().get_results(request)
+        descending = self.queryset.query.order_by == ("-pk",)
+        if not (descending or self.queryset.query.order_by == ("pk",)) or self.list_editable:
+            return
+        if not self.multi_page or (self.show_all and self.can_show_all):
+            return
+        self.keyset = True
+        if self.can_show_all:
+            self.show_all_url = self.get_query_string({ALL_VAR: ""})
+
+        after = request.GET.get(AFTER_VAR)
+        before = request.GET.get(BEFORE_VAR)
+        forward, backward = ("pk__lt", "pk__gt") if descending else ("pk__gt", "pk__lt")
+        size = self.list_per_page
+        try:
+            previous_rows = list(self.queryset.filter(**{backward: before}).reverse()[: size + 1]) if before else []
+            if len(previous_rows) > size:
+                rows = previous_rows[size - 1 :: -1]
+                has_previous = has_next = True
+            else:
+                # Перед строкой before меньше страницы: это начало списка
+                after = None if before else after
+                rows = list((self.queryset.filter(**{forward: after}) if after else self.queryset)[: size + 1])
+                has_previous = bool(after and rows)
+                has_next = len(rows) > size
+                rows = rows[:size]
+        except (ValueError, ValidationError):
+            raise IncorrectLookupParameters
+        if has_previous:
+            self.previous_url = self.get_query_string({BEFORE_VAR: rows[0].pk})
+        if has_next:
+            self.next_url = self.get_query_string({AFTER_VAR: rows[-1].pk})
+        self.result_list = rows
+
+
+class LargeTableAdminMixin:
+    """
+    Список без COUNT(*) и OFFSET по большим таблицам: приблизительное количество строк,
+    пока пользователь не попросит точное, и страницы по первичному ключу.
+    """
+
+    # Иначе админка на каждой странице считает ещё и все строки таблицы без фильтров
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return EstimatedCountPaginator(
+            queryset, per_page, orphans, allow_empty_first_page, exact=EXACT_COUNT_VAR in request.GET
+        )
@@ -0,0 +1,75 @@
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+from django.db import connection, transaction
+from movies.models import FilmFacet, FilmWork
+
+# Рейтинг делится на корзины [0, 1), [1, 2), ... , последняя — от RATING_BUCKETS - 1 и выше
+RATING_BUCKETS = 10
+
+UPSERT_SQL = f"""
+INSERT INTO {FilmFacet._meta.db_table} (facet, value, count) VALUES (%s, %s, %s)
+ON CONFLICT (facet, value) DO UPDATE SET count = {FilmFacet._meta.db_table}.count + EXCLUDED.count
+"""
+
+# Значения считаются так же, как в film_facets
+REBUILD_SQL = f"""
+DELETE FROM {FilmFacet._meta.db_table};
+INSERT INTO {FilmFacet._meta.db_table} (facet, value, count)
+SELECT 'genre', genre_id::text, count(*) FROM movies_filmwork_genres GROUP BY genre_id
+UNION ALL
+SELECT 'type', type, count(*) FROM movies_filmwork GROUP BY type
+UNION ALL
+SELECT 'rating', least(floor(rating), {RATING_BUCKETS - 1})::int::text, count(*)
+FROM movies_filmwork WHERE rating IS NOT NULL GROUP BY 1, 2
+UNION ALL
+SELECT 'year', extract(year FROM creation_date)::int::text, count(*)
+FROM movies_filmwork WHERE creation_date IS NOT NULL GROUP BY 1, 2;
+"""
+
+FacetKey = Tuple[str, str]
+
+
+def rating_bucket(rating: float) -> int:
+    return min(int(rating), RATING_BUCKETS - 1)
+
+
+def _field_value(film: FilmWork, name: str):
+    # Поля можно присвоить строками, например rating="7.5": в базу их приводит сам Django
+    return FilmWork._meta.get_field(name).to_python(getattr(film, name))
+
+
+def film_facets(film: FilmWork) -> List[FacetKey]:
+    """Фасеты из полей самого фильма. Жанры хранятся в связях и учитываются по ним отдельно"""
+    facets = [(FilmFacet.Facet.TYPE, _field_value(film, "type"))]
+    rating = _field_value(film, "rating")
+    if rating is not None:
+        facets.append((FilmFacet.Facet.RATING, str(rating_bucket(rating))))
+    creation_date = _field_value(film, "creation_date")
+    if creation_date is not None:
+        facets.append((FilmFacet.Facet.YEAR, str(creation_date.year)))
+    return facets
+
+
+def genre_facets(genre_ids: Iterable[int]) -> List[FacetKey]:
+    return [(FilmFacet.Facet.GENRE, str(genre_id)) for genre_id in genre_ids]
+
+
+def apply_facet_changes(added: Iterable[FacetKey] = (), removed: Iterable[FacetKey] = ()):
+    """
+    Прибавляет по фильму к счётчикам added и вычитает из removed в текущей транзакции,
+    поэтому при её откате счётчики откатываются вместе с фильмами.
+    """
+    deltas = Counter(added)
+    deltas.subtract(removed)
+    # Строки обновляются в одном порядке, чтобы параллельные транзакции не взаимоблокировались
+    rows = [(str(facet), value, delta) for (facet, value), delta in sorted(deltas.items()) if delta]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(UPSERT_SQL, rows)
+
+
+def rebuild_film_facets():
+    """Пересчёт всех счётчиков, например после загрузки фильмов в обход ORM"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL)
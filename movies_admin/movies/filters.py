@@ -0,0 +1,104 @@
+import datetime
+from typing import Optional
+
+from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.utils.translation import gettext_lazy as _
+from movies.facets import RATING_BUCKETS
+from movies.models import FilmFacet, FilmWork, Genre
+
+
+class FacetListFilter(admin.SimpleListFilter):
+    """
+    Фильтр списка фильмов, варианты и количество фильмов для которого берутся из movies_filmfacet.
+    Количество считается по всем фильмам, без учёта других выбранных фильтров:
+    так боковая панель строится одним запросом к маленькой таблице при любом размере каталога.
+    """
+
+    facet: FilmFacet.Facet
+
+    def lookups(self, request, model_admin):
+        counts = dict(FilmFacet.objects.filter(facet=self.facet, count__gt=0).values_list("value", "count"))
+        labels = self.labels(counts)
+        return [(value, f"{labels.get(value, value)} ({counts[value]})") for value in self.order(counts, labels)]
+
+    def labels(self, values) -> dict:
+        return {}
+
+    def order(self, values, labels) -> list:
+        return sorted(values, key=lambda value: labels.get(value, value))
+
+    def int_value(self, lower: int, upper: int) -> Optional[int]:
+        """
+        Выбранное значение как число из [lower, upper) или None, если фильтр не выбран.
+        Django вызывает queryset() фильтров вне перехвата ошибок поиска, поэтому мусор
+        в адресе превращается в IncorrectLookupParameters здесь: админка перенаправит на ?e=1
+        """
+        if not self.value():
+            return None
+        try:
+            value = int(self.value())
+        except ValueError:
+            raise IncorrectLookupParameters(f"invalid {self.parameter_name} {self.value()!r}")
+        if not lower <= value < upper:
+            raise IncorrectLookupParameters(f"invalid {self.parameter_name} {self.value()!r}")
+        return value
+
+
+class GenreFacetFilter(FacetListFilter):
+    title = _("жанр")
+    parameter_name = "genre"
+    facet = FilmFacet.Facet.GENRE
+
+    def labels(self, values):
+        return {str(pk): genre for pk, genre in Genre.objects.filter(pk__in=values).values_list("pk", "genre")}
+
+    def queryset(self, request, queryset):
+        # Верхняя граница — bigint первичного ключа жанра
+        genre_id = self.int_value(1, 2**63)
+        return queryset if genre_id is None else queryset.filter(genres=genre_id)
+
+
+class TypeFacetFilter(FacetListFilter):
+    title = _("тип")
+    parameter_name = "type"
+    facet = FilmFacet.Facet.TYPE
+
+    def labels(self, values):
+        return dict(FilmWork.MovieType.choices)
+
+    def queryset(self, request, queryset):
+        return queryset.filter(type=self.value()) if self.value() else queryset
+
+
+class RatingFacetFilter(FacetListFilter):
+    title = _("рейтинг")
+    parameter_name = "rating_bucket"
+    facet = FilmFacet.Facet.RATING
+
+    def labels(self, values):
+        return {value: f"{value}–{int(value) + 1}" for value in values}
+
+    def order(self, values, labels):
+        return sorted(values, key=int, reverse=True)
+
+    def queryset(self, request, queryset):
+        bucket = self.int_value(0, RATING_BUCKETS)
+        if bucket is None:
+            return queryset
+        queryset = queryset.filter(rating__gte=bucket)
+        # В последнюю корзину попадают и рейтинги выше её верхней границы
+        return queryset.filter(rating__lt=bucket + 1) if bucket < RATING_BUCKETS - 1 else queryset
+
+
+class YearFacetFilter(FacetListFilter):
+    title = _("год")
+    parameter_name = "year"
+    facet = FilmFacet.Facet.YEAR
+
+    def order(self, values, labels):
+        return sorted(values, key=int, reverse=True)
+
+    def queryset(self, request, queryset):
+        year = self.int_value(datetime.MINYEAR, datetime.MAXYEAR + 1)
+        return queryset if year is None else queryset.filter(creation_date__year=year)
@@ -0,0 +1,10 @@
+from django.core.management import BaseCommand
+from movies.facets import rebuild_film_facets
+
+
+class Command(BaseCommand):
+    help = "Recounts movies_filmfacet from scratch, e.g. after loading films bypassing the ORM"
+
+    def handle(self, *args, **kwargs):
+        rebuild_film_facets()
+        self.stdout.write("Film facets have been rebuilt")
@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+from movies.summary import refresh_film_summary
+
+
+class Command(BaseCommand):
+    help = "Refreshes the movies_filmsummary materialized view"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--blocking",
+            action="store_true",
+            help="Refresh without CONCURRENTLY: faster, but blocks reads until it finishes",
+        )
+
+    def handle(self, *args, **kwargs):
+        refresh_film_summary(concurrently=not kwargs["blocking"])
+        self.stdout.write("Film summary has been refreshed")
@@ -0,0 +1,118 @@
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Одна строка на фильм: жанры и состав по ролям уже собраны в массивы.
+# Агрегаты считаются отдельными подзапросами с GROUP BY, поэтому полное обновление
+# идёт хеш-агрегацией по всем связям, а не вложенным запросом на каждый фильм
+CREATE_SQL = """
+CREATE MATERIALIZED VIEW movies_filmsummary AS
+SELECT
+    fw.id AS film_work_id,
+    fw.uuid,
+    fw.title,
+    fw.type,
+    fw.creation_date,
+    fw.rating,
+    coalesce(g.genres, '{}') AS genres,
+    coalesce(p.actors, '{}') AS actors,
+    coalesce(p.directors, '{}') AS directors,
+    coalesce(p.writers, '{}') AS writers,
+    coalesce(cardinality(g.genres), 0) AS genres_count,
+    coalesce(p.people_count, 0) AS people_count
+FROM movies_filmwork fw
+LEFT JOIN (
+    SELECT fg.filmwork_id, array_agg(g.genre ORDER BY g.genre) AS genres
+    FROM movies_filmwork_genres fg
+    JOIN movies_genre g ON g.id = fg.genre_id
+    GROUP BY fg.filmwork_id
+) g ON g.filmwork_id = fw.id
+LEFT JOIN (
+    SELECT
+        c.film_work_id,
+        array_agg(p.first_name || ' ' || p.last_name ORDER BY p.last_name, p.first_name)
+            FILTER (WHERE r.role = 'actor') AS actors,
+        array_agg(p.first_name || ' ' || p.last_name ORDER BY p.last_name, p.first_name)
+            FILTER (WHERE r.role = 'director') AS directors,
+        array_agg(p.first_name || ' ' || p.last_name ORDER BY p.last_name, p.first_name)
+            FILTER (WHERE r.role = 'writer') AS writers,
+        count(DISTINCT c.person_id) AS people_count
+    FROM movies_cast c
+    JOIN movies_person p ON p.uuid = c.person_id
+    JOIN movies_role r ON r.id = c.role_id
+    GROUP BY c.film_work_id
+) p ON p.film_work_id = fw.id;
+
+-- Без уникального индекса REFRESH MATERIALIZED VIEW CONCURRENTLY невозможен
+CREATE UNIQUE INDEX movies_filmsummary_film_work_id_uniq ON movies_filmsummary (film_work_id);
+"""
+
+DROP_SQL = "DROP MATERIALIZED VIEW IF EXISTS movies_filmsummary;"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_SQL, DROP_SQL),
+        migrations.CreateModel(
+            name="FilmSummary",
+            fields=[
+                (
+                    "film_work",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="summary",
+                        serialize=False,
+                        to="movies.filmwork",
+                    ),
+                ),
+                ("uuid", models.UUIDField()),
+                ("title", models.CharField(max_length=255, verbose_name="название")),
+                (
+                    "type",
+                    models.CharField(
+                        choices=[("movie", "фильм"), ("tv_show", "шоу")], max_length=20, verbose_name="тип"
+                    ),
+                ),
+                ("creation_date", models.DateField(null=True, verbose_name="дата создания фильма")),
+                ("rating", models.FloatField(null=True, verbose_name="рейтинг")),
+                (
+                    "genres",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None, verbose_name="жанры"
+                    ),
+                ),
+                (
+                    "actors",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None, verbose_name="актёры"
+                    ),
+                ),
+                (
+                    "directors",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None, verbose_name="режиссёры"
+                    ),
+                ),
+                (
+                    "writers",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.TextField(), size=None, verbose_name="сценаристы"
+                    ),
+                ),
+                ("genres_count", models.IntegerField(verbose_name="количество жанров")),
+                ("people_count", models.IntegerField(verbose_name="количество людей")),
+            ],
+            options={
+                "verbose_name": "сводка по фильму",
+                "verbose_name_plural": "сводки по фильмам",
+                "db_table": "movies_filmsummary",
+                "managed": False,
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Название весит больше описания. Каждое поле разбирается и русским, и английским словарём:
+# язык фильма не хранится, а запрос тоже ищется на обоих языках
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('russian', coalesce({row}.title, '')), 'A')
+    || setweight(to_tsvector('english', coalesce({row}.title, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce({row}.description, '')), 'B')
+    || setweight(to_tsvector('english', coalesce({row}.description, '')), 'B')
+"""
+
+CREATE_TRIGGER_SQL = f"""
+CREATE FUNCTION movies_filmwork_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR_SQL.format(row="NEW")};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER movies_filmwork_search_vector
+    BEFORE INSERT OR UPDATE OF title, description ON movies_filmwork
+    FOR EACH ROW EXECUTE PROCEDURE movies_filmwork_search_vector_update();
+
+UPDATE movies_filmwork SET search_vector = {SEARCH_VECTOR_SQL.format(row="movies_filmwork")};
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS movies_filmwork_search_vector ON movies_filmwork;
+DROP FUNCTION IF EXISTS movies_filmwork_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0002_filmsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="filmwork",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER_SQL, DROP_TRIGGER_SQL),
+        migrations.AddIndex(
+            model_name="filmwork",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["search_vector"], name="movies_filmwork_search_idx"),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Выражения совпадают с movies.search.SearchName, иначе индекс не будет использоваться
+CREATE_INDEXES_SQL = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movies_person_name_trgm_idx
+    ON movies_person USING gin (lower(first_name || ' ' || last_name) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movies_genre_genre_trgm_idx
+    ON movies_genre USING gin (lower(genre) gin_trgm_ops)
+    """,
+]
+
+DROP_INDEXES_SQL = [
+    "DROP INDEX CONCURRENTLY IF EXISTS movies_person_name_trgm_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS movies_genre_genre_trgm_idx",
+]
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но не работает в транзакции
+    atomic = False
+
+    dependencies = [
+        ("movies", "0003_filmwork_search_vector"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunSQL(CREATE_INDEXES_SQL, DROP_INDEXES_SQL),
+    ]
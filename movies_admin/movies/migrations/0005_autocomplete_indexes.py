@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Ключи страниц автодополнения movies.autocomplete: (search_name, pk).
+# Поиск людей по подстроке идёт по movies_person_name_trgm_idx из 0004
+CREATE_INDEXES_SQL = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movies_filmwork_title_key_idx
+    ON movies_filmwork (lower(title), id)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movies_filmwork_title_trgm_idx
+    ON movies_filmwork USING gin (lower(title) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS movies_person_name_key_idx
+    ON movies_person (lower(first_name || ' ' || last_name), uuid)
+    """,
+]
+
+DROP_INDEXES_SQL = [
+    "DROP INDEX CONCURRENTLY IF EXISTS movies_filmwork_title_key_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS movies_filmwork_title_trgm_idx",
+    "DROP INDEX CONCURRENTLY IF EXISTS movies_person_name_key_idx",
+]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("movies", "0004_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEXES_SQL, DROP_INDEXES_SQL),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+# Начальные счётчики, дальше их поддерживают сигналы movies.signals.
+# Значения считаются так же, как в movies.facets.film_facets
+FILL_SQL = """
+INSERT INTO movies_filmfacet (facet, value, count)
+SELECT 'genre', genre_id::text, count(*) FROM movies_filmwork_genres GROUP BY genre_id
+UNION ALL
+SELECT 'type', type, count(*) FROM movies_filmwork GROUP BY type
+UNION ALL
+SELECT 'rating', least(floor(rating), 9)::int::text, count(*)
+FROM movies_filmwork WHERE rating IS NOT NULL GROUP BY 1, 2
+UNION ALL
+SELECT 'year', extract(year FROM creation_date)::int::text, count(*)
+FROM movies_filmwork WHERE creation_date IS NOT NULL GROUP BY 1, 2;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0005_autocomplete_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FilmFacet",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "facet",
+                    models.CharField(
+                        choices=[("genre", "жанр"), ("type", "тип"), ("rating", "рейтинг"), ("year", "год")],
+                        max_length=20,
+                        verbose_name="фасет",
+                    ),
+                ),
+                ("value", models.CharField(max_length=45, verbose_name="значение")),
+                ("count", models.IntegerField(default=0, verbose_name="количество фильмов")),
+            ],
+            options={
+                "verbose_name": "фасет фильмов",
+                "verbose_name_plural": "фасеты фильмов",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="filmfacet",
+            constraint=models.UniqueConstraint(fields=("facet", "value"), name="movies_filmfacet_facet_value_uniq"),
+        ),
+        migrations.RunSQL(FILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -1,5 +1,8 @@
 import uuid
 
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -57,10 +60,14 @@ class FilmWork(TimeStampedModel):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     genres = models.ManyToManyField(Genre, related_name="film_works")
     people = models.ManyToManyField(Person, related_name="film_works", through="Cast")
+    # Заполняется триггером movies_filmwork_search_vector из title и description
+    # на русском и английском, см. миграцию 0003
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = _("кинопроизведение")
         verbose_name_plural = _("кинопроизведения")
+        indexes = [GinIndex(fields=["search_vector"], name="movies_filmwork_search_idx")]
 
     def __str__(self):
         return self.title
@@ -70,3 +77,60 @@ class Cast(models.Model):
     person = models.ForeignKey(Person, on_delete=models.CASCADE)
     film_work = models.ForeignKey(FilmWork, on_delete=models.CASCADE)
     role = models.ForeignKey(Role, on_delete=models.CASCADE)
+
+
+class FilmSummary(models.Model):
+    """
+    Материализованное представление movies_filmsummary: одна строка на фильм
+    с жанрами и составом по ролям, чтобы списки фильмов читались без соединений.
+    Создаётся миграцией и обновляется через movies.summary.refresh_film_summary.
+    """
+
+    film_work = models.OneToOneField(FilmWork, on_delete=models.DO_NOTHING, primary_key=True, related_name="summary")
+    uuid = models.UUIDField()
+    title = models.CharField(_("название"), max_length=255)
+    type = models.CharField(_("тип"), max_length=20, choices=FilmWork.MovieType.choices)
+    creation_date = models.DateField(_("дата создания фильма"), null=True)
+    rating = models.FloatField(_("рейтинг"), null=True)
+    genres = ArrayField(models.TextField(), verbose_name=_("жанры"))
+    actors = ArrayField(models.TextField(), verbose_name=_("актёры"))
+    directors = ArrayField(models.TextField(), verbose_name=_("режиссёры"))
+    writers = ArrayField(models.TextField(), verbose_name=_("сценаристы"))
+    genres_count = models.IntegerField(_("количество жанров"))
+    people_count = models.IntegerField(_("количество людей"))
+
+    class Meta:
+        managed = False
+        db_table = "movies_filmsummary"
+        verbose_name = _("сводка по фильму")
+        verbose_name_plural = _("сводки по фильмам")
+
+    def __str__(self):
+        return self.title
+
+
+class FilmFacet(models.Model):
+    """
+    Количество фильмов с данным значением фасета: жанром, типом, корзиной рейтинга или годом.
+    Из этой таблицы рисуются фильтры списка фильмов, вместо SELECT DISTINCT по movies_filmwork.
+    Поддерживается сигналами из movies.signals, целиком пересчитывается movies.facets.rebuild_film_facets.
+    """
+
+    class Facet(models.TextChoices):
+        GENRE = "genre", _("жанр")
+        TYPE = "type", _("тип")
+        RATING = "rating", _("рейтинг")
+        YEAR = "year", _("год")
+
+    facet = models.CharField(_("фасет"), max_length=20, choices=Facet.choices)
+    # Для жанра — id жанра, чтобы переименование не требовало пересчёта
+    value = models.CharField(_("значение"), max_length=45)
+    count = models.IntegerField(_("количество фильмов"), default=0)
+
+    class Meta:
+        verbose_name = _("фасет фильмов")
+        verbose_name_plural = _("фасеты фильмов")
+        constraints = [models.UniqueConstraint(fields=["facet", "value"], name="movies_filmfacet_facet_value_uniq")]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}: {self.count}"
@@ -0,0 +1,35 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import F, Func, Q, QuerySet, TextField
+
+
+class SearchName(Func):
+    """
+    lower(first_name || ' ' || last_name): то же выражение, по которому построены
+    триграммные индексы в миграции 0004, поэтому планировщик использует их.
+    CONCAT() для этого не подходит: функция не IMMUTABLE и не бывает в индексе.
+    """
+
+    template = "lower(%(expressions)s)"
+    arg_joiner = " || ' ' || "
+    output_field = TextField()
+
+
+def normalize_term(term: str) -> str:
+    return " ".join(term.split()).lower()
+
+
+def trigram_search(queryset: QuerySet, search_term: str, *fields: str) -> QuerySet:
+    """
+    Нечёткий поиск по pg_trgm: строка находится, если похожа на запрос (оператор %,
+    выдерживает опечатки) или содержит его целиком (LIKE '%...%').
+    Оба условия идут по одному GIN-индексу gin_trgm_ops, результаты упорядочены по сходству.
+    """
+    term = normalize_term(search_term)
+    if not term:
+        return queryset
+    return (
+        queryset.annotate(search_name=SearchName(*(F(field) for field in fields)))
+        .filter(Q(search_name__trigram_similar=term) | Q(search_name__contains=term))
+        .annotate(similarity=TrigramSimilarity("search_name", term))
+        .order_by("-similarity")
+    )
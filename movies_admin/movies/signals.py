@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from movies.facets import apply_facet_changes, film_facets, genre_facets
+from movies.models import Cast, FilmFacet, FilmWork, Genre, Person, Role
+from movies.summary import schedule_film_summary_refresh
+
+# Модели, из которых собирается movies_filmsummary
+SUMMARY_SOURCES = (FilmWork, Genre, Person, Role, Cast)
+
+
+def refresh_summary_on_change(sender, **kwargs):
+    if settings.FILM_SUMMARY_REFRESH_ON_CHANGE:
+        schedule_film_summary_refresh()
+
+
+def refresh_summary_on_genres_change(sender, action, **kwargs):
+    if action.startswith("post_"):
+        refresh_summary_on_change(sender)
+
+
+for model in SUMMARY_SOURCES:
+    post_save.connect(refresh_summary_on_change, sender=model, dispatch_uid=f"film_summary_save_{model.__name__}")
+    post_delete.connect(refresh_summary_on_change, sender=model, dispatch_uid=f"film_summary_delete_{model.__name__}")
+m2m_changed.connect(
+    refresh_summary_on_genres_change, sender=FilmWork.genres.through, dispatch_uid="film_summary_genres"
+)
+
+
+# Счётчики movies_filmfacet меняются в той же транзакции, что и фильмы.
+# Изменения в обход сигналов (QuerySet.update, bulk_create, ETL) требуют manage.py rebuild_film_facets
+
+
+def remember_film_facets(sender, instance, raw=False, **kwargs):
+    # Старые значения полей читаются до сохранения, чтобы вычесть их из счётчиков
+    instance._old_facets = []
+    if not raw and not instance._state.adding:
+        old = sender.objects.only("type", "rating", "creation_date").filter(pk=instance.pk).first()
+        instance._old_facets = film_facets(old) if old else []
+
+
+def update_film_facets(sender, instance, raw=False, **kwargs):
+    if not raw:
+        apply_facet_changes(film_facets(instance), instance._old_facets)
+
+
+def remove_film_facets(sender, instance, **kwargs):
+    # Связи с жанрами удаляются каскадом без m2m_changed, поэтому жанры вычитаются здесь
+    genre_ids = FilmWork.genres.through.objects.filter(filmwork_id=instance.pk).values_list("genre_id", flat=True)
+    apply_facet_changes(removed=film_facets(instance) + genre_facets(genre_ids))
+
+
+def update_genre_facets(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "post_add":
+        # Для add в pk_set только действительно добавленные связи
+        apply_facet_changes(added=genre_facets([instance.pk] * len(pk_set) if reverse else pk_set))
+    elif action in ("pre_remove", "pre_clear"):
+        # remove передаёт в pk_set все переданные объекты, в том числе не связанные, поэтому связи читаются из базы
+        links = sender.objects.filter(**{"genre_id" if reverse else "filmwork_id": instance.pk})
+        if action == "pre_remove":
+            links = links.filter(**{"filmwork_id__in" if reverse else "genre_id__in": pk_set})
+        apply_facet_changes(removed=genre_facets(links.values_list("genre_id", flat=True)))
+
+
+def remove_genre_facet(sender, instance, **kwargs):
+    FilmFacet.objects.filter(facet=FilmFacet.Facet.GENRE, value=str(instance.pk)).delete()
+
+
+pre_save.connect(remember_film_facets, sender=FilmWork, dispatch_uid="film_facets_pre_save")
+post_save.connect(update_film_facets, sender=FilmWork, dispatch_uid="film_facets_save")
+pre_delete.connect(remove_film_facets, sender=FilmWork, dispatch_uid="film_facets_delete")
+m2m_changed.connect(update_genre_facets, sender=FilmWork.genres.through, dispatch_uid="film_facets_genres")
+post_delete.connect(remove_genre_facet, sender=Genre, dispatch_uid="film_facets_genre_delete")
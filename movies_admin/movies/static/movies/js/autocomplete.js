@@ -0,0 +1,35 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    $.fn.moviesAutocomplete = function() {
+        $.each(this, function(i, element) {
+            // Select2 передаёт только номер страницы, курсор следующей хранится здесь
+            let next = null;
+            $(element).select2({
+                ajax: {
+                    data: (params) => {
+                        return {
+                            term: params.term,
+                            after: params.page > 1 ? next : undefined
+                        };
+                    },
+                    processResults: (data) => {
+                        next = data.next;
+                        return {results: data.results, pagination: {more: data.next !== null}};
+                    }
+                }
+            });
+        });
+        return this;
+    };
+
+    $(function() {
+        // Виджет в шаблоне новой строки набора форм инициализируется при её добавлении
+        $('.movies-autocomplete').not('[name*=__prefix__]').moviesAutocomplete();
+    });
+
+    $(document).on('formset:added', function(event, $row) {
+        $row.find('.movies-autocomplete').moviesAutocomplete();
+    });
+}
@@ -0,0 +1,45 @@
+import logging
+import threading
+
+from django.db import DatabaseError, connection, transaction
+from movies.models import FilmSummary
+
+logger = logging.getLogger(__name__)
+
+# Изменения, которые ещё не попали в пересчёт после коммита, в текущем потоке
+_pending = threading.local()
+
+
+def refresh_film_summary(concurrently: bool = True):
+    """
+    Пересчитывает movies_filmsummary.
+    CONCURRENTLY не блокирует чтение представления на время пересчёта,
+    но требует уже заполненного представления и уникального индекса.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{FilmSummary._meta.db_table}"
+        )
+
+
+def _refresh_after_commit():
+    # Колбэков после одного коммита может быть несколько, пересчитывает только первый
+    if not getattr(_pending, "changed", False):
+        return
+    _pending.changed = False
+    try:
+        refresh_film_summary()
+    except DatabaseError:
+        # Данные уже закоммичены: ошибка пересчёта не должна превращать сохранение в 500
+        logger.exception("film summary refresh failed, run manage.py refresh_film_summary")
+
+
+def schedule_film_summary_refresh():
+    """
+    Пересчёт после коммита текущей транзакции. Сколько бы фильмов, жанров и людей
+    ни изменилось в одной транзакции, пересчёт будет один.
+    Пересчитывается всё представление, поэтому на большом каталоге каждое сохранение
+    ждёт его целиком: там лучше запускать manage.py refresh_film_summary по расписанию.
+    """
+    _pending.changed = True
+    transaction.on_commit(_refresh_after_commit)
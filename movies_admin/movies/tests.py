@@ -0,0 +1,484 @@
+import datetime
+import io
+import json
+from unittest import mock
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from members.models import Membership, User
+from movies.admin import GenreAdmin, MovieAdmin, PersonAdmin
+from movies.autocomplete import SOURCES, InvalidCursor, autocomplete_page
+from movies.changelist import estimate_count
+from movies.facets import rebuild_film_facets
+from movies.models import Cast, FilmFacet, FilmSummary, FilmWork, Genre, Person, Role
+from movies.search import trigram_search
+
+GENRES = 23
+# Страница не делит GENRES нацело, чтобы последняя страница была неполной
+PER_PAGE = 5
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            "editor", "editor@example.com", "password", is_staff=True, is_superuser=True
+        )
+        Membership.objects.create(user=self.user, role=Membership.Roles.MOVIES_ADMIN)
+        self.client.force_login(self.user)
+
+
+class KeysetChangeListTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        # Без ordering админка сортирует по -pk: новые жанры первыми
+        self.genres = [Genre.objects.create(genre=f"genre {number:02d}") for number in range(GENRES)][::-1]
+        for patcher in (
+            mock.patch.object(GenreAdmin, "list_per_page", PER_PAGE),
+            # Оценка планировщика зависит от статистики таблицы, здесь важна только навигация
+            mock.patch("movies.changelist.estimate_count", return_value=GENRES),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def changelist(self, query: str = ""):
+        response = self.client.get(reverse("admin:movies_genre_changelist") + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_pages_forward_and_back(self):
+        changelist = self.changelist()
+        self.assertTrue(changelist.keyset)
+        self.assertIsNone(changelist.previous_url)
+        pages = [list(changelist.result_list)]
+        while changelist.next_url:
+            changelist = self.changelist(changelist.next_url)
+            pages.append(list(changelist.result_list))
+        self.assertEqual([genre for page in pages for genre in page], self.genres)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+
+        back = []
+        while changelist.previous_url:
+            changelist = self.changelist(changelist.previous_url)
+            back.insert(0, list(changelist.result_list))
+        self.assertEqual(back, pages[:-1])
+
+    def test_before_start_returns_first_page(self):
+        changelist = self.changelist(f"?before={self.genres[2].pk}")
+        self.assertEqual(list(changelist.result_list), self.genres[:PER_PAGE])
+        self.assertIsNone(changelist.previous_url)
+        self.assertEqual(changelist.next_url, f"?after={self.genres[PER_PAGE - 1].pk}")
+
+    def test_filters_restart_from_first_page(self):
+        changelist = self.changelist(f"?after={self.genres[PER_PAGE - 1].pk}")
+        self.assertNotIn("after=", changelist.get_query_string({"q": "genre"}))
+        self.assertNotIn("after=", changelist.exact_count_url)
+
+    def test_other_ordering_uses_page_numbers(self):
+        changelist = self.changelist("?o=1")
+        self.assertFalse(changelist.keyset)
+        self.assertEqual(list(changelist.result_list), sorted(self.genres, key=str)[:PER_PAGE])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("admin:movies_genre_changelist") + "?after=abc")
+        self.assertRedirects(response, reverse("admin:movies_genre_changelist") + "?e=1", fetch_redirect_response=False)
+
+
+class EstimatedCountTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        Genre.objects.bulk_create(Genre(genre=f"genre {number:02d}") for number in range(GENRES))
+
+    def test_estimate_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Genre._meta.db_table}")
+        self.assertEqual(estimate_count(Genre.objects.all()), GENRES)
+        self.assertEqual(estimate_count(Genre.objects.filter(genre="genre 01")), 1)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=1_000)
+    def test_large_result_uses_estimate(self):
+        url = reverse("admin:movies_genre_changelist")
+        with mock.patch("movies.changelist.estimate_count", return_value=50_000):
+            changelist = self.client.get(url).context["cl"]
+            self.assertTrue(changelist.paginator.estimated)
+            self.assertEqual(changelist.result_count, 50_000)
+
+            changelist = self.client.get(url + "?exact=1").context["cl"]
+            self.assertFalse(changelist.paginator.estimated)
+            self.assertEqual(changelist.result_count, GENRES)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=1_000)
+    def test_small_result_is_counted(self):
+        with mock.patch("movies.changelist.estimate_count", return_value=40):
+            changelist = self.client.get(reverse("admin:movies_genre_changelist")).context["cl"]
+        self.assertFalse(changelist.paginator.estimated)
+        self.assertEqual(changelist.result_count, GENRES)
+
+
+class FilmFacetTest(TestCase):
+    def setUp(self):
+        self.drama, self.comedy, self.war = (Genre.objects.create(genre=name) for name in ("Drama", "Comedy", "War"))
+        self.movie = FilmWork.objects.create(
+            title="Movie", type=FilmWork.MovieType.MOVIE, rating=7.5, creation_date=datetime.date(2001, 1, 1)
+        )
+        self.show = FilmWork.objects.create(
+            title="Show", type=FilmWork.MovieType.TV_SHOW, rating=10, creation_date=datetime.date(2001, 5, 1)
+        )
+
+    def counts(self) -> dict:
+        return {(facet.facet, facet.value): facet.count for facet in FilmFacet.objects.all() if facet.count}
+
+    def genre(self, genre: Genre) -> tuple:
+        return FilmFacet.Facet.GENRE, str(genre.pk)
+
+    def assertMatchesRebuild(self):
+        counts = self.counts()
+        rebuild_film_facets()
+        self.assertEqual(counts, self.counts())
+
+    def test_create(self):
+        self.assertEqual(
+            self.counts(),
+            {
+                ("type", "movie"): 1,
+                ("type", "tv_show"): 1,
+                ("rating", "7"): 1,
+                # Рейтинг 10 попадает в последнюю корзину
+                ("rating", "9"): 1,
+                ("year", "2001"): 2,
+            },
+        )
+        self.assertMatchesRebuild()
+
+    def test_edit(self):
+        self.movie.rating = 3.2
+        self.movie.creation_date = datetime.date(1999, 1, 1)
+        self.movie.save()
+        self.show.title = "Renamed"
+        self.show.save()
+        counts = self.counts()
+        self.assertEqual(counts[("rating", "3")], 1)
+        self.assertNotIn(("rating", "7"), counts)
+        self.assertEqual(counts[("year", "1999")], 1)
+        self.assertEqual(counts[("year", "2001")], 1)
+        self.assertEqual(counts[("type", "tv_show")], 1)
+        self.assertMatchesRebuild()
+
+    def test_string_values(self):
+        # Django принимает строки в числовых полях и полях дат и сам приводит их при сохранении
+        film = FilmWork.objects.create(
+            title="Strings", type=FilmWork.MovieType.MOVIE, rating="8.5", creation_date="1999-03-31"
+        )
+        counts = self.counts()
+        self.assertEqual(counts[("rating", "8")], 1)
+        self.assertEqual(counts[("year", "1999")], 1)
+
+        film.rating, film.creation_date = "2", "2001-12-31"
+        film.save()
+        counts = self.counts()
+        self.assertEqual(counts[("rating", "2")], 1)
+        self.assertNotIn(("rating", "8"), counts)
+        self.assertNotIn(("year", "1999"), counts)
+        self.assertEqual(counts[("year", "2001")], 3)
+        self.assertMatchesRebuild()
+
+    def test_genres_add_remove_clear(self):
+        self.movie.genres.add(self.drama, self.comedy)
+        # Повторное добавление уже связанного жанра не меняет счётчик
+        self.movie.genres.add(self.drama)
+        self.war.film_works.add(self.movie, self.show)
+        self.assertEqual(self.counts()[self.genre(self.drama)], 1)
+        self.assertEqual(self.counts()[self.genre(self.war)], 2)
+
+        # Несвязанный жанр в remove не вычитается
+        self.show.genres.remove(self.comedy, self.war)
+        self.assertEqual(self.counts()[self.genre(self.comedy)], 1)
+        self.assertEqual(self.counts()[self.genre(self.war)], 1)
+
+        self.movie.genres.clear()
+        counts = self.counts()
+        for genre in (self.drama, self.comedy, self.war):
+            self.assertNotIn(self.genre(genre), counts)
+
+        self.drama.film_works.set([self.movie, self.show])
+        self.drama.film_works.set([self.show])
+        self.assertEqual(self.counts()[self.genre(self.drama)], 1)
+        self.assertMatchesRebuild()
+
+    def test_delete(self):
+        self.movie.genres.add(self.drama, self.war)
+        self.show.genres.add(self.drama)
+        self.movie.delete()
+        self.assertEqual(
+            self.counts(),
+            {("type", "tv_show"): 1, ("rating", "9"): 1, ("year", "2001"): 1, self.genre(self.drama): 1},
+        )
+        self.drama.delete()
+        self.assertNotIn(self.genre(self.drama), self.counts())
+        self.assertMatchesRebuild()
+
+
+class FacetFilterTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        # Фильтр без вариантов в movies_filmfacet админка не показывает и не применяет
+        movie = FilmWork.objects.create(
+            title="Movie", type=FilmWork.MovieType.MOVIE, rating=7.5, creation_date=datetime.date(2001, 1, 1)
+        )
+        movie.genres.add(Genre.objects.create(genre="Drama"))
+
+    def test_invalid_values(self):
+        url = reverse("admin:movies_filmwork_changelist")
+        for query in ("genre=abc", "genre=0", "rating_bucket=x", "rating_bucket=10", "year=x", "year=100000"):
+            with self.subTest(query=query):
+                response = self.client.get(f"{url}?{query}")
+                self.assertRedirects(response, f"{url}?e=1", fetch_redirect_response=False)
+
+
+class AutocompleteTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        names = [("Mark", "Hamill"), ("Harrison", "Ford"), ("Carrie", "Fisher"), ("Peter", "Cushing")]
+        # Одинаковые имена: порядок между ними задаёт pk
+        names += [("George", "Lucas")] * 3
+        self.people = [Person.objects.create(first_name=first, last_name=last) for first, last in names]
+        patcher = mock.patch("movies.autocomplete.PAGE_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pages(self, term: str = "") -> list:
+        pages, after = [], None
+        while True:
+            page = autocomplete_page(SOURCES["person"], term, after)
+            pages.append([row["id"] for row in page["results"]])
+            after = page["next"]
+            if after is None:
+                return pages
+
+    def test_pages_by_name_and_pk(self):
+        expected = sorted(self.people, key=lambda person: (str(person).lower(), person.pk))
+        pages = self.pages()
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual([pk for page in pages for pk in page], [str(person.pk) for person in expected])
+
+    def test_term(self):
+        lucas = sorted(str(person.pk) for person in self.people[4:])
+        self.assertEqual(sorted(pk for page in self.pages("  george   LUCAS ") for pk in page), lucas)
+        self.assertEqual(self.pages("nobody"), [[]])
+
+    def test_cursor(self):
+        page = autocomplete_page(SOURCES["person"])
+        name, pk = json.loads(page["next"])
+        # Страница кончается на первом из одинаковых имён: следующая продолжает их по pk
+        self.assertEqual(name, "george lucas")
+        self.assertEqual(pk, page["results"][-1]["id"])
+        for cursor in ("not json", "[1, 2]", '["name"]', '{"name": "pk"}', '["a", "zz"]'):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                autocomplete_page(SOURCES["person"], after=cursor)
+        # У фильмов и ролей целочисленный pk
+        for source in ("filmwork", "role"):
+            with self.subTest(source=source), self.assertRaises(InvalidCursor):
+                autocomplete_page(SOURCES[source], after='["a", "zz"]')
+
+    def test_view(self):
+        url = reverse("movies-autocomplete", args=["person"])
+        response = self.client.get(url, {"term": "ford"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(), {"results": [{"id": str(self.people[1].pk), "text": "Harrison Ford"}], "next": None}
+        )
+        self.assertIn("max-age", response["Cache-Control"])
+        self.assertEqual(self.client.get(url, {"after": "[1, 2]"}).status_code, 400)
+        for source in ("person", "filmwork", "role"):
+            response = self.client.get(reverse("movies-autocomplete", args=[source]), {"after": '["a", "zz"]'})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse("movies-autocomplete", args=["genre_x"])).status_code, 404)
+
+
+class MovieSearchTest(TestCase):
+    def setUp(self):
+        self.admin = MovieAdmin(FilmWork, admin.site)
+
+    def create_film(self, title: str, description: str = "") -> FilmWork:
+        return FilmWork.objects.create(
+            title=title,
+            description=description,
+            type=FilmWork.MovieType.MOVIE,
+            rating=5,
+            creation_date=datetime.date(2001, 1, 1),
+        )
+
+    def search(self, term: str) -> list:
+        queryset, may_have_duplicates = self.admin.get_search_results(None, FilmWork.objects.all(), term)
+        self.assertFalse(may_have_duplicates)
+        return list(queryset)
+
+    def test_pk(self):
+        film = self.create_film("Solaris")
+        # Число из названия другого фильма нашлось бы и полнотекстовым поиском
+        self.create_film(f"Apollo {film.pk}")
+        self.assertEqual(self.search(f" {film.pk} "), [film])
+
+    def test_number_not_a_pk(self):
+        # Число, которое не совпало с pk, ищется полнотекстовым поиском
+        film = self.create_film("Apollo 1000000")
+        self.assertEqual(self.search("1000000"), [film])
+        # "²" — цифра для str.isdigit(), но не для int(); 2**63 не помещается в bigint
+        for term in ("²", str(2 ** 63), str(10 ** 30)):
+            with self.subTest(term=term):
+                self.assertEqual(self.search(term), [])
+
+    def test_uuid(self):
+        film = self.create_film("Solaris")
+        self.create_film(str(film.uuid))
+        self.assertEqual(self.search(str(film.uuid)), [film])
+        self.assertEqual(self.search(str(film.uuid).upper()), [film])
+
+    def test_trigger(self):
+        film = self.create_film("Солярис", "Психолог прилетает на станцию над океаном")
+        film.refresh_from_db()
+        self.assertIsNotNone(film.search_vector)
+        # Русский словарь приводит слова к основе: "океане" находит "океаном"
+        self.assertEqual(self.search("океане"), [film])
+
+        film.title = "Solaris"
+        film.save()
+        self.assertEqual(self.search("solaris"), [film])
+        self.assertEqual(self.search("солярис"), [])
+
+        FilmWork.objects.filter(pk=film.pk).update(description="A psychologist arrives at the station")
+        self.assertEqual(self.search("psychologists"), [film])
+        self.assertEqual(self.search("океане"), [])
+
+    def test_rank(self):
+        in_description = self.create_film("Stalker", "A guide leads two men through the Zone")
+        in_title = self.create_film("The Zone", "Documentary")
+        self.create_film("Mirror")
+        # Название весит больше описания, хотя фильм с совпадением в описании создан раньше
+        self.assertEqual(self.search("zone"), [in_title, in_description])
+        self.assertEqual(self.search("zone -documentary"), [in_description])
+
+
+@override_settings(FILM_SUMMARY_REFRESH_ON_CHANGE=False)
+class FilmSummaryTest(TestCase):
+    def setUp(self):
+        self.film = FilmWork.objects.create(
+            title="Movie", type=FilmWork.MovieType.MOVIE, rating=7.5, creation_date=datetime.date(2001, 1, 1)
+        )
+        self.drama, self.war = (Genre.objects.create(genre=name) for name in ("Drama", "War"))
+        self.actor, self.director = (Role.objects.create(role=role) for role in Role.RoleType.values[:2])
+        self.hamill, self.ford, self.lucas = (
+            Person.objects.create(first_name=first, last_name=last)
+            for first, last in (("Mark", "Hamill"), ("Harrison", "Ford"), ("George", "Lucas"))
+        )
+
+    def summary(self, *args) -> FilmSummary:
+        call_command("refresh_film_summary", *args, stdout=io.StringIO())
+        return FilmSummary.objects.get(film_work=self.film)
+
+    def test_refresh(self):
+        self.film.genres.add(self.war, self.drama)
+        for person, role in ((self.hamill, self.actor), (self.ford, self.actor), (self.ford, self.director)):
+            Cast.objects.create(film_work=self.film, person=person, role=role)
+
+        summary = self.summary()
+        self.assertEqual(summary.genres, ["Drama", "War"])
+        self.assertEqual(summary.actors, ["Harrison Ford", "Mark Hamill"])
+        self.assertEqual(summary.directors, ["Harrison Ford"])
+        self.assertEqual(summary.writers, [])
+        self.assertEqual(summary.genres_count, 2)
+        # Человек в двух ролях считается один раз
+        self.assertEqual(summary.people_count, 2)
+
+        self.film.genres.remove(self.war)
+        summary = self.summary("--blocking")
+        self.assertEqual(summary.genres, ["Drama"])
+        self.assertEqual(summary.genres_count, 1)
+
+    @override_settings(FILM_SUMMARY_REFRESH_ON_CHANGE=True)
+    def test_refresh_on_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.film.genres.add(self.drama)
+            Cast.objects.create(film_work=self.film, person=self.lucas, role=self.director)
+        summary = FilmSummary.objects.get(film_work=self.film)
+        self.assertEqual(summary.genres, ["Drama"])
+        self.assertEqual(summary.directors, ["George Lucas"])
+
+        cast = Cast.objects.get(film_work=self.film)
+        changes = {
+            "genres": lambda: self.film.genres.set([self.war]),
+            "cast": lambda: Cast.objects.create(film_work=self.film, person=self.ford, role=self.actor),
+            "person": self.lucas.save,
+            "cast delete": cast.delete,
+        }
+        patch_refresh = mock.patch("movies.summary.refresh_film_summary")
+        for name, change in changes.items():
+            with self.subTest(change=name):
+                with patch_refresh as refresh, self.captureOnCommitCallbacks(execute=True):
+                    change()
+                # Сколько бы строк ни изменилось в транзакции, пересчёт один
+                refresh.assert_called_once_with()
+
+    def test_no_refresh_when_off(self):
+        patch_refresh = mock.patch("movies.summary.refresh_film_summary")
+        with patch_refresh as refresh, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.film.genres.add(self.drama)
+            Cast.objects.create(film_work=self.film, person=self.lucas, role=self.director)
+        self.assertEqual(callbacks, [])
+        refresh.assert_not_called()
+        self.assertFalse(FilmSummary.objects.filter(film_work=self.film).exists())
+
+
+class TrigramSearchTest(AdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hanks, self.hardy, self.ryan = (
+            Person.objects.create(first_name=first, last_name=last)
+            for first, last in (("Tom", "Hanks"), ("Tom", "Hardy"), ("Meg", "Ryan"))
+        )
+        self.admin = PersonAdmin(Person, admin.site)
+
+    def search(self, term: str) -> list:
+        queryset, may_have_duplicates = self.admin.get_search_results(None, Person.objects.all(), term)
+        self.assertFalse(may_have_duplicates)
+        return list(queryset)
+
+    def test_typo(self):
+        self.assertEqual(self.search("Tom Hnks")[0], self.hanks)
+        self.assertNotIn(self.ryan, self.search("Tom Hnks"))
+
+    def test_substring(self):
+        # У "ank" с полным именем почти нет общих триграмм: находит только contains
+        self.assertEqual(self.search("ANK"), [self.hanks])
+        self.assertEqual(self.search("  meg   ryan "), [self.ryan])
+
+    def test_ordered_by_similarity(self):
+        self.assertEqual(self.search("tom hardy"), [self.hardy, self.hanks])
+        self.assertEqual(self.search("tom hanks"), [self.hanks, self.hardy])
+
+    def test_genre_admin(self):
+        drama = Genre.objects.create(genre="Drama")
+        Genre.objects.create(genre="Comedy")
+        url = reverse("admin:movies_genre_changelist")
+        for term in ("Dramma", "ram"):
+            with self.subTest(term=term):
+                response = self.client.get(url, {"q": term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(list(response.context["cl"].result_list), [drama])
+
+    def test_uses_trigram_index(self):
+        # Выражение SearchName должно совпадать с выражением индекса из миграции 0004
+        searches = (
+            (Person.objects.all(), ("first_name", "last_name"), "movies_person_name_trgm_idx"),
+            (Genre.objects.all(), ("genre",), "movies_genre_genre_trgm_idx"),
+        )
+        with connection.cursor() as cursor:
+            # На нескольких строках планировщик иначе всегда выбирает последовательное чтение
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for queryset, fields, index in searches:
+            with self.subTest(index=index):
+                self.assertIn(index, trigram_search(queryset, "tom hanks", *fields).explain())
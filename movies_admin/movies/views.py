@@ -0,0 +1,41 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET
+from members.utils import has_role_permission
+from movies.autocomplete import SOURCES, InvalidCursor, autocomplete_page
+
+
+@require_GET
+def autocomplete(request, source_name):
+    """
+    Варианты для виджетов movies.widgets: ?term=строка&after=курсор.
+    Страницы кешируются на AUTOCOMPLETE_CACHE_TIMEOUT секунд,
+    поэтому повторный набор того же запроса не доходит до базы.
+    """
+    source = SOURCES.get(source_name)
+    if source is None:
+        raise Http404(f"unknown autocomplete source {source_name!r}")
+    if not has_role_permission(request.user, "movies", "view"):
+        raise PermissionDenied
+
+    term = request.GET.get("term", "")
+    after = request.GET.get("after") or None
+    # Ключ хешируется: строка запроса может быть длинной и содержать пробелы
+    digest = hashlib.sha256(f"{term}\n{after or ''}".encode()).hexdigest()
+    key = f"movies:autocomplete:{source_name}:{digest}"
+    page = cache.get(key)
+    if page is None:
+        try:
+            page = autocomplete_page(source, term, after)
+        except InvalidCursor as error:
+            return HttpResponseBadRequest(str(error))
+        cache.set(key, page, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    response = JsonResponse(page)
+    # Select2 отправляет запросы без параметра против кеша, так что их кеширует и браузер
+    patch_cache_control(response, private=True, max_age=settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    return response
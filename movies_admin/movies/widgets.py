@@ -0,0 +1,72 @@
+import json
+
+from django import forms
+from django.conf import settings
+from django.contrib.admin.widgets import SELECT2_TRANSLATIONS
+from django.urls import reverse
+from django.utils.translation import get_language
+
+
+class KeysetAutocompleteMixin:
+    """
+    Select2 с вариантами из movies.views.autocomplete вместо <option> на каждую строку таблицы.
+    В разметку попадают только выбранные значения, поэтому размер страницы
+    не зависит от количества фильмов и людей.
+    В отличие от admin.widgets.AutocompleteSelect страницы листаются курсором, а не номером.
+    """
+
+    def __init__(self, source_name: str, attrs=None, choices=()):
+        super().__init__(attrs, choices)
+        self.source_name = source_name
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs=extra_attrs)
+        attrs.setdefault("class", "")
+        attrs.update(
+            {
+                "data-ajax--cache": "true",
+                "data-ajax--delay": 250,
+                "data-ajax--type": "GET",
+                "data-ajax--url": reverse("movies-autocomplete", args=[self.source_name]),
+                "data-theme": "admin-autocomplete",
+                "data-allow-clear": json.dumps(not self.is_required),
+                "data-placeholder": "",
+                "class": attrs["class"] + (" " if attrs["class"] else "") + "movies-autocomplete",
+            }
+        )
+        return attrs
+
+    def optgroups(self, name, value, attrs=None):
+        default = (None, [], 0)
+        selected = {str(v) for v in value if str(v) not in self.choices.field.empty_values}
+        if not self.is_required and not self.allow_multiple_selected:
+            default[1].append(self.create_option(name, "", "", False, 0))
+        if selected:
+            for obj in self.choices.queryset.filter(pk__in=selected):
+                label = self.choices.field.label_from_instance(obj)
+                default[1].append(self.create_option(name, obj.pk, label, True, len(default[1])))
+        return [default]
+
+    @property
+    def media(self):
+        extra = "" if settings.DEBUG else ".min"
+        i18n_name = SELECT2_TRANSLATIONS.get(get_language())
+        i18n_file = (f"admin/js/vendor/select2/i18n/{i18n_name}.js",) if i18n_name else ()
+        return forms.Media(
+            js=(
+                f"admin/js/vendor/jquery/jquery{extra}.js",
+                f"admin/js/vendor/select2/select2.full{extra}.js",
+                *i18n_file,
+                "admin/js/jquery.init.js",
+                "movies/js/autocomplete.js",
+            ),
+            css={"screen": (f"admin/css/vendor/select2/select2{extra}.css", "admin/css/autocomplete.css")},
+        )
+
+
+class KeysetAutocompleteSelect(KeysetAutocompleteMixin, forms.Select):
+    pass
+
+
+class KeysetAutocompleteSelectMultiple(KeysetAutocompleteMixin, forms.SelectMultiple):
+    pass
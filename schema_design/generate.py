@@ -0,0 +1,278 @@
+"""
+Генератор синтетического каталога прямо в таблицы content.* Postgres.
+Схема должна быть создана заранее через schema_design.schema.
+
+    python -m schema_design.generate --films 2000000 --people 600000 --cast 5 --workers 8 --truncate
+
+Строки строятся кусками: колонка куска генерируется целиком, сериализуется
+в текстовый формат COPY и отправляется одной командой. Куски распределяются
+между процессами, у каждого своё соединение с Postgres, поэтому память
+не зависит от объёма данных, а 10 млн связей пишутся за минуты.
+
+У каждого куска свой генератор случайных чисел, заведённый от seed и номера куска,
+а id строк выводятся из номера строки. Поэтому одинаковые параметры дают
+одинаковые данные при любом количестве процессов.
+"""
+import argparse
+import io
+import logging
+import random
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+from psycopg2.extras import execute_values
+
+logging.basicConfig(format="[%(asctime)s: %(levelname)s] %(message)s", level=logging.INFO)
+
+FILMS_CHUNK = 10_000
+PEOPLE_CHUNK = 100_000
+
+GENRES = [
+    "Action",
+    "Adventure",
+    "Animation",
+    "Comedy",
+    "Crime",
+    "Documentary",
+    "Drama",
+    "Family",
+    "Fantasy",
+    "History",
+    "Horror",
+    "Music",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Thriller",
+    "War",
+    "Western",
+]
+FIRST_NAMES = ["Mark", "Harrison", "Carrie", "Peter", "Alec", "Anthony", "Kenny", "David", "Irvin", "George", "Leigh"]
+LAST_NAMES = ["Hamill", "Ford", "Fisher", "Cushing", "Guinness", "Daniels", "Baker", "Prowse", "Kershner", "Lucas"]
+WORDS = ["star", "wars", "empire", "return", "jedi", "galaxy", "force", "hope", "rebel", "dark", "light", "planet"]
+
+FIRST_DATE = date(1920, 1, 1).toordinal()
+DATES = 100 * 365
+
+TABLES = ("film_work", "person", "genre", "person_film_work", "genre_film_work")
+
+
+class Params(NamedTuple):
+    films: int
+    people: int
+    genres: int
+    # Среднее количество людей и жанров у фильма
+    cast: float
+    genres_per_film: float
+    seed: int
+
+
+class Result(NamedTuple):
+    table: str
+    rows: int
+
+
+def id_prefix(table: str, seed: int) -> str:
+    """
+    Первые 24 знака id строк таблицы. Последние 12 знаков — номер строки,
+    поэтому id строки вычисляется без генерации uuid и одинаков при каждом запуске с тем же seed.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"generate/{table}/{seed}"))[:24]
+
+
+def genre_names(total: int) -> List[str]:
+    return GENRES[:total] + [f"Genre {number}" for number in range(len(GENRES), total)]
+
+
+def _most(mean: float, limit: int) -> int:
+    """Наибольшее количество связей у фильма при среднем mean"""
+    return max(1, min(limit, round(2 * mean) - 1))
+
+
+def _counts(rnd: random.Random, mean: float, total: int, limit: int) -> List[int]:
+    """Количество связей у каждого из total фильмов: равномерно от 1 до _most(mean, limit)"""
+    return rnd.choices(range(1, _most(mean, limit) + 1), k=total)
+
+
+def people_chunk(params: Params, chunk: int) -> str:
+    """Строки content.person куска в формате COPY"""
+    rnd = random.Random(f"{params.seed}/person/{chunk}")
+    first = chunk * PEOPLE_CHUNK
+    numbers = range(first, min(params.people, first + PEOPLE_CHUNK))
+    prefix = id_prefix("person", params.seed)
+    first_names = rnd.choices(FIRST_NAMES, k=len(numbers))
+    last_names = rnd.choices(LAST_NAMES, k=len(numbers))
+    return "".join(
+        f"{prefix}{number:012x}\t{first_name} {last_name} {number}\n"
+        for number, first_name, last_name in zip(numbers, first_names, last_names)
+    )
+
+
+def films_chunk(params: Params, chunk: int) -> Tuple[str, str, str]:
+    """Строки content.film_work, person_film_work и genre_film_work куска в формате COPY"""
+    rnd = random.Random(f"{params.seed}/film_work/{chunk}")
+    first = chunk * FILMS_CHUNK
+    numbers = range(first, min(params.films, first + FILMS_CHUNK))
+    film_prefix = id_prefix("film_work", params.seed)
+    person_prefix = id_prefix("person", params.seed)
+    film_ids = [f"{film_prefix}{number:012x}" for number in numbers]
+
+    title_words = _counts(rnd, 3, len(numbers), 5)
+    titles = [" ".join(rnd.choices(WORDS, k=count)).title() for count in title_words]
+    ratings = [f"{rnd.uniform(1, 10):.1f}" for _ in numbers]
+    dates = [date.fromordinal(FIRST_DATE + day).isoformat() for day in rnd.choices(range(DATES), k=len(numbers))]
+    films = "".join(
+        f"{film_id}\t{title}\t{rating}\t{creation_date}\tmovie\n"
+        for film_id, title, rating, creation_date in zip(film_ids, titles, ratings, dates)
+    )
+
+    # Номер связи — номер фильма * наибольшее количество связей + номер связи в фильме
+    most_cast = _most(params.cast, params.people)
+    cast = _counts(rnd, params.cast, len(numbers), params.people)
+    people = rnd.choices(range(params.people), k=sum(cast))
+    link_prefix = id_prefix("person_film_work", params.seed)
+    person_links = []
+    position = 0
+    for film_number, film_id, count in zip(numbers, film_ids, cast):
+        # Повторы одного человека в фильме отбрасываются
+        for slot, person in enumerate(dict.fromkeys(people[position : position + count])):
+            link = film_number * most_cast + slot
+            person_links.append(f"{link_prefix}{link:012x}\t{film_id}\t{person_prefix}{person:012x}\n")
+        position += count
+
+    names = genre_names(params.genres)
+    genre_counts = _counts(rnd, params.genres_per_film, len(numbers), len(names))
+    link_prefix = id_prefix("genre_film_work", params.seed)
+    genre_links = [
+        f"{link_prefix}{film_number * len(names) + slot:012x}\t{film_id}\t{genre}\n"
+        for film_number, film_id, count in zip(numbers, film_ids, genre_counts)
+        for slot, genre in enumerate(rnd.sample(names, count))
+    ]
+    return films, "".join(person_links), "".join(genre_links)
+
+
+# Состояние процесса-генератора: заводится один раз в initializer
+_worker_conn: Optional[_connection] = None
+_worker_params: Optional[Params] = None
+
+
+def _init_worker(dsl: dict, params: Params):
+    global _worker_conn, _worker_params
+    _worker_conn = psycopg2.connect(**dsl)
+    _worker_params = params
+
+
+def _copy(cur, table: str, columns: Sequence[str], data: str) -> int:
+    cur.copy_expert(f"COPY content.{table} ({', '.join(columns)}) FROM STDIN", io.StringIO(data))
+    return data.count("\n")
+
+
+def _load_people(chunk: int) -> List[Result]:
+    with _worker_conn.cursor() as cur:
+        rows = _copy(cur, "person", ("id", "name"), people_chunk(_worker_params, chunk))
+    _worker_conn.commit()
+    return [Result("person", rows)]
+
+
+def _load_films(chunk: int) -> List[Result]:
+    films, person_links, genre_links = films_chunk(_worker_params, chunk)
+    with _worker_conn.cursor() as cur:
+        results = [
+            Result("film_work", _copy(cur, "film_work", ("id", "title", "rating", "creation_date", "type"), films)),
+            Result(
+                "person_film_work",
+                _copy(cur, "person_film_work", ("id", "film_work_id", "person_id"), person_links),
+            ),
+            Result("genre_film_work", _copy(cur, "genre_film_work", ("id", "film_work_id", "genre"), genre_links)),
+        ]
+    _worker_conn.commit()
+    return results
+
+
+def check_seed_unused(cur, params: Params):
+    """
+    id людей и фильмов выводятся из seed, поэтому повторный запуск с тем же seed
+    без --truncate упал бы на первичном ключе посреди загрузки. Проверяется первая строка каждой таблицы.
+    """
+    for table in ("person", "film_work"):
+        cur.execute(f"SELECT 1 FROM content.{table} WHERE id = %s", (f"{id_prefix(table, params.seed)}{0:012x}",))
+        if cur.fetchone() is not None:
+            raise ValueError(
+                f"content.{table} already has rows generated with seed {params.seed}: "
+                "run with --truncate or choose another --seed"
+            )
+
+
+def generate(conn: _connection, dsl: dict, params: Params, workers: int = 1, truncate: bool = False) -> dict:
+    """
+    Заполняет content.* синтетическими данными.
+    Жанры пишутся из этого процесса, люди и фильмы со связями — кусками в workers процессах.
+    Без truncate данные добавляются к уже имеющимся: жанры с теми же названиями
+    остаются прежними, а люди и фильмы должны генерироваться с другим seed.
+    :return: количество строк по таблицам
+    """
+    with conn.cursor() as cur:
+        if truncate:
+            cur.execute(f"TRUNCATE {', '.join(f'content.{table}' for table in TABLES)}")
+        else:
+            check_seed_unused(cur, params)
+        prefix = id_prefix("genre", params.seed)
+        # Связи ссылаются на жанр по названию, поэтому существующий жанр подходит и новым фильмам
+        inserted = execute_values(
+            cur,
+            "INSERT INTO content.genre (id, genre) VALUES %s ON CONFLICT DO NOTHING RETURNING id",
+            [(f"{prefix}{number:012x}", name) for number, name in enumerate(genre_names(params.genres))],
+            fetch=True,
+        )
+    conn.commit()
+    totals = dict.fromkeys(TABLES, 0)
+    totals["genre"] = len(inserted)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(dsl, params)) as pool:
+        # Люди пишутся до фильмов: на них ссылаются внешние ключи связей
+        for task, chunks in (
+            (_load_people, range(-(-params.people // PEOPLE_CHUNK))),
+            (_load_films, range(-(-params.films // FILMS_CHUNK))),
+        ):
+            for results in pool.map(task, chunks):
+                for table, rows in results:
+                    totals[table] += rows
+                logging.info("generated %s", ", ".join(f"{table}: {rows}" for table, rows in totals.items() if rows))
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетического каталога в content.* через COPY")
+    parser.add_argument("--films", type=int, default=1_000_000)
+    parser.add_argument("--people", type=int, default=600_000)
+    parser.add_argument("--genres", type=int, default=len(GENRES))
+    parser.add_argument("--cast", type=float, default=5, help="Среднее количество людей у фильма")
+    parser.add_argument("--genres-per-film", type=float, default=2, help="Среднее количество жанров у фильма")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=4, help="Количество процессов, пишущих в Postgres")
+    parser.add_argument("--truncate", action="store_true", help="Очистить таблицы content.* перед генерацией")
+    args = parser.parse_args()
+    # Связям фильмов нужны люди и жанры, а пулу процессов — хотя бы один процесс
+    for option in ("films", "people", "genres", "workers"):
+        if getattr(args, option) < 1:
+            parser.error(f"--{option} must be a positive integer")
+
+    dsl = {
+        "dbname": "movies",
+        "user": "postgres",
+        "host": "localhost",
+        "password": "postgres",
+        "port": 5432,
+    }
+    with psycopg2.connect(**dsl) as pg_conn:
+        generate(
+            pg_conn,
+            dsl,
+            Params(args.films, args.people, args.genres, args.cast, args.genres_per_film, args.seed),
+            workers=args.workers,
+            truncate=args.truncate,
+        )
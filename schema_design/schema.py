@@ -1,90 +1,301 @@
+"""
+Схема content.* для каталога фильмов: те же таблицы, в которые пишет sqlite_to_postgres.
+
+    python -m schema_design.schema                   # создать или дополнить схему
+    python -m schema_design.schema --partitions 8    # таблицы связей, разбитые на 8 секций
+    python -m schema_design.schema --check           # проверить, что запросы идут по индексам
+
+Все команды идемпотентны: повторный запуск создаёт только недостающие таблицы,
+секции и индексы.
+
+Вторичные индексы подобраны под запросы админки и ETL:
+ - фильмы человека и люди фильма: составные индексы по обоим полям связи,
+   поэтому вторая колонка берётся прямо из индекса без чтения таблицы;
+ - фильмы жанра и жанры фильма;
+ - поиск и сортировка фильмов по названию.
+
+Таблицы связей можно разбить на секции по хешу id. Ключ секционирования обязан входить
+в первичный ключ, а ETL вставляет связи через ON CONFLICT (id), поэтому секции делятся
+по id, а не по id фильма. id связей — uuid5, так что строки распределяются по секциям
+равномерно, индексы каждой секции меньше, а VACUUM и построение индексов после
+массовой загрузки идут по секциям.
+"""
+import argparse
+import json
+import logging
+import uuid
+from typing import Iterator, List, NamedTuple, Optional
+
 import psycopg2
+from psycopg2.extensions import connection as _connection
 
-conn = psycopg2.connect(
-    dbname="movies",
-    user="postgres",
-    host="localhost",
-    password="postgres",
-    port=5432,
-    options="-c search_path=content",
-)
+LINK_TABLES = ("person_film_work", "genre_film_work")
 
-with conn.cursor() as cur:
-    cur.execute(
-        """
-            CREATE SCHEMA IF NOT EXISTS content;
-        """
-    )
+TABLES_DDL = """
+CREATE SCHEMA IF NOT EXISTS content;
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS content.movies (
-            id uuid PRIMARY KEY,
-            title VARCHAR(255) NOT NULL,
-            plot TEXT,
-            creation_date DATE NOT NULL,
-            mpa_film_rating VARCHAR (10)
-            imdb_rating FLOAT,
-            link VARCHAR(255) NOT NULL,
-        );
-    """
-    )
+CREATE TABLE IF NOT EXISTS content.film_work (
+    id uuid PRIMARY KEY,
+    title text NOT NULL,
+    description text,
+    creation_date date,
+    certificate text,
+    file_path text,
+    rating double precision CHECK (rating >= 0),
+    type text NOT NULL DEFAULT 'movie',
+    created_at timestamptz NOT NULL DEFAULT now(),
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS content.people (
-            id uuid PRIMARY KEY,
-            first_name VARCHAR(45) NOT NULL,
-            last_name VARCHAR(45) NOT NULL,
-        );
-    """
-    )
+CREATE TABLE IF NOT EXISTS content.person (
+    id uuid PRIMARY KEY,
+    name text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
 
-    cur.execute(
+CREATE TABLE IF NOT EXISTS content.genre (
+    id uuid PRIMARY KEY,
+    genre text NOT NULL UNIQUE,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS content.person_film_work (
+    id uuid NOT NULL,
+    film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+    person_id uuid NOT NULL REFERENCES content.person (id) ON DELETE CASCADE,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id)
+){partition_by};
+
+-- Связь хранит название жанра, как его пишет ETL, поэтому внешнего ключа на content.genre нет
+CREATE TABLE IF NOT EXISTS content.genre_film_work (
+    id uuid NOT NULL,
+    film_work_id uuid NOT NULL REFERENCES content.film_work (id) ON DELETE CASCADE,
+    genre text NOT NULL,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (id)
+){partition_by};
+"""
+
+PARTITION_DDL = """
+CREATE TABLE IF NOT EXISTS content.{table}_p{remainder} PARTITION OF content.{table}
+    FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder});
+"""
+
+# На секционированной таблице индекс создаётся и на всех её секциях
+INDEXES_DDL = """
+CREATE INDEX IF NOT EXISTS film_work_title_idx ON content.film_work (title);
+CREATE INDEX IF NOT EXISTS person_film_work_person_idx ON content.person_film_work (person_id, film_work_id);
+CREATE INDEX IF NOT EXISTS person_film_work_film_work_idx ON content.person_film_work (film_work_id, person_id);
+CREATE INDEX IF NOT EXISTS genre_film_work_genre_idx ON content.genre_film_work (genre, film_work_id);
+CREATE INDEX IF NOT EXISTS genre_film_work_film_work_idx ON content.genre_film_work (film_work_id, genre);
+"""
+
+# Пока в таблице мало строк, последовательное чтение дешевле индекса, и планировщик прав
+SMALL_TABLE_ROWS = 10_000
+
+
+class Check(NamedTuple):
+    """Типичный запрос и индекс, по которому он должен выполняться"""
+
+    name: str
+    sql: str
+    params: tuple
+    index: str
+
+
+CHECKS = (
+    Check(
+        "films by person",
         """
-        CREATE TYPE person_roles AS ENUM ('Actor','Director', 'Writer');
+        SELECT fw.id, fw.title
+        FROM content.person_film_work pfw
+        JOIN content.film_work fw ON fw.id = pfw.film_work_id
+        WHERE pfw.person_id = %s
+        """,
+        (str(uuid.UUID(int=0)),),
+        "content.person_film_work_person_idx",
+    ),
+    Check(
+        "persons by film",
         """
-    )
+        SELECT p.id, p.name
+        FROM content.person_film_work pfw
+        JOIN content.person p ON p.id = pfw.person_id
+        WHERE pfw.film_work_id = %s
+        """,
+        (str(uuid.UUID(int=0)),),
+        "content.person_film_work_film_work_idx",
+    ),
+    Check(
+        "films by genre",
+        "SELECT film_work_id FROM content.genre_film_work WHERE genre = %s",
+        ("Comedy",),
+        "content.genre_film_work_genre_idx",
+    ),
+    Check(
+        "genres by film",
+        "SELECT genre FROM content.genre_film_work WHERE film_work_id = %s",
+        (str(uuid.UUID(int=0)),),
+        "content.genre_film_work_film_work_idx",
+    ),
+    Check(
+        "title lookup",
+        "SELECT id FROM content.film_work WHERE title = %s",
+        ("Star Wars",),
+        "content.film_work_title_idx",
+    ),
+    Check(
+        "titles in order",
+        "SELECT id, title FROM content.film_work ORDER BY title LIMIT 50",
+        (),
+        "content.film_work_title_idx",
+    ),
+)
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS content.roles (
-            id serial PRIMARY KEY,
-            role person_roles DEFAULT 'Actor' NOT NULL,
-        );
-    """
-    )
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS content.movie_people (
-            person_id uuid NOT NULL,
-            movie_id uuid NOT NULL,
-            UNIQUE (movie_id, person_id)
-            FOREIGN KEY (person_id) REFERENCES content.people (id) ON UPDATE CASCADE,
-            FOREIGN KEY (movie_id) REFERENCES content.movies (id) ON UPDATE CASCADE,
-            FOREIGN KEY (role_id) REFERENCES content.roles (id)
-        );
+class CheckResult(NamedTuple):
+    check: Check
+    indexes: List[str]
+    # Индекс используется только при enable_seqscan = off: таблица пока слишком мала
+    forced: bool
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.indexes)
+
+
+class IndexNotUsed(Exception):
+    """Запрос не выполняется по индексу, который для него заведён"""
+
+
+def create_schema(conn: _connection, partitions: Optional[int] = None):
     """
-    )
+    Создаёт недостающие таблицы, секции и индексы.
+    :param partitions: на сколько секций по хешу id разбить таблицы связей
+    """
+    with conn.cursor() as cur:
+        for table in LINK_TABLES:
+            cur.execute(
+                """
+                SELECT c.relkind, count(i.inhrelid)
+                FROM pg_class c LEFT JOIN pg_inherits i ON i.inhparent = c.oid
+                WHERE c.oid = to_regclass(%s)
+                GROUP BY c.relkind
+                """,
+                (f"content.{table}",),
+            )
+            row = cur.fetchone()
+            # Обычную таблицу нельзя превратить в секционированную на месте, и наоборот,
+            # а секции с другим модулем пересекались бы с уже созданными
+            if row is not None and (row[0] == "p") != bool(partitions):
+                raise ValueError(
+                    f"content.{table} already exists {'with' if row[0] == 'p' else 'without'} partitions, "
+                    "recreate it to change partitioning"
+                )
+            if row is not None and partitions and row[1] not in (0, partitions):
+                raise ValueError(f"content.{table} already has {row[1]} partitions, not {partitions}")
 
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS content.genres (
-            id serial PRIMARY KEY,
-            genre VARCHAR(45) UNIQUE NOT NULL,
-    );
+        partition_by = " PARTITION BY HASH (id)" if partitions else ""
+        cur.execute(TABLES_DDL.format(partition_by=partition_by))
+        for table in LINK_TABLES if partitions else ():
+            for remainder in range(partitions):
+                cur.execute(PARTITION_DDL.format(table=table, modulus=partitions, remainder=remainder))
+        cur.execute(INDEXES_DDL)
+        tables = ("film_work", "person", "genre", *LINK_TABLES)
+        cur.execute(f"ANALYZE {', '.join(f'content.{table}' for table in tables)}")
+    conn.commit()
+    logging.info("schema content is ready%s", f", link tables have {partitions} partitions" if partitions else "")
+
+
+def check_indexes(conn: _connection) -> List[CheckResult]:
     """
-    )
+    Прогоняет типичные запросы через EXPLAIN и проверяет, что они идут по своим индексам.
+    На почти пустых таблицах последовательное чтение дешевле, поэтому для них
+    запрос повторяется с enable_seqscan = off: так проверяется, что индекс подходит к запросу.
+    """
+    results = []
+    with conn.cursor() as cur:
+        for check in CHECKS:
+            # Индекс секционированной таблицы состоит из индексов секций
+            cur.execute(
+                """
+                SELECT c.relname FROM pg_partition_tree(%s::regclass) t JOIN pg_class c ON c.oid = t.relid
+                """,
+                (check.index,),
+            )
+            expected = {name for (name,) in cur.fetchall()}
+            used = expected.intersection(_explain_indexes(cur, check))
+            forced = False
+            if not used and _rows(cur, check.index) < SMALL_TABLE_ROWS:
+                cur.execute("SET LOCAL enable_seqscan = off")
+                used = expected.intersection(_explain_indexes(cur, check))
+                cur.execute("SET LOCAL enable_seqscan = on")
+                forced = True
+            results.append(CheckResult(check, sorted(used), forced))
+    conn.rollback()
+
+    for result in results:
+        if result.ok:
+            logging.info(
+                "check %s: %s%s",
+                result.check.name,
+                ", ".join(result.indexes),
+                " (only with enable_seqscan = off, the table is small)" if result.forced else "",
+            )
+        else:
+            logging.error("check %s: %s is not used", result.check.name, result.check.index)
+    failed = [result.check.name for result in results if not result.ok]
+    if failed:
+        raise IndexNotUsed(f"queries do not use their indexes: {', '.join(failed)}")
+    return results
+
 
+def _explain_indexes(cur, check: Check) -> Iterator[str]:
+    cur.execute(f"EXPLAIN (FORMAT JSON) {check.sql}", check.params)
+    plan = cur.fetchone()[0]
+    # psycopg2 разбирает json сам, но только если тип результата известен как json
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            yield node["Index Name"]
+        nodes.extend(node.get("Plans", ()))
+
+
+def _rows(cur, index: str) -> float:
+    """Оценка количества строк в таблице индекса вместе с секциями"""
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS content.movie_genres (
-            movie_id uuid NOT NULL,
-            genre_id INT NOT NULL,
-            UNIQUE (movie_id, genre_id)
-            FOREIGN KEY (movie_id) REFERENCES content.movies (id) ON UPDATE CASCADE,
-            FOREIGN KEY (genre_id) REFERENCES content.genres (id) ON UPDATE CASCADE,
-        );
-    """
+        SELECT coalesce(sum(greatest(c.reltuples, 0)), 0)
+        FROM pg_partition_tree((SELECT indrelid FROM pg_index WHERE indexrelid = %s::regclass)) t
+        JOIN pg_class c ON c.oid = t.relid
+        """,
+        (index,),
     )
+    return cur.fetchone()[0]
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Схема content для каталога фильмов")
+    parser.add_argument("--partitions", type=int, help="Разбить таблицы связей на столько секций по хешу id")
+    parser.add_argument("--check", action="store_true", help="Проверить через EXPLAIN, что запросы идут по индексам")
+    args = parser.parse_args()
+
+    dsl = {
+        "dbname": "movies",
+        "user": "postgres",
+        "host": "localhost",
+        "password": "postgres",
+        "port": 5432,
+    }
+    with psycopg2.connect(**dsl) as pg_conn:
+        create_schema(pg_conn, args.partitions)
+        if args.check:
+            check_indexes(pg_conn)
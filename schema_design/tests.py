@@ -0,0 +1,70 @@
+"""
+Проверки генератора без Postgres: куски строятся в памяти.
+
+    python -m unittest schema_design.tests
+"""
+import unittest
+from collections import Counter
+from unittest import mock
+
+from schema_design.generate import Params, films_chunk, people_chunk
+
+# Куски меньше настоящих, чтобы проверить связи на стыках нескольких кусков
+FILMS_CHUNK = 40
+PEOPLE_CHUNK = 30
+PARAMS = Params(films=150, people=70, genres=20, cast=4, genres_per_film=3, seed=7)
+
+
+def chunks_count(total: int, size: int) -> int:
+    return -(-total // size)
+
+
+def ids(lines: str) -> list:
+    return [line.split("\t", 1)[0] for line in lines.splitlines()]
+
+
+class GenerateTest(unittest.TestCase):
+    def setUp(self):
+        for patcher in (
+            mock.patch("schema_design.generate.FILMS_CHUNK", FILMS_CHUNK),
+            mock.patch("schema_design.generate.PEOPLE_CHUNK", PEOPLE_CHUNK),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def generate(self, params: Params = PARAMS, reverse: bool = False) -> tuple:
+        # Процессы берут куски в любом порядке: данные куска зависят только от параметров и его номера
+        order = -1 if reverse else 1
+        people = {
+            chunk: people_chunk(params, chunk) for chunk in range(chunks_count(params.people, PEOPLE_CHUNK))[::order]
+        }
+        films = {chunk: films_chunk(params, chunk) for chunk in range(chunks_count(params.films, FILMS_CHUNK))[::order]}
+        return [people[chunk] for chunk in sorted(people)], [films[chunk] for chunk in sorted(films)]
+
+    def test_same_params_same_rows(self):
+        self.assertEqual(self.generate(), self.generate(reverse=True))
+        self.assertNotEqual(self.generate(), self.generate(PARAMS._replace(seed=PARAMS.seed + 1)))
+
+    def test_unique_ids(self):
+        people, films = self.generate()
+        tables = {
+            "person": "".join(people),
+            "film_work": "".join(chunk[0] for chunk in films),
+            "person_film_work": "".join(chunk[1] for chunk in films),
+            "genre_film_work": "".join(chunk[2] for chunk in films),
+        }
+        self.assertEqual(len(ids(tables["person"])), PARAMS.people)
+        self.assertEqual(len(ids(tables["film_work"])), PARAMS.films)
+        for table, lines in tables.items():
+            with self.subTest(table=table):
+                self.assertEqual([key for key, count in Counter(ids(lines)).items() if count > 1], [])
+
+        # Связи ссылаются только на сгенерированные строки и не повторяют пару внутри фильма
+        person_ids, film_ids = set(ids(tables["person"])), set(ids(tables["film_work"]))
+        person_links = [line.split("\t")[1:] for line in tables["person_film_work"].splitlines()]
+        self.assertLessEqual({film_id for film_id, _person_id in person_links}, film_ids)
+        self.assertLessEqual({person_id for _film_id, person_id in person_links}, person_ids)
+        self.assertEqual(len({tuple(link) for link in person_links}), len(person_links))
+        genre_links = [line.split("\t")[1:] for line in tables["genre_film_work"].splitlines()]
+        self.assertEqual({film_id for film_id, _genre in genre_links}, film_ids)
+        self.assertEqual(len({tuple(link) for link in genre_links}), len(genre_links))
@@ -0,0 +1,175 @@
+"""
+Генератор синтетических баз SQLite в старой схеме (movies, actors, movie_actors, writers)
+для замеров производительности ETL.
+
+    python -m sqlite_to_postgres.benchmark.generate --size 100k --out bench_100k.sqlite
+"""
+import argparse
+import json
+import logging
+import random
+import sqlite3
+from typing import Iterator, List, Tuple
+
+logging.basicConfig(format="[%(asctime)s: %(levelname)s] %(message)s", level=logging.INFO)
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1M": 1_000_000}
+CHUNK_SIZE = 10_000
+
+# Доли повторяют исходную db.sqlite: ~1.2 сценариста и ~3.5 актёра на фильм,
+# у 60% фильмов сценаристы лежат в JSON-столбце writers, остальные в writer
+WRITERS_PER_MOVIE = 1.2
+ACTORS_PER_MOVIE = 2.7
+CAST_PER_MOVIE = 3.5
+JSON_WRITERS_SHARE = 0.6
+NA_SHARE = 0.25
+
+GENRES = [
+    "Action",
+    "Adventure",
+    "Animation",
+    "Comedy",
+    "Crime",
+    "Documentary",
+    "Drama",
+    "Family",
+    "Fantasy",
+    "History",
+    "Horror",
+    "Music",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Thriller",
+    "War",
+    "Western",
+]
+FIRST_NAMES = ["Mark", "Harrison", "Carrie", "Peter", "Alec", "Anthony", "Kenny", "David", "Irvin", "George", "Leigh"]
+LAST_NAMES = ["Hamill", "Ford", "Fisher", "Cushing", "Guinness", "Daniels", "Baker", "Prowse", "Kershner", "Lucas"]
+WORDS = ["star", "wars", "empire", "return", "jedi", "galaxy", "force", "hope", "rebel", "dark", "light", "planet"]
+
+SCHEMA = """
+CREATE TABLE actors(
+id integer primary key autoincrement,
+name text
+);
+CREATE TABLE rating_agency(
+id text(27),
+name text
+);
+CREATE TABLE movies (
+id text primary key,
+genre text,
+director text,
+writer text,
+title text,
+plot text,
+ratings text,
+imdb_rating text, writers text);
+CREATE TABLE writers(
+id text(27) primary key,
+name text
+);
+CREATE TABLE movie_actors(
+movie_id text,
+actor_id text
+);
+"""
+
+
+def _person_name(rnd: random.Random, number: int) -> str:
+    # Номер в конце делает имена уникальными, но оставляет их похожими на настоящие
+    return f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)} {number}"
+
+
+def _writer_id(number: int) -> str:
+    return f"{number:040x}"
+
+
+def _chunks(rows: Iterator[tuple], size: int = CHUNK_SIZE) -> Iterator[List[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _writers(rnd: random.Random, total: int) -> Iterator[Tuple[str, str]]:
+    for number in range(total):
+        name = "N/A" if number == 0 else _person_name(rnd, number)
+        yield _writer_id(number), name
+
+
+def _actors(rnd: random.Random, total: int) -> Iterator[Tuple[int, str]]:
+    for number in range(1, total + 1):
+        yield number, _person_name(rnd, number)
+
+
+def _movie(rnd: random.Random, number: int, writers_total: int) -> tuple:
+    movie_id = f"tt{number:08d}"
+    genre = ", ".join(rnd.sample(GENRES, rnd.randint(1, 4)))
+    director = (
+        "N/A" if rnd.random() < NA_SHARE else ", ".join(_person_name(rnd, number) for _ in range(rnd.randint(1, 2)))
+    )
+    if rnd.random() < JSON_WRITERS_SHARE:
+        ids = [_writer_id(rnd.randrange(writers_total)) for _ in range(rnd.randint(2, 4))]
+        writer, writers = "", json.dumps([{"id": writer_id} for writer_id in ids])
+    else:
+        writer, writers = _writer_id(rnd.randrange(writers_total)), ""
+    title = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 5))).title()
+    plot = "N/A" if rnd.random() < NA_SHARE else " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(20, 80)))
+    imdb_rating = "N/A" if rnd.random() < NA_SHARE / 10 else f"{rnd.uniform(1, 10):.1f}"
+    return movie_id, genre, director, writer, title, plot, "", imdb_rating, writers
+
+
+def _movies(rnd: random.Random, total: int, writers_total: int) -> Iterator[tuple]:
+    for number in range(total):
+        yield _movie(rnd, number, writers_total)
+
+
+def _movie_actors(rnd: random.Random, total: int, actors_total: int) -> Iterator[Tuple[str, str]]:
+    for number in range(total):
+        for actor_id in rnd.sample(range(1, actors_total + 1), rnd.randint(1, int(CAST_PER_MOVIE * 2) - 1)):
+            yield f"tt{number:08d}", str(actor_id)
+
+
+def generate(path: str, movies: int, seed: int = 42):
+    """
+    Создаёт базу SQLite со старой схемой и movies фильмами.
+    Данные генерируются и пишутся кусками, поэтому память не зависит от размера базы.
+    Одинаковые movies и seed всегда дают одинаковую базу.
+    """
+    rnd = random.Random(seed)
+    writers_total = max(2, int(movies * WRITERS_PER_MOVIE))
+    actors_total = max(8, int(movies * ACTORS_PER_MOVIE))
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    tables = (
+        ("writers", "INSERT INTO writers (id, name) VALUES (?, ?)", _writers(rnd, writers_total)),
+        ("actors", "INSERT INTO actors (id, name) VALUES (?, ?)", _actors(rnd, actors_total)),
+        ("movies", "INSERT INTO movies VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", _movies(rnd, movies, writers_total)),
+        ("movie_actors", "INSERT INTO movie_actors VALUES (?, ?)", _movie_actors(rnd, movies, actors_total)),
+    )
+    with conn:
+        for table, sql, rows in tables:
+            logging.info("generate %s", table)
+            for chunk in _chunks(rows):
+                conn.executemany(sql, chunk)
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Генерация синтетической базы SQLite для замеров ETL")
+    parser.add_argument("--size", choices=sorted(SIZES), help="Готовый размер базы")
+    parser.add_argument("--movies", type=int, help="Количество фильмов, если размер не из списка")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True, help="Путь к создаваемому файлу SQLite")
+    args = parser.parse_args()
+    if not args.size and not args.movies:
+        parser.error("--size or --movies is required")
+
+    generate(args.out, args.movies or SIZES[args.size], args.seed)
@@ -0,0 +1,132 @@
+"""
+Сколько памяти занимает промежуточное представление ETL в расчёте на фильм и на связь фильм-человек.
+Сравниваются прежнее представление (словарь на строку, dataclass-записи, uuid строкой)
+и текущее (MovieBatch по колонкам, NamedTuple-записи, uuid 16 байтами).
+
+    python -m sqlite_to_postgres.benchmark.memory bench_100k.sqlite --movies 50000
+"""
+import argparse
+import gc
+import json
+import logging
+import sqlite3
+import tracemalloc
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, List
+
+from sqlite_to_postgres.etl import BATCH_SIZE, PostgresSaver, SQLiteLoader
+from sqlite_to_postgres.records import MovieBatch, uuid_str
+
+
+@dataclass
+class LegacyMovie:
+    id: str
+    title: str
+    imdb_rating: float
+    description: str
+    type: str = "movie"
+
+
+@dataclass
+class LegacyPerson:
+    id: str
+    name: str
+
+
+@dataclass
+class LegacyGenre:
+    id: str
+    genre: str
+
+
+@dataclass
+class LegacyMoviePeople:
+    id: str
+    movie_id: str
+    person_id: str
+
+
+def to_legacy(batch: MovieBatch) -> List[dict]:
+    """Пачка в том виде, в котором её отдавал SQLiteLoader до MovieBatch"""
+    records = []
+    for index, movie in enumerate(batch.movies):
+        movie_id = uuid_str(movie.id)
+        genres = [LegacyGenre(uuid_str(genre.id), genre.genre) for genre in batch.genres[index]]
+        people = [LegacyPerson(uuid_str(person.id), person.name) for person in batch.people[index]]
+        records.append(
+            {
+                "movie": LegacyMovie(movie_id, movie.title, movie.imdb_rating, movie.description),
+                "genres": genres,
+                "movie_genres": {"genres": genres, "movie_id": movie_id},
+                "movie_people": {"people": people, "movie_id": movie_id},
+                "rowid": batch.rowids[index],
+                "source_id": batch.source_ids[index],
+                "hash": batch.hashes[index].hex(),
+            }
+        )
+    return records
+
+
+def _retained(build: Callable[[], list]) -> int:
+    """Сколько байт удерживает результат build()"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return retained
+
+
+def measure(path: str, movies: int, batch_size: int) -> dict:
+    loader = SQLiteLoader(sqlite3.connect(path))
+    writers = loader.load_writers_names()
+    source_rows = list(islice(loader.read_rows(), movies))
+    chunks = [source_rows[start : start + batch_size] for start in range(0, len(source_rows), batch_size)]
+
+    def compact_batches():
+        return [loader.transform_batch(rows, writers) for rows in chunks]
+
+    def legacy_batches():
+        return [to_legacy(loader.transform_batch(rows, writers)) for rows in chunks]
+
+    batches = compact_batches()
+    links_total = sum(len(people) for batch in batches for people in batch.people)
+
+    def compact_links():
+        return [PostgresSaver.unify_people(batch.movie_people())[1] for batch in batches]
+
+    def legacy_links():
+        return [
+            [
+                LegacyMoviePeople(uuid_str(link.id), uuid_str(link.movie_id), uuid_str(link.person_id))
+                for link in PostgresSaver.unify_people(batch.movie_people())[1]
+            ]
+            for batch in batches
+        ]
+
+    links = sum(len(batch_links) for batch_links in compact_links())
+    results = {"movies": len(source_rows), "people_per_movie": round(links_total / len(source_rows), 2)}
+    for name, build, total in (
+        ("legacy_bytes_per_movie", legacy_batches, len(source_rows)),
+        ("compact_bytes_per_movie", compact_batches, len(source_rows)),
+        ("legacy_bytes_per_person_link", legacy_links, links),
+        ("compact_bytes_per_person_link", compact_links, links),
+    ):
+        results[name] = round(_retained(build) / total, 1)
+    return results
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Память промежуточного представления ETL")
+    parser.add_argument("dataset", help="Файл SQLite, например созданный benchmark.generate")
+    parser.add_argument("--movies", type=int, default=20_000, help="Сколько фильмов держать в памяти при замере")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    print(json.dumps(measure(args.dataset, args.movies, args.batch_size), indent=2))  # noqa: T001
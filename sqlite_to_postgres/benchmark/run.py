@@ -0,0 +1,186 @@
+"""
+Замер производительности ETL по стадиям.
+Отдельно измеряются чтение из SQLite, преобразование SQLiteLoader и запись PostgresSaver.
+Для каждой стадии сохраняются время, строки в секунду и пиковая память,
+результат дописывается строкой JSON в файл для сравнения между коммитами.
+
+    python -m sqlite_to_postgres.benchmark.run bench_100k.sqlite --output results.jsonl
+    python -m sqlite_to_postgres.benchmark.run bench_100k.sqlite --dsn "dbname=movies user=postgres" --engine copy
+    python -m sqlite_to_postgres.benchmark.run bench_100k.sqlite --dsn "dbname=movies user=postgres" --pipeline 4
+"""
+import argparse
+import json
+import logging
+import platform
+import resource
+import sqlite3
+import subprocess  # nosec
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Optional
+
+import psycopg2
+
+from sqlite_to_postgres.etl import BATCH_SIZE, LOADERS, PostgresSaver
+from sqlite_to_postgres.load_data import load_from_sqlite
+from sqlite_to_postgres.writers import WRITERS, ExecuteBatchWriter, get_writer
+
+TABLES = ("genre_film_work", "person_film_work", "genre", "person", "film_work")
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()  # nosec
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _stage(rows: int, seconds: float, peak_bytes: int) -> dict:
+    return {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+        "peak_memory_mb": round(peak_bytes / 2**20, 2),
+    }
+
+
+def _sqlite_pass(path: str, batch_size: int, extraction: str, trace_memory: bool) -> dict:
+    conn = sqlite3.connect(path)
+    loader = LOADERS[extraction](conn)
+    stages = {"extract": {"seconds": 0.0, "peak": 0}, "transform": {"seconds": 0.0, "peak": 0}}
+    rows_total = 0
+
+    def measure(stage: str, func, *args):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        result = func(*args)
+        stages[stage]["seconds"] += time.perf_counter() - started
+        if trace_memory:
+            stages[stage]["peak"] = max(stages[stage]["peak"], tracemalloc.get_traced_memory()[1])
+        return result
+
+    if trace_memory:
+        tracemalloc.start()
+    writers = loader.load_writers_names()
+    source_rows = loader.read_rows()
+    while True:
+        rows = measure("extract", list, islice(source_rows, batch_size))
+        if not rows:
+            break
+        batch = measure("transform", loader.transform_batch, rows, writers)
+        rows_total += len(batch)
+        del rows, batch
+    if trace_memory:
+        tracemalloc.stop()
+    conn.close()
+    stages["rows"] = rows_total
+    return stages
+
+
+def bench_sqlite(path: str, batch_size: int, extraction: str) -> dict:
+    """
+    Читает и преобразует все фильмы пачками, замеряя стадии по отдельности.
+    tracemalloc замедляет выполнение в разы, поэтому время и память
+    замеряются в двух отдельных проходах.
+    """
+    timing = _sqlite_pass(path, batch_size, extraction, trace_memory=False)
+    memory = _sqlite_pass(path, batch_size, extraction, trace_memory=True)
+    return {
+        stage: _stage(timing["rows"], timing[stage]["seconds"], memory[stage]["peak"])
+        for stage in ("extract", "transform")
+    }
+
+
+def bench_postgres(
+    path: str, dsn: str, engine: str, batch_size: int, extraction: str, truncate: bool, pipeline: int = 0
+) -> dict:
+    """
+    Полный прогон ETL в Postgres. Время записи каждой таблицы берётся из отчёта движка записи.
+    Пиковая память здесь не замеряется, чтобы tracemalloc не искажал время.
+    :param pipeline: количество потоков записи конвейера, 0 — последовательная загрузка
+    """
+    conn = sqlite3.connect(path)
+    with psycopg2.connect(dsn) as pg_conn:
+        if truncate:
+            with pg_conn.cursor() as cur:
+                cur.execute(f"TRUNCATE {', '.join('content.' + table for table in TABLES)}")
+            pg_conn.commit()
+
+        started = time.perf_counter()
+        if pipeline:
+            tables = load_from_sqlite(
+                conn,
+                pg_conn,
+                engine=engine,
+                batch_size=batch_size,
+                extraction=extraction,
+                pipeline=True,
+                writer_threads=pipeline,
+                connect=lambda: psycopg2.connect(dsn),
+            )
+        else:
+            saver = PostgresSaver(pg_conn, writer=get_writer(engine))
+            saver.save_all_data(LOADERS[extraction](conn).load_movies(batch_size=batch_size))
+            tables = saver.writer.report()
+        seconds = time.perf_counter() - started
+    conn.close()
+
+    rows = tables["content.film_work"]["rows"]
+    return {
+        "engine": engine,
+        "pipeline": pipeline,
+        "total": {"rows": rows, "seconds": round(seconds, 3), "rows_per_sec": round(rows / seconds, 1)},
+        "tables": tables,
+    }
+
+
+def run(
+    path: str,
+    batch_size: int,
+    extraction: str = "group_concat",
+    dsn: Optional[str] = None,
+    engine: str = "",
+    truncate: bool = False,
+    pipeline: int = 0,
+) -> dict:
+    movies = sqlite3.connect(path).execute("SELECT count(*) FROM movies").fetchone()[0]
+    result = {
+        "commit": _commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "dataset": path,
+        "movies": movies,
+        "batch_size": batch_size,
+        "extraction": extraction,
+        "sqlite": bench_sqlite(path, batch_size, extraction),
+    }
+    if dsn:
+        result["postgres"] = bench_postgres(path, dsn, engine, batch_size, extraction, truncate, pipeline)
+    result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+    return result
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Замер производительности ETL")
+    parser.add_argument("dataset", help="Файл SQLite, например созданный benchmark.generate")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--extraction", choices=sorted(LOADERS), default="group_concat")
+    parser.add_argument("--dsn", help="Строка подключения к Postgres. Без неё замеряется только SQLite")
+    parser.add_argument("--engine", choices=sorted(WRITERS), default=ExecuteBatchWriter.name)
+    parser.add_argument("--truncate", action="store_true", help="Очистить таблицы content.* перед загрузкой")
+    parser.add_argument(
+        "--pipeline", type=int, default=0, help="Загружать конвейером с указанным количеством потоков записи"
+    )
+    parser.add_argument("--output", help="Файл, в который дописывается результат в формате JSON Lines")
+    args = parser.parse_args()
+
+    result = run(args.dataset, args.batch_size, args.extraction, args.dsn, args.engine, args.truncate, args.pipeline)
+    print(json.dumps(result, indent=2, ensure_ascii=False))  # noqa: T001
+    if args.output:
+        with open(args.output, "a") as output:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
@@ -0,0 +1,65 @@
+"""
+Скорость преобразования пачек: построчное SQLiteLoader.transform_rows
+против преобразования по колонкам SQLiteLoader.transform_columns.
+Строки читаются из SQLite заранее, поэтому замеряется только преобразование.
+Перед замером проверяется, что оба способа дают одинаковые пачки.
+
+    python -m sqlite_to_postgres.benchmark.transform bench_100k.sqlite --movies 50000
+"""
+import argparse
+import json
+import logging
+import sqlite3
+import time
+from itertools import islice
+from typing import Callable, List
+
+from sqlite_to_postgres.etl import BATCH_SIZE, LOADERS, SQLiteLoader
+from sqlite_to_postgres.records import MovieBatch
+
+
+def batch_fields(batch: MovieBatch) -> tuple:
+    return tuple(getattr(batch, field) for field in MovieBatch.__slots__)
+
+
+def _best_of(repeat: int, transform: Callable[[list, dict], MovieBatch], chunks: List[list], writers: dict) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for rows in chunks:
+            transform(rows, writers)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(path: str, movies: int, batch_size: int, extraction: str = "group_concat", repeat: int = 3) -> dict:
+    loader: SQLiteLoader = LOADERS[extraction](sqlite3.connect(path))
+    writers = loader.load_writers_names()
+    source_rows = list(islice(loader.read_rows(), movies))
+    chunks = [source_rows[start : start + batch_size] for start in range(0, len(source_rows), batch_size)]
+
+    for rows in chunks:
+        if batch_fields(loader.transform_rows(rows, writers)) != batch_fields(loader.transform_columns(rows, writers)):
+            raise AssertionError("columnar transform differs from the row-wise one")
+
+    results = {"movies": len(source_rows), "batch_size": batch_size, "extraction": extraction}
+    for name, transform in (("rows", loader.transform_rows), ("columnar", loader.transform_columns)):
+        seconds = _best_of(repeat, transform, chunks, writers)
+        results[name] = {"seconds": round(seconds, 3), "rows_per_sec": round(len(source_rows) / seconds, 1)}
+    results["speedup"] = round(results["rows"]["seconds"] / results["columnar"]["seconds"], 2)
+    return results
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Скорость построчного и колоночного преобразования")
+    parser.add_argument("dataset", help="Файл SQLite, например созданный benchmark.generate")
+    parser.add_argument("--movies", type=int, default=20_000, help="Сколько фильмов преобразовывать")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--extraction", choices=sorted(LOADERS), default="group_concat")
+    parser.add_argument("--repeat", type=int, default=3, help="Лучший результат из стольких повторов")
+    args = parser.parse_args()
+
+    result = measure(args.dataset, args.movies, args.batch_size, args.extraction, args.repeat)
+    print(json.dumps(result, indent=2))  # noqa: T001
@@ -0,0 +1,139 @@
+import logging
+import sqlite3
+from typing import List, Tuple
+
+from sqlite_to_postgres.records import MovieBatch
+
+RUNNING = "running"
+FINISHED = "finished"
+
+
+class CheckpointStore:
+    """
+    Состояние ETL в отдельном файле SQLite.
+    Хранит:
+     1) контрольную точку прогона: статус, последний загруженный rowid
+     из таблицы movies и количество завершённых пачек;
+     2) для каждого загруженного фильма его id в Postgres и хеш исходной строки,
+     чтобы при следующем прогоне обрабатывать только новые и изменившиеся фильмы.
+    Пачка в Postgres записывается одной транзакцией, поэтому контрольная точка
+    ставится после каждой пачки целиком.
+    """
+
+    def __init__(self, path: str):
+        # В конвейерном режиме прогон начинается в основном потоке, а пачки подтверждает поток записи.
+        # Одновременно соединением пользуется только один поток
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS movies (
+                source_id TEXT PRIMARY KEY,
+                -- 16 байт uuid
+                film_work_id BLOB NOT NULL,
+                -- NULL означает, что пачка с фильмом ещё не подтверждена в Postgres
+                hash BLOB
+            );
+            """
+        )
+
+    def _get(self, key: str, default: str = None) -> str:
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set(self, **values):
+        self.conn.executemany(
+            "INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            [(key, str(value)) for key, value in values.items()],
+        )
+
+    @property
+    def last_rowid(self) -> int:
+        return int(self._get("last_rowid", 0))
+
+    @property
+    def completed_batches(self) -> int:
+        return int(self._get("completed_batches", 0))
+
+    def start(self, source: str) -> int:
+        """
+        Начинает прогон.
+        :param source: путь к файлу SQLite, из которого идёт загрузка
+        :return: rowid, с которого нужно читать таблицу movies
+        """
+        if self._get("status") == RUNNING:
+            if self._get("source") != source:
+                logging.warning("checkpoint was made for %s, resuming with %s", self._get("source"), source)
+            logging.info("resume from rowid %s after %s completed batches", self.last_rowid + 1, self.completed_batches)
+            return self.last_rowid + 1
+
+        with self.conn:
+            self._set(status=RUNNING, source=source, last_rowid=0, completed_batches=0)
+        return 0
+
+    def finish(self):
+        with self.conn:
+            self._set(status=FINISHED)
+        logging.info("checkpoint: run finished after %s batches", self.completed_batches)
+
+    def get_movies(self, source_ids: List[str]) -> dict:
+        """
+        :return: словарь вида {"source_id": (b"film_work_id", b"hash"), ...}
+        """
+        movies = {}
+        # Ограничение SQLite на количество параметров в запросе
+        for start in range(0, len(source_ids), 999):
+            chunk = source_ids[start : start + 999]
+            placeholders = ", ".join(["?"] * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT source_id, film_work_id, hash FROM movies WHERE source_id IN ({placeholders})",  # nosec
+                chunk,
+            )
+            movies.update((source_id, (film_work_id, hash_)) for source_id, film_work_id, hash_ in rows)
+        return movies
+
+    def prepare_batch(self, batch: MovieBatch) -> Tuple[MovieBatch, List[bytes]]:
+        """
+        Отбрасывает фильмы, которые уже загружены и не изменились.
+        Изменившимся фильмам возвращает их прежний id, чтобы заменить старые строки в Postgres.
+        Перед записью в Postgres фильмы пачки отмечаются как неподтверждённые:
+        если загрузка упадёт, при повторе они будут перезаписаны, а не продублированы.
+        :return: фильмы для записи и id фильмов, которые нужно удалить перед записью
+        """
+        known = self.get_movies(batch.source_ids) if len(batch) else {}
+        changed = []
+        replaced_ids = []
+        for index, source_id in enumerate(batch.source_ids):
+            film_work_id, hash_ = known.get(source_id, (None, None))
+            if film_work_id is not None:
+                if hash_ == batch.hashes[index]:
+                    continue
+                batch.set_movie_id(index, film_work_id)
+                replaced_ids.append(film_work_id)
+            changed.append(index)
+        changed = batch.select(changed)
+
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO movies (source_id, film_work_id, hash) VALUES (?, ?, NULL)
+                ON CONFLICT (source_id) DO UPDATE SET hash = NULL
+                """,
+                [(source_id, movie.id) for source_id, movie in zip(changed.source_ids, changed.movies)],
+            )
+        if len(changed) < len(batch):
+            logging.info("skip %s unchanged movies", len(batch) - len(changed))
+        return changed, replaced_ids
+
+    def complete_batch(self, batch: MovieBatch, changed: MovieBatch):
+        """Подтверждает записанную в Postgres пачку и сдвигает контрольную точку"""
+        if not len(batch):
+            return
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE movies SET hash = ? WHERE source_id = ?", zip(changed.hashes, changed.source_ids)
+            )
+            self._set(last_rowid=batch.rowids[-1], completed_batches=self.completed_batches + 1)
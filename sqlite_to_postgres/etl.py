@@ -1,161 +1,252 @@
+import hashlib
 import json
 import logging
+import os
 import sqlite3
+import tempfile
 import uuid
-from dataclasses import astuple, dataclass
-from typing import List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
 from psycopg2.extensions import connection as _connection
-from psycopg2.extras import execute_batch
-
-logging.basicConfig(format="[%(asctime)s: %(levelname)s] %(message)s", level=logging.INFO)
-
-
-@dataclass
-class Movie:
-    id: str
-    title: str
-    imdb_rating: float
-    description: str
-    type: str = "movie"
-
-
-@dataclass
-class Person:
-    id: str
-    name: str
 
+from sqlite_to_postgres.checkpoint import CheckpointStore
+from sqlite_to_postgres.identity import IdentityIndex
+from sqlite_to_postgres.instrumentation import Instrumentation
+from sqlite_to_postgres.records import (
+    ACTOR,
+    DIRECTOR,
+    WRITER,
+    Genre,
+    Movie,
+    MovieBatch,
+    MovieGenres,
+    MoviePeople,
+    Person,
+    genre_id,
+    make_id,
+    make_ids,
+    normalize_name,
+    person_id,
+    uuid_str,
+)
+from sqlite_to_postgres.writers import ExecuteBatchWriter, TableWriter
 
-@dataclass
-class MoviePeople:
-    id: str
-    movie_id: str
-    person_id: str
-
+logging.basicConfig(format="[%(asctime)s: %(levelname)s] %(message)s", level=logging.INFO)
 
-@dataclass
-class Genre:
-    id: str
-    genre: str
+BATCH_SIZE = 1_000
+FILM_WORK_COLUMNS = ("id", "title", "rating", "description", "type", "created_at")
+# Сколько строк за раз получает серверный курсор при прогреве индексов людей и жанров
+WARM_ITERSIZE = 10_000
+# Диапазон rowid, покрывающий всю таблицу movies
+FULL_RANGE = {"first_rowid": 0, "last_rowid": 2**63 - 1}
 
 
-@dataclass
-class MovieGenres:
-    id: str
-    movie_id: str
-    genre: str
+def warm_index(conn: _connection, index: IdentityIndex, sql: str):
+    """Пополняет индекс парами (имя, id), которые sql читает из Postgres через серверный курсор"""
+    with conn.cursor(name=f"etl_warm_{index.table}") as cur:
+        cur.itersize = WARM_ITERSIZE
+        cur.execute(sql)
+        index.update((name, uuid.UUID(str(id_)).bytes) for name, id_ in cur)
+    logging.info("identity index %s: %s names", index.table, len(index))
 
 
 class PostgresSaver:
-    def __init__(self, conn: _connection):
+    def __init__(
+        self,
+        conn: _connection,
+        writer: Optional[TableWriter] = None,
+        checkpoint: Optional[CheckpointStore] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        dedupe_across_batches: bool = True,
+        people: Optional[IdentityIndex] = None,
+        genres: Optional[IdentityIndex] = None,
+    ):
         self.conn = conn
+        self.instrumentation = instrumentation or Instrumentation()
+        # Несколько параллельных PostgresSaver не видят незакоммиченные строки друг друга,
+        # поэтому им нельзя пропускать людей и жанры, вставленные в чужих пачках
+        self.dedupe_across_batches = dedupe_across_batches
+        # Движок записи: execute_batch по умолчанию или COPY
+        self.writer = writer or ExecuteBatchWriter()
+        # Хранилище контрольных точек для возобновляемой и инкрементальной загрузки
+        self.checkpoint = checkpoint
+        # Индексы уже сохранённых людей и жанров. Живут между пачками,
+        # чтобы не вставлять дубли при потоковой загрузке
+        self.people = people if people is not None else IdentityIndex(table="person")
+        self.genres = genres if genres is not None else IdentityIndex(table="genre")
+
+    def save_all_data(self, batches: Iterable[MovieBatch]):
+        """
+        Сохраняет данные пачками по мере их поступления из SQLiteLoader.load_movies.
+        В памяти одновременно находится только одна пачка.
+        С контрольными точками пропускает неизменившиеся фильмы и после каждой
+        пачки запоминает, до какой строки SQLite дошла загрузка.
+        """
+        self.start()
+        for batch in batches:
+            self.save(batch)
+        self.finish()
+        self.writer.log_report()
+        self.instrumentation.log_report()
+
+    def start(self):
+        self.load_existent()
+
+    def save(self, batch: MovieBatch):
+        """Сохраняет одну пачку с учётом контрольных точек"""
+        if self.checkpoint is None:
+            self.save_batch(batch)
+            return
+        changed, replaced_ids = self.checkpoint.prepare_batch(batch)
+        self.save_batch(changed, replaced_ids)
+        self.checkpoint.complete_batch(batch, changed)
+
+    def finish(self):
+        if self.checkpoint is not None:
+            self.checkpoint.finish()
+        self.people.close()
+        self.genres.close()
+
+    def load_existent(self):
+        """
+        Прогревает индексы уже сохранёнными в Postgres людьми и жанрами, чтобы не вставлять их повторно.
+        Каждая таблица читается одним запросом через серверный курсор, поэтому
+        большой каталог не загружается в память клиента целиком.
+        """
+        warm_index(self.conn, self.people, "SELECT name, id FROM content.person")
+        warm_index(self.conn, self.genres, "SELECT genre, id FROM content.genre")
 
-    def save_all_data(self, records: List[dict]):
-        genres = []
-        movie_people = []
-        movie_genres = []
+    def delete_movies(self, cur, movie_ids: List[bytes]):
+        """Удаляет изменившиеся фильмы вместе со связями перед повторной вставкой"""
+        logging.info("delete %s changed movies", len(movie_ids))
+        movie_ids = [uuid_str(movie_id) for movie_id in movie_ids]
+        cur.execute("DELETE FROM content.person_film_work WHERE film_work_id = ANY(%s::uuid[])", (movie_ids,))
+        cur.execute("DELETE FROM content.genre_film_work WHERE film_work_id = ANY(%s::uuid[])", (movie_ids,))
+        cur.execute("DELETE FROM content.film_work WHERE id = ANY(%s::uuid[])", (movie_ids,))
 
-        for record in records:
-            genres.append(record["genres"])
-            movie_people.append(record["movie_people"])
-            movie_genres.append(record["movie_genres"])
+    def save_batch(self, batch: MovieBatch, replaced_ids: Iterable[bytes] = ()):
+        replaced_ids = list(replaced_ids)
+        created_at = datetime.now(timezone.utc)
 
         with self.conn.cursor() as cur:
-            logging.info("insert movies")
-            execute_batch(
-                cur,
-                """
-                    INSERT INTO content.film_work (id, title, rating, description, type, created_at)
-                    VALUES (%s, %s, %s, %s, %s, now())
-                """,
-                [astuple(record["movie"]) for record in records],
-                page_size=5_000,
-            )
-            self.conn.commit()
-            logging.info("movies has been inserted")
+            if replaced_ids:
+                self.delete_movies(cur, replaced_ids)
 
-            people, movie_people = self.unify_people(movie_people)
-            logging.info("insert people")
-            execute_batch(
+            logging.info("insert %s movies", len(batch))
+            self._save(
                 cur,
-                "INSERT INTO content.person (id, name) VALUES (%s, %s)",
-                [astuple(person) for person in people],
-                page_size=5_000,
+                "content.film_work",
+                FILM_WORK_COLUMNS,
+                self.film_work_rows(batch, created_at),
+                immutable=("created_at",),
             )
-            self.conn.commit()
-            logging.info("people has been inserted")
 
-            logging.info("insert movie_people")
-            execute_batch(
-                cur,
-                "INSERT INTO content.person_film_work (id, film_work_id, person_id) VALUES (%s, %s, %s)",
-                [astuple(movie_person) for movie_person in movie_people],
-                page_size=5_000,
-            )
-            self.conn.commit()
-            logging.info("movie_people has been inserted")
+            people_index = self.people if self.dedupe_across_batches else self.people.scoped()
+            genres_index = self.genres if self.dedupe_across_batches else self.genres.scoped()
 
-            genres, movie_genres = self.unify_genres(genres, movie_genres)
+            with self.instrumentation.stage("unify_people") as measurement:
+                people, movie_people = self.unify_people(batch.movie_people(), people_index)
+                measurement.rows = len(movie_people)
+            logging.info("insert %s people", len(people))
+            # Сортировка по id: параллельные транзакции блокируют одни и те же строки
+            # в одном порядке и не попадают во взаимную блокировку
+            self._save(cur, "content.person", ("id", "name"), [(uuid_str(id_), name) for id_, name in sorted(people)])
 
-            logging.info("insert genres")
-            execute_batch(
+            logging.info("insert %s movie_people", len(movie_people))
+            self._save(
                 cur,
-                "INSERT INTO content.genre (id, genre) VALUES (%s, %s)",
-                [astuple(genre) for genre in genres],
-                page_size=5_000,
+                "content.person_film_work",
+                ("id", "film_work_id", "person_id"),
+                [tuple(map(uuid_str, movie_person)) for movie_person in movie_people],
             )
-            self.conn.commit()
-            logging.info("genres has been inserted")
 
-            logging.info("insert movie_genres")
-            execute_batch(
+            with self.instrumentation.stage("unify_genres") as measurement:
+                genres, movie_genres = self.unify_genres(batch.movie_genres(), genres_index)
+                measurement.rows = len(movie_genres)
+
+            logging.info("insert %s genres", len(genres))
+            self._save(cur, "content.genre", ("id", "genre"), [(uuid_str(id_), genre) for id_, genre in sorted(genres)])
+
+            logging.info("insert %s movie_genres", len(movie_genres))
+            self._save(
                 cur,
-                "INSERT INTO content.genre_film_work (id, film_work_id, genre) VALUES (%s, %s, %s)",
-                [astuple(movie_genre) for movie_genre in movie_genres],
-                page_size=5_000,
+                "content.genre_film_work",
+                ("id", "film_work_id", "genre"),
+                [(uuid_str(id_), uuid_str(movie_id), genre) for id_, movie_id, genre in movie_genres],
             )
+        with self.instrumentation.stage("commit", rows=len(batch)):
             self.conn.commit()
-            logging.info("movie_genres has been inserted")
+        self.instrumentation.batch_done(len(batch))
+        logging.info("batch has been inserted")
 
     @staticmethod
-    def unify_genres(genres: list[list[Genre]], movie_genres: list[dict]) -> tuple[list[Genre], list[MovieGenres]]:
-        existent_genres = set()
+    def film_work_rows(batch: MovieBatch, created_at: datetime) -> List[tuple]:
+        """Строки content.film_work в порядке FILM_WORK_COLUMNS"""
+        return [(uuid_str(movie.id), *movie[1:], created_at) for movie in batch.movies]
+
+    def _save(self, cur, table: str, columns: tuple, rows: List[tuple], **kwargs):
+        with self.instrumentation.stage(f"insert {table}", rows=len(rows)):
+            self.writer.save(cur, table, columns, rows, **kwargs)
+
+    @staticmethod
+    def unify_genres(
+        movie_genres: Iterable[tuple[bytes, Sequence[Genre]]], index: Optional[IdentityIndex] = None
+    ) -> tuple[list[Genre], list[MovieGenres]]:
+        """
+        :param movie_genres: пары (id фильма, жанры фильма)
+        :param index: индекс уже сохранённых жанров, пополняется новыми жанрами
+        :return: новые жанры и связи фильмов с жанрами
+        """
+        movie_genres = list(movie_genres)
+        if index is None:
+            index = IdentityIndex(table="genre")
+        index.prefetch(genre.genre for _movie_id, genres in movie_genres for genre in genres)
         unified_genres = []
-        unified_movie_genres = []
-        for duplicate_genres in genres:
-            for genre in duplicate_genres:
-                current_genre = genre.genre
-                if current_genre in existent_genres:
-                    continue
-                unified_genres.append(genre)
-                existent_genres.add(current_genre)
-
-        for data in movie_genres:
-            movie_id = data["movie_id"]
-            for movie_genre in data["genres"]:
-                unified_movie_genres.append(
-                    MovieGenres(id=str(uuid.uuid4()), movie_id=movie_id, genre=movie_genre.genre)
-                )
-        return unified_genres, unified_movie_genres
+        unified_movie_genres = {}
+
+        for movie_id, genres in movie_genres:
+            for genre in genres:
+                _genre_id, is_new = index.resolve(genre.genre, genre.id)
+                if is_new:
+                    unified_genres.append(genre)
+                # Повтор жанра в одном фильме даёт ту же связь
+                id_ = make_id("genre_film_work", movie_id, normalize_name(genre.genre))
+                unified_movie_genres.setdefault(id_, MovieGenres(id=id_, movie_id=movie_id, genre=genre.genre))
+        return unified_genres, list(unified_movie_genres.values())
 
     @staticmethod
-    def unify_people(movie_people: list[dict]) -> tuple:
-        existent_people = {}
+    def unify_people(
+        movie_people: Iterable[tuple[bytes, Sequence[Person]]], index: Optional[IdentityIndex] = None
+    ) -> tuple[list[Person], list[MoviePeople]]:
+        """
+        Новые люди добавляются в индекс, а связь с фильмом создаётся для каждого человека,
+        в том числе уже известного: она ссылается на id из индекса.
+        :param movie_people: пары (id фильма, люди фильма)
+        :param index: индекс уже сохранённых людей, пополняется новыми людьми
+        :return: новые люди и связи фильмов с людьми
+        """
+        movie_people = list(movie_people)
+        if index is None:
+            index = IdentityIndex(table="person")
+        index.prefetch(person.name for _movie_id, people in movie_people for person in people)
         unified_people = []
-        unified_movie_people = []
+        unified_movie_people = {}
 
-        for data in movie_people:
-            for person in data["people"]:
-                name = person.name
-                if name in existent_people:
-                    continue
-                unified_movie_people.append(
-                    MoviePeople(id=str(uuid.uuid4()), movie_id=data["movie_id"], person_id=person.id)
-                )
-                unified_people.append(person)
-                existent_people[name] = person.id
+        for movie_id, people in movie_people:
+            for person in people:
+                person_id_, is_new = index.resolve(person.name, person.id)
+                if is_new:
+                    unified_people.append(person)
+                # Один человек может быть в фильме и режиссёром, и сценаристом: связь одна
+                id_ = make_id("person_film_work", movie_id, person_id_)
+                unified_movie_people.setdefault(id_, MoviePeople(id=id_, movie_id=movie_id, person_id=person_id_))
 
-        return unified_people, unified_movie_people
+        return unified_people, list(unified_movie_people.values())
 
 
 class SQLiteLoader:
@@ -172,10 +263,13 @@ class SQLiteLoader:
         FROM movies m
                  LEFT JOIN movie_actors ma on m.id = ma.movie_id
                  LEFT JOIN actors a on ma.actor_id = a.id
+        -- Ограничиваем диапазоном rowid, чтобы таблицу можно было читать шардами
+        WHERE m.rowid BETWEEN :first_rowid AND :last_rowid
         GROUP BY m.id
     )
     -- Получаем список всех фильмов со сценаристами и актёрами
-    SELECT m.id, genre, director, title, plot, imdb_rating, x.actors_ids, x.actors_names,
+    -- rowid идёт первым служебным полем, чтобы знать, до какой строки дошла загрузка
+    SELECT m.rowid, m.id, genre, director, title, plot, imdb_rating, x.actors_ids, x.actors_names,
          /* Этот CASE решает проблему в дизайне таблицы:
         если сценарист всего один, то он записан простой строкой
         в столбце writer и id. В противном случае данные
@@ -190,10 +284,21 @@ class SQLiteLoader:
            END AS writers
     FROM movies m
     LEFT JOIN x ON m.id = x.id
+    WHERE m.rowid BETWEEN :first_rowid AND :last_rowid
+    ORDER BY m.rowid
     """
 
-    def __init__(self, conn: sqlite3.Connection):
+    def __init__(
+        self, conn: sqlite3.Connection, instrumentation: Optional[Instrumentation] = None, columnar: bool = True
+    ):
         self.conn = conn
+        self.instrumentation = instrumentation or Instrumentation()
+        # Преобразовывать пачку по колонкам (transform_columns) или построчно (transform_rows)
+        self.columnar = columnar
+
+    @property
+    def db_path(self) -> str:
+        return self.conn.execute("PRAGMA database_list").fetchone()[2]
 
     def load_writers_names(self) -> dict:
         """
@@ -208,12 +313,12 @@ class SQLiteLoader:
         writers = {}
         # Используем DISTINCT, чтобы отсекать возможные дубли
         for writer in self.conn.execute("""SELECT id, name FROM writers"""):
-            w = Person(id=str(uuid.uuid4()), name=writer[1])
+            w = Person(id=person_id(writer[1]), name=writer[1])
             writers[writer[0]] = w
         return writers
 
     @staticmethod
-    def _transform_row(row: tuple, writers: dict) -> dict:
+    def _transform_row(row: tuple, writers: dict) -> Tuple[Movie, List[Genre], List[Person], List[str]]:
         """
          Основная логика преобразования данных из SQLite во внутреннее
              представление, которое дальше будет уходить в Elasticsearch
@@ -230,7 +335,7 @@ class SQLiteLoader:
 
          :param row: строка из БД
          :param writers: текущие сценаристы
-         :return: подходящая строка для сохранения в Elasticsearch
+         :return: фильм, его жанры, люди (сценаристы, режиссёры и актёры) и роли этих людей
         """
 
         people = []
@@ -242,49 +347,402 @@ class SQLiteLoader:
                 movie_writers.append(writers[writer_id])
                 writers_set.add(writer_id)
 
-        actors = []
-        if row[6] is not None and row[-2] is not None:
-            actors = [
-                Person(str(uuid.uuid4()), name)
-                for _id, name in zip(row[6].split(","), row[-2].split(","))
-                if name != "N/A"
-            ]
+        actors = [Person(person_id(name), name) for _id, name in row_actors(row) if name != "N/A"]
 
-        director = [Person(str(uuid.uuid4()), x.strip()) for x in row[2].split(",")] if row[2] != "N/A" else []
+        director = [Person(person_id(x), x.strip()) for x in row[2].split(",")] if row[2] != "N/A" else []
         people.extend(movie_writers + director + actors)
+        roles = [WRITER] * len(movie_writers) + [DIRECTOR] * len(director) + [ACTOR] * len(actors)
 
-        movie_id = str(uuid.uuid4())
+        movie_id = make_id("film_work", row[0])
         imdb_rating = float(row[5]) if row[5] != "N/A" else None
         description = row[4] if row[4] != "N/A" else None
         movie = Movie(id=movie_id, title=row[3], imdb_rating=imdb_rating, description=description)
 
-        genres = [Genre(str(uuid.uuid4()), genre) for genre in row[1].replace(" ", "").split(",")]
-        movie_genres = {
-            "genres": genres,
-            "movie_id": movie_id,
+        genres = [Genre(genre_id(genre), genre) for genre in row[1].replace(" ", "").split(",")]
+
+        return movie, genres, people, roles
+
+    def transform_batch(self, rows: Iterable[tuple], writers: dict) -> MovieBatch:
+        """Преобразует строки из БД в пачку"""
+        if self.columnar:
+            return self.transform_columns(rows, writers)
+        return self.transform_rows(rows, writers)
+
+    def transform_rows(self, rows: Iterable[tuple], writers: dict) -> MovieBatch:
+        """
+        Построчное преобразование.
+        Отделяет служебный rowid от строки и дополняет результат _transform_row
+        данными для контрольных точек: rowid, id фильма в SQLite и хешем исходной строки.
+        """
+        batch = MovieBatch()
+        for row in rows:
+            rowid, row = row[0], row[1:]
+            movie, genres, people, roles = self._transform_row(row, writers)
+            # Актёры в хеше берутся разобранными, чтобы он не зависел от способа чтения из SQLite.
+            # В строке только id сценаристов, поэтому их имена из таблицы writers добавляются отдельно
+            writer_names = sorted(person.name for person, role in zip(people, roles) if role == WRITER)
+            batch.append(
+                rowid, row[0], row_hash(row[:6] + (row[8], row_actors(row), writer_names)), movie, genres, people, roles
+            )
+        return batch
+
+    @staticmethod
+    def transform_columns(rows: Iterable[tuple], writers: dict) -> MovieBatch:
+        """
+        Преобразование всей пачки по колонкам. Результат совпадает с transform_rows.
+        Строки разбираются на колонки, и каждая колонка обрабатывается целиком:
+         1) 'N/A' в рейтинге и описании заменяется на None через таблицу различных значений колонки;
+         2) строки жанров и режиссёров повторяются между фильмами, поэтому каждая различная строка
+         разбивается по запятым и получает id один раз, а фильмы делят готовые кортежи;
+         3) все различные ячейки writers декодируются одним вызовом json.loads;
+         4) id фильмов, людей и жанров считаются по колонке через make_ids, людей и жанров —
+         один раз на различное имя в пачке, а не на каждое появление.
+        """
+        rows = list(rows)
+        batch = MovieBatch()
+        if not rows:
+            return batch
+        (
+            rowids,
+            ids,
+            genre_cells,
+            director_cells,
+            titles,
+            plots,
+            ratings,
+            actors_ids,
+            actors_names,
+            writer_cells,
+        ) = zip(*rows)
+
+        ratings_map = {rating: None if rating == "N/A" else float(rating) for rating in set(ratings)}
+        imdb_ratings = [ratings_map[rating] for rating in ratings]
+        descriptions = [None if plot == "N/A" else plot for plot in plots]
+
+        genres_map = {cell: cell.replace(" ", "").split(",") for cell in set(genre_cells)}
+        genre_names = list({genre for cell_genres in genres_map.values() for genre in cell_genres})
+        genres_by_name = {
+            genre: Genre(id_, genre)
+            for genre, id_ in zip(genre_names, make_ids("genre", map(normalize_name, genre_names)))
         }
-        movie_people = {
-            "people": people,
-            "movie_id": movie_id,
+        genres_map = {
+            cell: tuple(genres_by_name[genre] for genre in cell_genres) for cell, cell_genres in genres_map.items()
         }
 
-        return {
-            "movie": movie,
-            "genres": genres,
-            "movie_genres": movie_genres,
-            "movie_people": movie_people,
+        directors_map = {
+            cell: () if cell == "N/A" else [name.strip() for name in cell.split(",")] for cell in set(director_cells)
         }
+        actors = [parse_actors(ids_, names) for ids_, names in zip(actors_ids, actors_names)]
+        people_names = list(
+            {name for cell_directors in directors_map.values() for name in cell_directors}.union(
+                name for movie_actors in actors for _id, name in movie_actors if name != "N/A"
+            )
+        )
+        people_map = {
+            name: Person(id_, name)
+            for name, id_ in zip(people_names, make_ids("person", map(normalize_name, people_names)))
+        }
+        directors_map = {
+            cell: tuple(people_map[name] for name in cell_directors) for cell, cell_directors in directors_map.items()
+        }
+
+        distinct_writer_cells = list(set(writer_cells))
+        decoded = json.loads("[" + ",".join(distinct_writer_cells) + "]")
+        writers_map = {}
+        writer_names = {}
+        for cell, cell_writers in zip(distinct_writer_cells, decoded):
+            movie_writers = {}
+            for writer in cell_writers:
+                writer_id = writer["id"]
+                if writers[writer_id].name != "N/A":
+                    movie_writers.setdefault(writer_id, writers[writer_id])
+            writers_map[cell] = tuple(movie_writers.values())
+            writer_names[cell] = sorted(writer.name for writer in writers_map[cell])
+
+        movie_ids = make_ids("film_work", map(str, ids))
+
+        for index, row in enumerate(rows):
+            movie_writers = writers_map[writer_cells[index]]
+            directors = directors_map[director_cells[index]]
+            movie_actors = [people_map[name] for _id, name in actors[index] if name != "N/A"]
+            people = movie_writers + directors + tuple(movie_actors)
+            roles = (WRITER,) * len(movie_writers) + (DIRECTOR,) * len(directors) + (ACTOR,) * len(movie_actors)
+            movie = Movie(
+                id=movie_ids[index],
+                title=titles[index],
+                imdb_rating=imdb_ratings[index],
+                description=descriptions[index],
+            )
+            batch.append(
+                rowids[index],
+                ids[index],
+                row_hash(row[1:7] + (writer_cells[index], actors[index], writer_names[writer_cells[index]])),
+                movie,
+                genres_map[genre_cells[index]],
+                people,
+                roles,
+            )
+        return batch
 
-    def load_movies(self):
+    def read_rows(self, first_rowid: int = 0, last_rowid: int = FULL_RANGE["last_rowid"]) -> Iterator[tuple]:
+        """Строки фильмов из диапазона rowid в порядке rowid"""
+        return self.conn.execute(self.SQL, {"first_rowid": first_rowid, "last_rowid": last_rowid})
+
+    def load_movies(self, batch_size: int = BATCH_SIZE, workers: int = 1, first_rowid: int = 0) -> Iterator[MovieBatch]:
         """
         Основной метод для ETL.
+        Отдаёт преобразованные строки пачками по batch_size штук,
+        поэтому потребление памяти зависит от размера пачки, а не от размера базы.
+        При workers > 1 преобразование выполняется параллельно в нескольких процессах,
+        порядок и состав пачек при этом совпадают с последовательным режимом.
+        first_rowid позволяет продолжить прерванную загрузку с контрольной точки.
+        """
+        with self.instrumentation.stage("load_writers") as measurement:
+            writers = self.load_writers_names()
+            measurement.rows = len(writers)
+
+        if workers > 1:
+            yield from self._load_movies_parallel(writers, batch_size, workers, first_rowid)
+            return
+
+        source_rows = self.read_rows(first_rowid)
+        while True:
+            with self.instrumentation.stage("extract") as measurement:
+                rows = list(islice(source_rows, batch_size))
+                measurement.rows = len(rows)
+            if not rows:
+                break
+            with self.instrumentation.stage("transform", rows=len(rows)):
+                batch = self.transform_batch(rows, writers)
+            yield batch
+
+    def split_rowid_ranges(self, batch_size: int, first_rowid: int = 0) -> Iterator[Tuple[int, int]]:
+        """
+        Делит таблицу movies на диапазоны rowid по batch_size строк.
+        Читается только rowid, поэтому это дешёвый проход по первичному ключу.
+        """
+        cursor = self.conn.execute("SELECT rowid FROM movies WHERE rowid >= ? ORDER BY rowid", (first_rowid,))
+        while True:
+            rowids = cursor.fetchmany(batch_size)
+            if not rowids:
+                break
+            yield rowids[0][0], rowids[-1][0]
+
+    def _load_movies_parallel(
+        self, writers: dict, batch_size: int, workers: int, first_rowid: int = 0, **options
+    ) -> Iterator[MovieBatch]:
+        """
+        Каждый процесс открывает своё read-only соединение и преобразует свой диапазон rowid.
+        Результаты отдаются строго в порядке диапазонов. В работе одновременно не больше
+        2 * workers диапазонов, поэтому память остаётся ограниченной, даже если запись отстаёт.
+        :param options: дополнительные аргументы загрузчика в процессах-воркерах
+        """
+        db_path = self.db_path
+        ranges = self.split_rowid_ranges(batch_size, first_rowid)
+        pending = deque()
+        options = {"columnar": self.columnar, **options}
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(type(self), db_path, writers, options)
+        ) as pool:
+            for rowid_range in ranges:
+                pending.append(pool.submit(_transform_range, rowid_range))
+                if len(pending) >= 2 * workers:
+                    yield self._wait_range(pending.popleft())
+            while pending:
+                yield self._wait_range(pending.popleft())
+
+    def _wait_range(self, future) -> MovieBatch:
+        # Чтение и преобразование идут в воркерах, здесь замеряется только ожидание результата
+        with self.instrumentation.stage("extract+transform (parallel wait)") as measurement:
+            batch = future.result()
+            measurement.rows = len(batch)
+        return batch
+
+
+class IndexedSQLiteLoader(SQLiteLoader):
+    """
+    Чтение без group_concat.
+    Фильмы и связи с актёрами читаются двумя курсорами, упорядоченными по rowid фильма,
+    и склеиваются в Python. Имена актёров не склеиваются в строку и не разбираются обратно,
+    поэтому запятые в именах не ломают разбор, а GROUP BY по всей таблице не нужен.
+    Файл базы читается с отображением в память.
+    Если в файле нет индекса movie_actors по movie_id, строится временный покрывающий индекс:
+    он живёт в temp-схеме соединения и не меняет сам файл. temp-схему видит только своё
+    соединение, поэтому для процессов-воркеров копия связей с индексом строится один раз
+    во временном файле links_path, который воркеры подключают только на чтение.
+    """
+
+    MOVIES_SQL = """
+    SELECT m.rowid, m.id, genre, director, title, plot, imdb_rating,
+           -- См. SQLiteLoader.SQL: одиночного сценариста приводим к списку JSON
+           CASE
+            WHEN m.writers = '' THEN '[{"id": "' || m.writer || '"}]'
+            ELSE m.writers
+           END AS writers
+    FROM movies m
+    WHERE m.rowid BETWEEN :first_rowid AND :last_rowid
+    ORDER BY m.rowid
+    """
+
+    ACTORS_SQL = """
+    SELECT m.rowid, a.id, a.name
+    FROM movies m
+    JOIN {links} ma ON ma.movie_id = m.id
+    JOIN actors a ON a.id = ma.actor_id
+    WHERE m.rowid BETWEEN :first_rowid AND :last_rowid
+    -- Тот же порядок актёров внутри фильма, что даёт group_concat в SQLiteLoader.SQL
+    ORDER BY m.rowid, ma.actor_id
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        instrumentation: Optional[Instrumentation] = None,
+        columnar: bool = True,
+        links_path: Optional[str] = None,
+    ):
+        super().__init__(conn, instrumentation, columnar)
+        self.conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        self.links_path = links_path
+        # Связи готовятся при первом чтении: при параллельной загрузке строки читают только воркеры
+        self._actors_sql: Optional[str] = None
+
+    @property
+    def actors_sql(self) -> str:
+        if self._actors_sql is None:
+            self._actors_sql = self._prepare_links()
+        return self._actors_sql
+
+    def _has_links_index(self) -> bool:
+        return (
+            self.conn.execute(
+                """
+                SELECT 1
+                FROM pragma_index_list('movie_actors') il
+                JOIN pragma_index_info(il.name) ii
+                WHERE ii.seqno = 0 AND ii.name = 'movie_id'
+                """
+            ).fetchone()
+            is not None
+        )
+
+    def _prepare_links(self) -> str:
+        if self._has_links_index():
+            return self.ACTORS_SQL.format(links="main.movie_actors")
+        if self.links_path is not None:
+            self.conn.execute("ATTACH DATABASE ? AS etl_links", (self.links_path,))
+            return self.ACTORS_SQL.format(links="etl_links.movie_actors")
+
+        logging.info("movie_actors has no movie_id index, build temporary one")
+        self.conn.executescript(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS etl_movie_actors AS
+                SELECT movie_id, actor_id FROM main.movie_actors;
+            CREATE INDEX IF NOT EXISTS temp.etl_movie_actors_movie
+                ON etl_movie_actors (movie_id, actor_id);
+            """
+        )
+        return self.ACTORS_SQL.format(links="temp.etl_movie_actors")
+
+    def _load_movies_parallel(
+        self, writers: dict, batch_size: int, workers: int, first_rowid: int = 0, **options
+    ) -> Iterator[MovieBatch]:
+        if self.links_path is not None or self._has_links_index():
+            yield from super()._load_movies_parallel(writers, batch_size, workers, first_rowid, **options)
+            return
+
+        with tempfile.TemporaryDirectory() as directory:
+            links_path = os.path.join(directory, "movie_actors.sqlite")
+            self._build_links_file(links_path)
+            yield from super()._load_movies_parallel(
+                writers, batch_size, workers, first_rowid, links_path=links_path, **options
+            )
+
+    def _build_links_file(self, links_path: str):
+        logging.info("movie_actors has no movie_id index, build one for all workers")
+        with closing(sqlite3.connect(f"file:{links_path}", uri=True)) as links:
+            links.execute("ATTACH DATABASE ? AS source", (f"file:{self.db_path}?mode=ro",))
+            links.executescript(
+                """
+                CREATE TABLE movie_actors AS SELECT movie_id, actor_id FROM source.movie_actors;
+                CREATE INDEX movie_actors_movie ON movie_actors (movie_id, actor_id);
+                """
+            )
+
+    def read_rows(self, first_rowid: int = 0, last_rowid: int = FULL_RANGE["last_rowid"]) -> Iterator[tuple]:
+        """
+        Строки в том же формате, что у SQLiteLoader, но вместо строк group_concat
+        в actors_ids и actors_names лежат кортежи.
         """
-        records = []
+        params = {"first_rowid": first_rowid, "last_rowid": last_rowid}
+        movies = self.conn.execute(self.MOVIES_SQL, params)
+        links = self.conn.execute(self.actors_sql, params)
+        link = next(links, None)
+
+        for movie in movies:
+            rowid = movie[0]
+            while link is not None and link[0] < rowid:
+                link = next(links, None)
+            ids, names = [], []
+            while link is not None and link[0] == rowid:
+                ids.append(str(link[1]))
+                names.append(link[2])
+                link = next(links, None)
+            yield movie[:7] + (tuple(ids) or None, tuple(names) or None, movie[7])
+
+
+LOADERS = {
+    "group_concat": SQLiteLoader,
+    "indexed": IndexedSQLiteLoader,
+}
+
+# Способы преобразования пачек, см. SQLiteLoader.transform_batch
+TRANSFORMS = ("columnar", "rows")
+
+# 256 МБ отображаемого в память файла: чтение идёт без лишнего копирования через page cache SQLite
+MMAP_SIZE = 256 * 2**20
+
+
+def open_readonly(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    return conn
+
+
+# Состояние процесса-воркера для параллельного преобразования
+_worker_loader: Optional[SQLiteLoader] = None
+_worker_writers: dict = {}
+
+
+def _init_worker(loader_class: type, db_path: str, writers: dict, options: dict):
+    global _worker_loader, _worker_writers
+    _worker_loader = loader_class(open_readonly(db_path), **options)
+    _worker_writers = writers
+
+
+def _transform_range(rowid_range: Tuple[int, int]) -> MovieBatch:
+    first_rowid, last_rowid = rowid_range
+    return _worker_loader.transform_batch(_worker_loader.read_rows(first_rowid, last_rowid), _worker_writers)
+
+
+def row_actors(row: tuple) -> List[Tuple[str, str]]:
+    """
+    Пары (id, имя) актёров строки.
+    SQLiteLoader отдаёт их строками group_concat через запятую,
+    IndexedSQLiteLoader сразу кортежами.
+    """
+    return parse_actors(row[6], row[7])
+
 
-        writers = self.load_writers_names()
+def parse_actors(ids, names) -> List[Tuple[str, str]]:
+    if ids is None or names is None:
+        return []
+    if isinstance(ids, str):
+        return list(zip(ids.split(","), names.split(",")))
+    return list(zip(ids, names))
 
-        for row in self.conn.execute(self.SQL):
-            transformed_row = self._transform_row(row, writers)
-            records.append(transformed_row)
 
-        return records
+def row_hash(row: tuple) -> bytes:
+    """Хеш содержимого строки из SQLite, по нему определяем изменившиеся фильмы"""
+    return hashlib.blake2b(json.dumps(row, ensure_ascii=False).encode(), digest_size=16).digest()
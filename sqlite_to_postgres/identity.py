@@ -0,0 +1,144 @@
+import logging
+import sqlite3
+from typing import Iterable, Optional, Tuple
+
+from sqlite_to_postgres.records import normalize_name
+
+# Сколько имён держать в памяти до сброса на диск, если задан spill_path
+MAX_MEMORY_ITEMS = 1_000_000
+
+
+class IdentityIndex:
+    """
+    Индекс идентичности: нормализованное имя человека или жанра -> 16 байт id.
+    Живёт между пачками и прогревается уже сохранёнными в Postgres строками,
+    поэтому один и тот же человек получает один id во всех пачках и прогонах,
+    даже если в Postgres он был заведён с другим id.
+
+    По умолчанию индекс целиком хранится в словаре. Для очень больших каталогов
+    задаётся spill_path: когда в памяти набирается max_memory_items имён,
+    они сбрасываются в файл SQLite, а в памяти остаются только новые имена
+    и имена текущей пачки, подгруженные одним запросом через prefetch.
+    Так поиск внутри пачки остаётся поиском по словарю.
+
+    parent позволяет завести индекс поверх другого: имена родителя находятся,
+    а новые имена сохраняются только в дочернем индексе.
+    """
+
+    def __init__(
+        self,
+        spill_path: Optional[str] = None,
+        table: str = "identity",
+        max_memory_items: int = MAX_MEMORY_ITEMS,
+        parent: Optional["IdentityIndex"] = None,
+    ):
+        self.spill_path = spill_path
+        self.table = table
+        self.max_memory_items = max_memory_items
+        self.parent = parent
+        # Имена, ещё не сброшенные на диск
+        self._ids = {}
+        # Имена текущей пачки, подгруженные с диска; None — имени на диске нет
+        self._cache = {}
+        self._spilled = 0
+        self._disk: Optional[sqlite3.Connection] = None
+
+    def __len__(self) -> int:
+        return len(self._ids) + self._spilled
+
+    def __contains__(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def get(self, name: str) -> Optional[bytes]:
+        key = normalize_name(name)
+        id_ = self._ids.get(key)
+        if id_ is None and key in self._cache:
+            id_ = self._cache[key]
+        elif id_ is None and self._disk is not None:
+            row = self._disk.execute(f"SELECT id FROM {self.table} WHERE name = ?", (key,)).fetchone()  # nosec
+            id_ = row[0] if row else None
+        if id_ is None and self.parent is not None:
+            id_ = self.parent.get(name)
+        return id_
+
+    def add(self, name: str, id_: bytes):
+        """Добавляет имя. Если имя уже есть в памяти или на диске, остаётся первый id"""
+        key = normalize_name(name)
+        # Копия сброшенного имени в памяти заслонила бы id с диска и посчиталась бы в len дважды
+        if key in self._ids or self._on_disk(key):
+            return
+        self._ids[key] = id_
+        if self.spill_path is not None and len(self._ids) >= self.max_memory_items:
+            self.spill()
+
+    def update(self, items: Iterable[Tuple[str, bytes]]):
+        """Массово добавляет пары (имя, id), например прочитанные из Postgres"""
+        for name, id_ in items:
+            self.add(name, id_)
+
+    def resolve(self, name: str, id_: bytes) -> Tuple[bytes, bool]:
+        """
+        :param id_: id, который получит имя, если его ещё нет в индексе
+        :return: id имени и признак того, что имя встретилось впервые
+        """
+        known = self.get(name)
+        if known is not None:
+            return known, False
+        self.add(name, id_)
+        return id_, True
+
+    def prefetch(self, names: Iterable[str]):
+        """Одним запросом подгружает с диска имена пачки, чтобы искать их в памяти"""
+        names = {normalize_name(name) for name in names}
+        if self.parent is not None:
+            self.parent.prefetch(names)
+        if self._disk is None:
+            return
+        keys = list(names - self._ids.keys())
+        self._cache = dict.fromkeys(keys)
+        # Ограничение SQLite на количество параметров в запросе
+        for start in range(0, len(keys), 999):
+            chunk = keys[start : start + 999]
+            placeholders = ", ".join(["?"] * len(chunk))
+            self._cache.update(
+                self._disk.execute(f"SELECT name, id FROM {self.table} WHERE name IN ({placeholders})", chunk)  # nosec
+            )
+
+    def spill(self):
+        """Сбрасывает имена из памяти в файл SQLite"""
+        if self._disk is None:
+            # Индексом пользуется один поток, но не обязательно тот, который его создал
+            self._disk = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self._disk.executescript(
+                f"""
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                DROP TABLE IF EXISTS {self.table};
+                CREATE TABLE {self.table} (name TEXT PRIMARY KEY, id BLOB NOT NULL) WITHOUT ROWID;
+                """
+            )
+        with self._disk:
+            cursor = self._disk.executemany(
+                f"INSERT OR IGNORE INTO {self.table} (name, id) VALUES (?, ?)", self._ids.items()
+            )
+        logging.info("identity index %s: spill %s names to %s", self.table, len(self._ids), self.spill_path)
+        # Считаются только вставленные строки: имя, уже лежащее на диске, не добавляется
+        self._spilled += cursor.rowcount
+        self._ids = {}
+        self._cache = {}
+
+    def _on_disk(self, key: str) -> bool:
+        if key in self._cache:
+            return self._cache[key] is not None
+        if self._disk is None:
+            return False
+        return self._disk.execute(f"SELECT 1 FROM {self.table} WHERE name = ?", (key,)).fetchone() is not None  # nosec
+
+    def scoped(self) -> "IdentityIndex":
+        """Индекс поверх этого: новые имена не попадают в этот индекс"""
+        return IdentityIndex(table=self.table, parent=self)
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
@@ -0,0 +1,205 @@
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+# Таблицы связей: на них приходится больше всего строк загрузки
+BULK_TABLES = ("content.person_film_work", "content.genre_film_work")
+
+# Снятые на время загрузки определения. Хранятся в Postgres и удаляются в одной транзакции
+# с восстановлением, поэтому после падения загрузки их можно восстановить при следующем запуске
+SAVED_DDL_TABLE = "content.etl_dropped_ddl"
+
+INDEX = "index"
+FOREIGN_KEY = "foreign_key"
+
+# Вторичные индексы: без первичного ключа и индексов, на которых держатся ограничения.
+# Первичный ключ нужен для ON CONFLICT (id), уникальные ограничения — для целостности данных
+SECONDARY_INDEXES_SQL = """
+SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+WHERE i.indrelid = %s::regclass
+  AND NOT i.indisprimary
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid)
+ORDER BY 1
+"""
+
+FOREIGN_KEYS_SQL = """
+SELECT conname, pg_get_constraintdef(oid)
+FROM pg_constraint
+WHERE conrelid = %s::regclass AND contype = 'f'
+ORDER BY conname
+"""
+
+PARTITIONED_SQL = "SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass"
+
+# (таблица, вид, имя, определение)
+Definition = Tuple[str, str, str, str]
+
+
+class SchemaMismatch(Exception):
+    """Индексы и ограничения после восстановления не совпадают с теми, что были до загрузки"""
+
+
+class BulkLoadIndexes:
+    """
+    Снимает вторичные индексы и внешние ключи таблиц на время массовой загрузки
+    и восстанавливает их после неё: построить индекс один раз по всем строкам
+    дешевле, чем обновлять его на каждую вставленную строку.
+
+        with BulkLoadIndexes(pg_conn, maintenance_workers=4):
+            saver.save_all_data(batches)
+
+    Перед снятием определения запоминаются через pg_get_indexdef и pg_get_constraintdef
+    и сохраняются в SAVED_DDL_TABLE той же транзакцией, что и DROP.
+    Восстановление идёт и после ошибки загрузки. Внешние ключи добавляются как NOT VALID
+    и затем проверяются VALIDATE CONSTRAINT, который не блокирует запись в таблицу.
+    Секционированной таблице Postgres не даёт добавить ключ NOT VALID, её ключи
+    проверяются сразу при добавлении, а не прошедший проверку ключ ждёт следующего запуска.
+    Индексы строятся с max_parallel_maintenance_workers, затем таблицы анализируются.
+    В конце определения сравниваются с исходными, при расхождении — SchemaMismatch.
+    """
+
+    def __init__(
+        self,
+        conn: _connection,
+        tables: Sequence[str] = BULK_TABLES,
+        maintenance_workers: Optional[int] = None,
+        maintenance_work_mem: Optional[str] = None,
+        analyze: bool = True,
+    ):
+        self.conn = conn
+        self.tables = tables
+        self.maintenance_workers = maintenance_workers
+        self.maintenance_work_mem = maintenance_work_mem
+        self.analyze = analyze
+        self.before: List[Definition] = []
+
+    def __enter__(self):
+        self.drop()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            logging.warning("load failed, restore indexes and constraints before exit")
+            self.conn.rollback()
+        self.rebuild()
+        if exc_type is None:
+            self.verify()
+
+    def snapshot(self, cur) -> List[Definition]:
+        definitions = []
+        for table in self.tables:
+            cur.execute(SECONDARY_INDEXES_SQL, (table,))
+            definitions.extend((table, INDEX, name, definition) for name, definition in cur.fetchall())
+            cur.execute(FOREIGN_KEYS_SQL, (table,))
+            definitions.extend((table, FOREIGN_KEY, name, definition) for name, definition in cur.fetchall())
+        return sorted(definitions)
+
+    def drop(self):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {SAVED_DDL_TABLE} (
+                    table_name text NOT NULL,
+                    kind text NOT NULL,
+                    name text NOT NULL,
+                    definition text NOT NULL,
+                    PRIMARY KEY (table_name, name)
+                )
+                """
+            )
+            saved = self._saved(cur)
+            if saved:
+                # Прошлая загрузка упала, не восстановив схему: сначала возвращаем её
+                logging.warning("found %s definitions left by an interrupted load, restore them", len(saved))
+                self.conn.commit()
+                self.rebuild()
+        with self.conn.cursor() as cur:
+            self.before = self.snapshot(cur)
+            cur.executemany(
+                f"INSERT INTO {SAVED_DDL_TABLE} (table_name, kind, name, definition) VALUES (%s, %s, %s, %s)",
+                self.before,
+            )
+            for table, kind, name, _definition in self.before:
+                if kind == FOREIGN_KEY:
+                    cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+                else:
+                    cur.execute(f"DROP INDEX {name}")
+        self.conn.commit()
+        logging.info(
+            "bulk load: dropped %s indexes and %s foreign keys",
+            sum(kind == INDEX for _table, kind, _name, _definition in self.before),
+            sum(kind == FOREIGN_KEY for _table, kind, _name, _definition in self.before),
+        )
+
+    def rebuild(self):
+        with self.conn.cursor() as cur:
+            saved = self._saved(cur)
+            tables = sorted({table for table, _kind, _name, _definition in saved})
+            partitioned = {table for table in tables if self._partitioned(cur, table)}
+            restored = []
+            if self.maintenance_workers is not None:
+                cur.execute("SET LOCAL max_parallel_maintenance_workers = %s", (self.maintenance_workers,))
+            if self.maintenance_work_mem is not None:
+                cur.execute("SET LOCAL maintenance_work_mem = %s", (self.maintenance_work_mem,))
+            for table, kind, name, definition in saved:
+                if kind == INDEX:
+                    logging.info("bulk load: create index %s", name)
+                    # Для индекса секционированной таблицы pg_get_indexdef пишет ON ONLY,
+                    # а такой индекс не создаётся на секциях
+                    cur.execute(definition.replace(" ON ONLY ", " ON ", 1))
+                elif table in partitioned:
+                    # Ключ проверяется сразу, и строки, которые его нарушают, откатили бы всё восстановление.
+                    # Такой ключ остаётся в SAVED_DDL_TABLE до следующего запуска, а расхождение покажет verify
+                    logging.info("bulk load: add foreign key %s", name)
+                    cur.execute("SAVEPOINT partitioned_foreign_key")
+                    try:
+                        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+                    except psycopg2.Error:
+                        cur.execute("ROLLBACK TO SAVEPOINT partitioned_foreign_key")
+                        logging.exception("bulk load: foreign key %s is not restored", name)
+                        continue
+                else:
+                    cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID")
+                restored.append((table, name))
+            cur.executemany(f"DELETE FROM {SAVED_DDL_TABLE} WHERE table_name = %s AND name = %s", restored)
+        self.conn.commit()
+
+        # Проверка внешних ключей в отдельных транзакциях не блокирует запись в таблицы.
+        # Если данные её не пройдут, транзакция откатывается, ключ остаётся NOT VALID,
+        # остальные ключи всё равно проверяются, а расхождение покажет verify
+        with self.conn.cursor() as cur:
+            for table, kind, name, _definition in saved:
+                if kind == FOREIGN_KEY and table not in partitioned:
+                    logging.info("bulk load: validate foreign key %s", name)
+                    try:
+                        cur.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+                    except psycopg2.Error:
+                        self.conn.rollback()
+                        logging.exception("bulk load: foreign key %s stays NOT VALID", name)
+                        continue
+                    self.conn.commit()
+            if self.analyze:
+                for table in tables:
+                    cur.execute(f"ANALYZE {table}")
+        self.conn.commit()
+
+    def verify(self):
+        """Сравнивает индексы и ограничения таблиц с теми, что были до загрузки"""
+        with self.conn.cursor() as cur:
+            after = self.snapshot(cur)
+        if after != self.before:
+            missing = sorted(set(self.before) - set(after))
+            extra = sorted(set(after) - set(self.before))
+            raise SchemaMismatch(f"DDL differs after bulk load. Missing: {missing}. Unexpected: {extra}")
+        logging.info("bulk load: %s indexes and constraints verified", len(after))
+
+    def _partitioned(self, cur, table: str) -> bool:
+        cur.execute(PARTITIONED_SQL, (table,))
+        return cur.fetchone()[0]
+
+    def _saved(self, cur) -> List[Definition]:
+        cur.execute(f"SELECT table_name, kind, name, definition FROM {SAVED_DDL_TABLE}")
+        return [tuple(row) for row in cur.fetchall()]
@@ -0,0 +1,143 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Iterator, List, Optional
+
+
+@dataclass
+class Measurement:
+    """Текущий замер стадии. Количество строк можно указать уже внутри замера"""
+
+    rows: int = 0
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    rows: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    peak_memory: int = 0
+    # Длительность каждого вызова, то есть каждой пачки
+    latencies: List[float] = field(default_factory=list)
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            "calls": self.calls,
+            "rows": self.rows,
+            "wall_seconds": round(self.wall, 3),
+            "cpu_seconds": round(self.cpu, 3),
+            "rows_per_sec": round(self.rows / self.wall, 1) if self.wall else None,
+            "latency_ms": {
+                "p50": _percentile_ms(latencies, 0.5),
+                "p95": _percentile_ms(latencies, 0.95),
+                "max": _percentile_ms(latencies, 1),
+            },
+            "peak_memory_mb": round(self.peak_memory / 2**20, 2) if self.peak_memory else None,
+        }
+
+
+def _percentile_ms(latencies: List[float], percentile: float) -> Optional[float]:
+    if not latencies:
+        return None
+    index = min(len(latencies) - 1, int(len(latencies) * percentile))
+    return round(latencies[index] * 1000, 2)
+
+
+class Instrumentation:
+    """
+    Замеры стадий ETL: время (wall и CPU), количество строк, время каждой пачки
+    и пиковая память по tracemalloc.
+    tracemalloc заметно замедляет работу, поэтому память замеряется только при trace_memory=True.
+    При progress_interval раз в указанное число секунд в лог пишется прогресс и скорость загрузки.
+    Замеры можно вести из нескольких потоков, но пиковая память tracemalloc
+    в этом случае общая для всего процесса.
+    """
+
+    def __init__(self, trace_memory: bool = False, progress_interval: Optional[float] = None):
+        self.trace_memory = trace_memory
+        self.progress_interval = progress_interval
+        self.stages = defaultdict(StageStats)
+        self.movies = 0
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self._started_cpu = time.process_time()
+        self._last_progress = self._started
+        self._lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0) -> Iterator[Measurement]:
+        """
+        Замеряет один вызов стадии:
+
+            with instrumentation.stage("extract") as measurement:
+                rows = cursor.fetchmany(batch_size)
+                measurement.rows = len(rows)
+        """
+        measurement = Measurement(rows)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        yield measurement
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+        with self._lock:
+            stats = self.stages[name]
+            stats.calls += 1
+            stats.rows += measurement.rows
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.latencies.append(wall)
+            if tracing:
+                stats.peak_memory = max(stats.peak_memory, tracemalloc.get_traced_memory()[1])
+
+    def batch_done(self, movies: int):
+        """Отмечает сохранённую пачку фильмов и при необходимости пишет прогресс в лог"""
+        with self._lock:
+            self.movies += movies
+            if self.progress_interval is None:
+                return
+            now = time.perf_counter()
+            if now - self._last_progress < self.progress_interval:
+                return
+            self._last_progress = now
+        logging.info("progress: %s movies, %.1f movies/sec", self.movies, self.movies / (now - self._started))
+
+    def report(self) -> dict:
+        wall = time.perf_counter() - self._started
+        return {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "wall_seconds": round(wall, 3),
+            "cpu_seconds": round(time.process_time() - self._started_cpu, 3),
+            "movies": self.movies,
+            "movies_per_sec": round(self.movies / wall, 1) if wall else None,
+            "stages": {name: stats.as_dict() for name, stats in self.stages.items()},
+        }
+
+    def write_report(self, path: str):
+        with open(path, "w") as report_file:
+            json.dump(self.report(), report_file, indent=2, ensure_ascii=False)
+        logging.info("run report has been written to %s", path)
+
+    def log_report(self):
+        for name, stats in self.report()["stages"].items():
+            logging.info(
+                "%s: %s rows in %ss (cpu %ss, %s rows/sec, p95 %sms)",
+                name,
+                stats["rows"],
+                stats["wall_seconds"],
+                stats["cpu_seconds"],
+                stats["rows_per_sec"],
+                stats["latency_ms"]["p95"],
+            )
@@ -1,22 +1,291 @@
+import argparse
 import sqlite3
+from contextlib import closing, nullcontext
+from typing import Callable, Optional
 
 import psycopg2
 from psycopg2.extensions import connection as _connection
 from psycopg2.extras import DictCursor
 
-from sqlite_to_postgres.etl import PostgresSaver, SQLiteLoader
+from sqlite_to_postgres.checkpoint import CheckpointStore
+from sqlite_to_postgres.etl import BATCH_SIZE, LOADERS, TRANSFORMS, PostgresSaver
+from sqlite_to_postgres.identity import MAX_MEMORY_ITEMS, IdentityIndex
+from sqlite_to_postgres.indexes import BulkLoadIndexes
+from sqlite_to_postgres.instrumentation import Instrumentation
+from sqlite_to_postgres.pipeline import QUEUE_SIZE, Pipeline
+from sqlite_to_postgres.search import MAX_CHUNK_BYTES, SearchExporter
+from sqlite_to_postgres.staging import StagingSaver
+from sqlite_to_postgres.writers import WRITERS, ExecuteBatchWriter, get_writer
 
 
-def load_from_sqlite(connection: sqlite3.Connection, pg_conn: _connection):
-    """Основной метод загрузки данных из SQLite в Postgres"""
-    postgres_saver = PostgresSaver(pg_conn)
-    sqlite_loader = SQLiteLoader(connection)
+def load_from_sqlite(
+    connection: sqlite3.Connection,
+    pg_conn: _connection,
+    engine: str = ExecuteBatchWriter.name,
+    batch_size: int = BATCH_SIZE,
+    workers: int = 1,
+    checkpoint_path: Optional[str] = None,
+    upsert: bool = True,
+    instrumentation: Optional[Instrumentation] = None,
+    extraction: str = "group_concat",
+    pipeline: bool = False,
+    writer_threads: int = 1,
+    queue_size: int = QUEUE_SIZE,
+    connect: Optional[Callable[[], _connection]] = None,
+    identity_spill: Optional[str] = None,
+    identity_memory: int = MAX_MEMORY_ITEMS,
+    staging: bool = False,
+    bulk_indexes: bool = False,
+    maintenance_workers: Optional[int] = None,
+    export_path: Optional[str] = None,
+    export_gzip: bool = False,
+    export_chunk_bytes: int = MAX_CHUNK_BYTES,
+    transform: str = "columnar",
+):
+    """
+    Основной метод загрузки данных из SQLite в Postgres.
+    С checkpoint_path загрузка продолжается с последней контрольной точки,
+    а повторный прогон обрабатывает только новые и изменившиеся фильмы.
+    С upsert строки пишутся через INSERT ... ON CONFLICT и повторный прогон не создаёт дублей.
+    С pipeline чтение, преобразование и запись идут одновременно в отдельных потоках.
+    Каждому дополнительному потоку записи connect открывает своё соединение с Postgres.
+    С identity_spill индексы людей и жанров сбрасываются в этот файл, когда в памяти
+    набирается identity_memory имён.
+    Со staging данные сначала копируются в UNLOGGED-таблицы и переносятся в content.*
+    одной транзакцией в конце загрузки.
+    С bulk_indexes вторичные индексы и внешние ключи таблиц связей снимаются на время загрузки
+    и строятся заново после неё с maintenance_workers параллельными процессами Postgres.
+    С export_path в том же проходе по SQLite в этот каталог выгружаются документы фильмов
+    для Elasticsearch _bulk файлами не больше export_chunk_bytes.
+    transform выбирает преобразование пачек: по колонкам (columnar) или построчно (rows).
+    """
+    if staging and checkpoint_path:
+        raise ValueError("Staging load is not compatible with checkpoints")
+    if staging and writer_threads > 1:
+        raise ValueError("Staging load supports a single writer thread")
+    instrumentation = instrumentation or Instrumentation()
+    exporter = (
+        SearchExporter(
+            export_path,
+            max_bytes=export_chunk_bytes,
+            compress=export_gzip,
+            instrumentation=instrumentation,
+            conn=pg_conn,
+        )
+        if export_path
+        else None
+    )
+    indexes = BulkLoadIndexes(pg_conn, maintenance_workers=maintenance_workers) if bulk_indexes else nullcontext()
+    with indexes:
+        if pipeline:
+            return _load_pipelined(
+                connection,
+                pg_conn,
+                engine=engine,
+                batch_size=batch_size,
+                workers=workers,
+                checkpoint_path=checkpoint_path,
+                upsert=upsert,
+                instrumentation=instrumentation,
+                extraction=extraction,
+                writer_threads=writer_threads,
+                queue_size=queue_size,
+                connect=connect,
+                identity_spill=identity_spill,
+                identity_memory=identity_memory,
+                staging=staging,
+                exporter=exporter,
+                columnar=transform == "columnar",
+            )
+        return _load_serial(
+            connection,
+            pg_conn,
+            engine=engine,
+            batch_size=batch_size,
+            workers=workers,
+            checkpoint_path=checkpoint_path,
+            upsert=upsert,
+            instrumentation=instrumentation,
+            extraction=extraction,
+            identity_spill=identity_spill,
+            identity_memory=identity_memory,
+            staging=staging,
+            exporter=exporter,
+            columnar=transform == "columnar",
+        )
 
-    data = sqlite_loader.load_movies()
-    postgres_saver.save_all_data(data)
+
+def _load_serial(
+    connection: sqlite3.Connection,
+    pg_conn: _connection,
+    engine: str,
+    batch_size: int,
+    workers: int,
+    checkpoint_path: Optional[str],
+    upsert: bool,
+    instrumentation: Optional[Instrumentation],
+    extraction: str,
+    identity_spill: Optional[str],
+    identity_memory: int,
+    staging: bool,
+    exporter: Optional[SearchExporter],
+    columnar: bool,
+):
+    checkpoint = CheckpointStore(checkpoint_path) if checkpoint_path else None
+    if staging:
+        postgres_saver = StagingSaver(
+            pg_conn, writer=get_writer(engine, upsert=False), instrumentation=instrumentation, upsert=upsert
+        )
+    else:
+        postgres_saver = PostgresSaver(
+            pg_conn,
+            writer=get_writer(engine, upsert=upsert),
+            checkpoint=checkpoint,
+            instrumentation=instrumentation,
+            **_identity_indexes(identity_spill, identity_memory),
+        )
+    sqlite_loader = LOADERS[extraction](connection, instrumentation=instrumentation, columnar=columnar)
+
+    first_rowid = checkpoint.start(sqlite_loader.db_path) if checkpoint else 0
+    batches = sqlite_loader.load_movies(batch_size=batch_size, workers=workers, first_rowid=first_rowid)
+    if exporter is not None:
+        batches = exporter.tee(batches)
+    # closing: при ошибке записи чтение пачек останавливается сразу, а экспорт закрывает свой файл
+    with closing(batches):
+        postgres_saver.save_all_data(batches)
+    return postgres_saver.writer.report()
+
+
+def _load_pipelined(
+    connection: sqlite3.Connection,
+    pg_conn: _connection,
+    engine: str,
+    batch_size: int,
+    workers: int,
+    checkpoint_path: Optional[str],
+    upsert: bool,
+    instrumentation: Optional[Instrumentation],
+    extraction: str,
+    writer_threads: int,
+    queue_size: int,
+    connect: Optional[Callable[[], _connection]],
+    identity_spill: Optional[str],
+    identity_memory: int,
+    staging: bool,
+    exporter: Optional[SearchExporter],
+    columnar: bool,
+):
+    if writer_threads > 1 and connect is None:
+        raise ValueError("Several writer threads require a connect factory")
+    checkpoint = CheckpointStore(checkpoint_path) if checkpoint_path else None
+    connections = [pg_conn] + [connect() for _ in range(writer_threads - 1)]
+    try:
+        if staging:
+            savers = [
+                StagingSaver(
+                    pg_conn, writer=get_writer(engine, upsert=False), instrumentation=instrumentation, upsert=upsert
+                )
+            ]
+        else:
+            savers = [
+                PostgresSaver(
+                    conn,
+                    writer=get_writer(engine, upsert=upsert),
+                    checkpoint=checkpoint,
+                    instrumentation=instrumentation,
+                    dedupe_across_batches=writer_threads == 1,
+                    **_identity_indexes(identity_spill, identity_memory, number),
+                )
+                for number, conn in enumerate(connections)
+            ]
+        db_path = connection.execute("PRAGMA database_list").fetchone()[2]
+        first_rowid = checkpoint.start(db_path) if checkpoint else 0
+        pipeline = Pipeline(
+            LOADERS[extraction],
+            db_path,
+            savers,
+            batch_size=batch_size,
+            workers=workers,
+            first_rowid=first_rowid,
+            queue_size=queue_size,
+            instrumentation=instrumentation,
+            exporter=exporter,
+            columnar=columnar,
+        )
+        pipeline.run()
+        return pipeline.report()
+    finally:
+        for conn in connections[1:]:
+            conn.close()
+
+
+def _identity_indexes(spill_path: Optional[str], max_memory_items: int, number: int = 0) -> dict:
+    """Индексы людей и жанров для PostgresSaver. У каждого потока записи свой файл сброса"""
+    if spill_path and number:
+        spill_path = f"{spill_path}.{number}"
+    return {
+        "people": IdentityIndex(spill_path, table="person", max_memory_items=max_memory_items),
+        "genres": IdentityIndex(spill_path, table="genre", max_memory_items=max_memory_items),
+    }
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос данных из SQLite в Postgres")
+    parser.add_argument("--engine", choices=sorted(WRITERS), default=ExecuteBatchWriter.name)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Количество процессов для преобразования данных")
+    parser.add_argument("--checkpoint", help="Файл с контрольными точками для возобновляемой загрузки")
+    parser.add_argument("--no-upsert", dest="upsert", action="store_false", help="Вставлять строки без ON CONFLICT")
+    parser.add_argument(
+        "--extraction",
+        choices=sorted(LOADERS),
+        default="group_concat",
+        help="Способ чтения из SQLite: group_concat или два упорядоченных курсора по индексу",
+    )
+    parser.add_argument(
+        "--pipeline", action="store_true", help="Читать, преобразовывать и писать одновременно в отдельных потоках"
+    )
+    parser.add_argument(
+        "--writer-threads", type=int, default=1, help="Количество потоков записи в Postgres для --pipeline"
+    )
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Размер очередей пачек для --pipeline")
+    parser.add_argument("--identity-spill", help="Файл, в который сбрасываются индексы людей и жанров")
+    parser.add_argument(
+        "--identity-memory",
+        type=int,
+        default=MAX_MEMORY_ITEMS,
+        help="Сколько имён держать в памяти до сброса в --identity-spill",
+    )
+    parser.add_argument(
+        "--staging",
+        action="store_true",
+        help="Копировать в UNLOGGED-таблицы staging и переносить в content.* одной транзакцией в конце",
+    )
+    parser.add_argument(
+        "--bulk-indexes",
+        action="store_true",
+        help="Снять индексы и внешние ключи таблиц связей на время загрузки и построить заново после",
+    )
+    parser.add_argument(
+        "--maintenance-workers", type=int, help="max_parallel_maintenance_workers для построения индексов"
+    )
+    parser.add_argument("--export", help="Каталог для документов Elasticsearch _bulk в формате NDJSON")
+    parser.add_argument("--export-gzip", action="store_true", help="Сжимать файлы --export gzip")
+    parser.add_argument(
+        "--export-chunk-mb", type=float, default=MAX_CHUNK_BYTES / 2**20, help="Размер файла --export без сжатия, МБ"
+    )
+    parser.add_argument(
+        "--transform",
+        choices=TRANSFORMS,
+        default="columnar",
+        help="Преобразование пачек: по колонкам или построчно",
+    )
+    parser.add_argument("--report", help="Файл для JSON-отчёта о прогоне по стадиям")
+    parser.add_argument("--trace-memory", action="store_true", help="Замерять пиковую память стадий (медленнее)")
+    parser.add_argument("--progress", type=float, help="Писать прогресс в лог каждые N секунд")
+    args = parser.parse_args()
+    instrumentation = Instrumentation(trace_memory=args.trace_memory, progress_interval=args.progress)
+
     dsl = {
         "dbname": "movies",
         "user": "postgres",
@@ -25,4 +294,29 @@ if __name__ == "__main__":
         "port": 5432,
     }
     with sqlite3.connect("db.sqlite") as sqlite_conn, psycopg2.connect(**dsl, cursor_factory=DictCursor) as pg_conn:
-        load_from_sqlite(sqlite_conn, pg_conn)
+        load_from_sqlite(
+            sqlite_conn,
+            pg_conn,
+            engine=args.engine,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            checkpoint_path=args.checkpoint,
+            upsert=args.upsert,
+            instrumentation=instrumentation,
+            extraction=args.extraction,
+            pipeline=args.pipeline,
+            writer_threads=args.writer_threads,
+            queue_size=args.queue_size,
+            connect=lambda: psycopg2.connect(**dsl, cursor_factory=DictCursor),
+            identity_spill=args.identity_spill,
+            identity_memory=args.identity_memory,
+            staging=args.staging,
+            bulk_indexes=args.bulk_indexes,
+            maintenance_workers=args.maintenance_workers,
+            export_path=args.export,
+            export_gzip=args.export_gzip,
+            export_chunk_bytes=int(args.export_chunk_mb * 2**20),
+            transform=args.transform,
+        )
+    if args.report:
+        instrumentation.write_report(args.report)
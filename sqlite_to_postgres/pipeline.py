@@ -0,0 +1,247 @@
+import logging
+import queue
+import threading
+from contextlib import closing
+from itertools import islice
+from typing import List, Optional
+
+from sqlite_to_postgres.etl import BATCH_SIZE, PostgresSaver, SQLiteLoader, open_readonly
+from sqlite_to_postgres.instrumentation import Instrumentation
+from sqlite_to_postgres.search import SearchExporter
+
+# Сколько пачек может ждать в каждой очереди. Больше — лучше сглаживаются
+# всплески, но дольше очередь держит пачки в памяти
+QUEUE_SIZE = 4
+# Как часто ожидающие на очереди потоки проверяют, не остановлен ли конвейер
+POLL_INTERVAL = 0.1
+
+# Признак конца данных в очереди
+DONE = object()
+
+
+class Cancelled(Exception):
+    """Конвейер остановлен: из-за ошибки в другом потоке или по cancel()"""
+
+
+class Pipeline:
+    """
+    Конвейерный ETL: чтение из SQLite, преобразование и запись в Postgres
+    идут одновременно в отдельных потоках, связанных очередями ограниченного размера.
+    Пока одна пачка пишется в Postgres, следующая уже читается и преобразуется,
+    поэтому сетевые задержки Postgres перекрываются чтением SQLite и работой CPU.
+
+    Потоки:
+     1) чтение: строки из SQLite пачками по batch_size кладутся в очередь строк;
+     2) преобразование: строки превращаются в MovieBatch и кладутся в очередь пачек;
+     3) запись: каждый PostgresSaver со своим соединением берёт пачки из очереди пачек.
+    При workers > 1 чтение и преобразование и так идут в процессах SQLiteLoader.load_movies,
+    поэтому их заменяет один поток, который кладёт готовые пачки сразу в очередь пачек.
+    С exporter каждая пачка перед очередью пачек выгружается и в документы для поиска.
+
+    Заполненная очередь останавливает предыдущую стадию, поэтому в памяти одновременно
+    не больше 2 * queue_size пачек плюс по одной в работе у каждого потока.
+    Ошибка в любом потоке или cancel() останавливают весь конвейер: пачка, которая уже пишется,
+    дописывается и коммитится, остальные отбрасываются, ошибка пробрасывается из run().
+    """
+
+    def __init__(
+        self,
+        loader_class: type,
+        db_path: str,
+        savers: List[PostgresSaver],
+        batch_size: int = BATCH_SIZE,
+        workers: int = 1,
+        first_rowid: int = 0,
+        queue_size: int = QUEUE_SIZE,
+        instrumentation: Optional[Instrumentation] = None,
+        exporter: Optional[SearchExporter] = None,
+        columnar: bool = True,
+    ):
+        if not savers:
+            raise ValueError("Pipeline needs at least one PostgresSaver")
+        if len(savers) > 1:
+            # Пачки параллельных потоков записи коммитятся в произвольном порядке,
+            # а контрольная точка хранит только последний загруженный rowid
+            if any(saver.checkpoint is not None for saver in savers):
+                raise ValueError("Checkpoints are supported only with a single writer thread")
+            # Без ON CONFLICT одни и те же люди и жанры из разных потоков нарушат уникальность id
+            if not all(saver.writer.upsert for saver in savers):
+                raise ValueError("Several writer threads require upsert")
+        self.loader_class = loader_class
+        self.db_path = db_path
+        self.savers = savers
+        self.batch_size = batch_size
+        self.workers = workers
+        self.first_rowid = first_rowid
+        self.instrumentation = instrumentation or Instrumentation()
+        self.exporter = exporter
+        self.columnar = columnar
+
+        self.rows = queue.Queue(maxsize=queue_size)
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.errors = []
+        # Загрузчик и сценаристы создаются в потоке чтения: соединение SQLite
+        # можно использовать только в том потоке, где оно открыто
+        self._loader: Optional[SQLiteLoader] = None
+        self._writers: dict = {}
+
+    def cancel(self):
+        """Останавливает конвейер. Потоки завершатся после текущей пачки"""
+        self.stopped.set()
+
+    def run(self):
+        threads = [threading.Thread(target=self._run_stage, args=(self._read,), name="etl-read", daemon=True)]
+        if self.workers <= 1:
+            threads.append(
+                threading.Thread(target=self._run_stage, args=(self._transform,), name="etl-transform", daemon=True)
+            )
+        for number, saver in enumerate(self.savers):
+            threads.append(
+                threading.Thread(
+                    target=self._run_stage, args=(self._write, saver), name=f"etl-write-{number}", daemon=True
+                )
+            )
+
+        if self.exporter is not None:
+            self.exporter.start()
+        # После ошибки файл экспорта тоже закрывается, иначе его конец теряется
+        try:
+            for thread in threads:
+                thread.start()
+            try:
+                # join с таймаутом, чтобы основной поток получил KeyboardInterrupt
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(POLL_INTERVAL)
+            except KeyboardInterrupt:
+                logging.warning("interrupted, stop the pipeline after the current batches")
+                self.cancel()
+                for thread in threads:
+                    thread.join()
+                raise
+
+            if self.errors:
+                raise self.errors[0]
+            if self.stopped.is_set():
+                raise Cancelled("pipeline was cancelled")
+            if self.exporter is not None:
+                self.exporter.finish()
+        finally:
+            if self.exporter is not None:
+                self.exporter.close()
+        for saver in self.savers:
+            saver.finish()
+        self.log_report()
+
+    def _run_stage(self, stage, *args):
+        try:
+            stage(*args)
+        except Cancelled:
+            return
+        except Exception as e:
+            logging.exception("%s failed", threading.current_thread().name)
+            self.errors.append(e)
+            self.cancel()
+
+    def _put(self, queue_: queue.Queue, item, name: str):
+        with self.instrumentation.stage(f"wait {name} queue (full)"):
+            while True:
+                if self.stopped.is_set():
+                    raise Cancelled
+                try:
+                    queue_.put(item, timeout=POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    continue
+
+    def _get(self, queue_: queue.Queue, name: str):
+        with self.instrumentation.stage(f"wait {name} queue (empty)"):
+            while True:
+                if self.stopped.is_set():
+                    raise Cancelled
+                try:
+                    return queue_.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+
+    def _read(self):
+        self._loader = self.loader_class(
+            open_readonly(self.db_path), instrumentation=self.instrumentation, columnar=self.columnar
+        )
+        if self.workers > 1:
+            batches = self._loader.load_movies(self.batch_size, workers=self.workers, first_rowid=self.first_rowid)
+            # closing: при остановке пул процессов закрывается сразу, а не при сборке мусора
+            with closing(batches):
+                for batch in batches:
+                    self._export(batch)
+                    self._put(self.batches, batch, "batches")
+            self._finish_batches()
+            return
+
+        with self.instrumentation.stage("load_writers") as measurement:
+            self._writers = self._loader.load_writers_names()
+            measurement.rows = len(self._writers)
+        source_rows = self._loader.read_rows(self.first_rowid)
+        while True:
+            with self.instrumentation.stage("extract") as measurement:
+                rows = list(islice(source_rows, self.batch_size))
+                measurement.rows = len(rows)
+            if not rows:
+                break
+            self._put(self.rows, rows, "rows")
+        self._put(self.rows, DONE, "rows")
+
+    def _transform(self):
+        while True:
+            rows = self._get(self.rows, "rows")
+            if rows is DONE:
+                break
+            with self.instrumentation.stage("transform", rows=len(rows)):
+                batch = self._loader.transform_batch(rows, self._writers)
+            self._export(batch)
+            self._put(self.batches, batch, "batches")
+        self._finish_batches()
+
+    def _export(self, batch):
+        # Пачки выгружаются из одного потока и в порядке rowid
+        if self.exporter is not None:
+            self.exporter.save(batch)
+
+    def _finish_batches(self):
+        # Каждый поток записи должен получить свой признак конца данных
+        for _ in self.savers:
+            self._put(self.batches, DONE, "batches")
+
+    def _write(self, saver: PostgresSaver):
+        saver.start()
+        while True:
+            batch = self._get(self.batches, "batches")
+            if batch is DONE:
+                return
+            try:
+                saver.save(batch)
+            except BaseException:
+                saver.conn.rollback()
+                raise
+
+    def report(self) -> dict:
+        """Отчёт движков записи всех потоков, сложенный по таблицам"""
+        merged = type(self.savers[0].writer)()
+        for saver in self.savers:
+            for table, stats in saver.writer.stats.items():
+                merged.stats[table]["rows"] += stats["rows"]
+                merged.stats[table]["seconds"] += stats["seconds"]
+        return merged.report()
+
+    def log_report(self):
+        for table, stats in self.report().items():
+            logging.info(
+                "[pipeline x%s] %s: %s rows in %ss of writer time (%s rows/sec)",
+                len(self.savers),
+                table,
+                stats["rows"],
+                stats["seconds"],
+                stats["rows_per_sec"],
+            )
+        self.instrumentation.log_report()
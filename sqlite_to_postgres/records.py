@@ -0,0 +1,157 @@
+"""
+Промежуточное представление данных ETL.
+Записи — NamedTuple без __dict__, id хранятся 16 байтами вместо 36-символьной строки,
+а пачка фильмов хранится по колонкам в MovieBatch вместо словаря на каждую строку.
+В строку uuid превращается только при записи в Postgres.
+"""
+import hashlib
+import uuid
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Пространство имён для детерминированных id: одни и те же данные
+# при каждом прогоне получают один и тот же id
+NAMESPACE_MOVIES = uuid.UUID("6f1c8f5e-3b1a-5d2e-9c77-2f3e8b0d4a61")
+
+
+# Роли людей в фильме
+WRITER = "writer"
+DIRECTOR = "director"
+ACTOR = "actor"
+
+
+def normalize_name(name: str) -> str:
+    """Приводит имя человека или название жанра к виду, по которому они считаются одинаковыми"""
+    return " ".join(name.split()).casefold()
+
+
+def uuid_str(value: bytes) -> str:
+    return str(uuid.UUID(bytes=value))
+
+
+def make_id(kind: str, *parts) -> bytes:
+    """
+    Детерминированный id на основе uuid5.
+    :param kind: таблица, для которой генерируется id
+    :param parts: исходный id, нормализованное имя или id других записей, определяющие запись
+    :return: 16 байт uuid
+    """
+    name = ":".join([kind, *(uuid_str(part) if isinstance(part, bytes) else str(part) for part in parts)])
+    return uuid.uuid5(NAMESPACE_MOVIES, name).bytes
+
+
+def make_ids(kind: str, parts: Iterable[str]) -> List[bytes]:
+    """
+    make_id для целой колонки строковых значений: sha1 из uuid5 считается напрямую,
+    без промежуточных объектов uuid.UUID. Результат совпадает с make_id(kind, part).
+    """
+    prefix = NAMESPACE_MOVIES.bytes + kind.encode() + b":"
+    ids = []
+    for part in parts:
+        digest = bytearray(hashlib.sha1(prefix + part.encode()).digest()[:16])  # nosec
+        # Версия 5 и вариант RFC 4122, как в uuid.UUID(version=5)
+        digest[6] = (digest[6] & 0x0F) | 0x50
+        digest[8] = (digest[8] & 0x3F) | 0x80
+        ids.append(bytes(digest))
+    return ids
+
+
+def person_id(name: str) -> bytes:
+    return make_id("person", normalize_name(name))
+
+
+def genre_id(genre: str) -> bytes:
+    return make_id("genre", normalize_name(genre))
+
+
+class Movie(NamedTuple):
+    id: bytes
+    title: str
+    imdb_rating: Optional[float]
+    description: Optional[str]
+    type: str = "movie"
+
+
+class Person(NamedTuple):
+    id: bytes
+    name: str
+
+
+class MoviePeople(NamedTuple):
+    id: bytes
+    movie_id: bytes
+    person_id: bytes
+
+
+class Genre(NamedTuple):
+    id: bytes
+    genre: str
+
+
+class MovieGenres(NamedTuple):
+    id: bytes
+    movie_id: bytes
+    genre: str
+
+
+class MovieBatch:
+    """
+    Пачка преобразованных фильмов по колонкам: i-й элемент каждого списка относится к i-му фильму.
+    rowids, source_ids и hashes нужны для контрольных точек.
+    roles[i][j] — роль человека people[i][j] в фильме; один человек может встречаться в нескольких ролях.
+    """
+
+    __slots__ = ("rowids", "source_ids", "hashes", "movies", "genres", "people", "roles")
+
+    def __init__(self):
+        self.rowids: List[int] = []
+        self.source_ids: List[str] = []
+        self.hashes: List[bytes] = []
+        self.movies: List[Movie] = []
+        self.genres: List[Tuple[Genre, ...]] = []
+        self.people: List[Tuple[Person, ...]] = []
+        self.roles: List[Tuple[str, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self.movies)
+
+    def append(
+        self,
+        rowid: int,
+        source_id: str,
+        hash_: bytes,
+        movie: Movie,
+        genres: Sequence[Genre],
+        people: Sequence[Person],
+        roles: Sequence[str],
+    ):
+        self.rowids.append(rowid)
+        self.source_ids.append(source_id)
+        self.hashes.append(hash_)
+        self.movies.append(movie)
+        self.genres.append(tuple(genres))
+        self.people.append(tuple(people))
+        self.roles.append(tuple(roles))
+
+    def select(self, indexes: Iterable[int]) -> "MovieBatch":
+        """Новая пачка только из фильмов с указанными номерами"""
+        batch = MovieBatch()
+        for index in indexes:
+            batch.append(
+                self.rowids[index],
+                self.source_ids[index],
+                self.hashes[index],
+                self.movies[index],
+                self.genres[index],
+                self.people[index],
+                self.roles[index],
+            )
+        return batch
+
+    def set_movie_id(self, index: int, movie_id: bytes):
+        self.movies[index] = self.movies[index]._replace(id=movie_id)
+
+    def movie_genres(self) -> Iterable[Tuple[bytes, Tuple[Genre, ...]]]:
+        return zip((movie.id for movie in self.movies), self.genres)
+
+    def movie_people(self) -> Iterable[Tuple[bytes, Tuple[Person, ...]]]:
+        return zip((movie.id for movie in self.movies), self.people)
@@ -0,0 +1,162 @@
+import gzip
+import json
+import logging
+import os
+import re
+from typing import IO, Iterable, Iterator, List, Optional, Sequence
+
+from psycopg2.extensions import connection as _connection
+
+from sqlite_to_postgres.etl import warm_index
+from sqlite_to_postgres.identity import IdentityIndex
+from sqlite_to_postgres.instrumentation import Instrumentation
+from sqlite_to_postgres.records import ACTOR, DIRECTOR, WRITER, Genre, Movie, MovieBatch, Person, uuid_str
+
+INDEX_NAME = "movies"
+# Elasticsearch по умолчанию принимает запросы до 100 МБ, но советует пачки в 5–15 МБ
+MAX_CHUNK_BYTES = 10 * 2**20
+
+
+class SearchExporter:
+    """
+    Второй приёмник данных рядом с PostgresSaver: по одному денормализованному документу
+    на фильм в формате NDJSON для Elasticsearch _bulk.
+    Документы пишутся в каталог файлами movies-00001.ndjson[.gz]; каждый файл не больше
+    max_bytes без сжатия и целиком отправляется одним запросом. Нумерация продолжает
+    файлы, уже лежащие в каталоге, поэтому повторный экспорт их не перезаписывает:
+
+        curl -H "Content-Type: application/x-ndjson" -XPOST localhost:9200/_bulk --data-binary @movies-00001.ndjson
+
+    Для сжатых файлов добавляется заголовок "Content-Encoding: gzip".
+    Экспорт идёт в том же проходе по SQLite, что и загрузка в Postgres: см. tee().
+
+    id людей берутся из своего индекса идентичности, прогретого из conn так же,
+    как индекс PostgresSaver: человек, уже заведённый в Postgres под другим id,
+    попадает в документ с тем id, который ему даст и загрузка в Postgres.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        index: str = INDEX_NAME,
+        max_bytes: int = MAX_CHUNK_BYTES,
+        compress: bool = False,
+        instrumentation: Optional[Instrumentation] = None,
+        conn: Optional[_connection] = None,
+        people: Optional[IdentityIndex] = None,
+    ):
+        self.path = path
+        self.index = index
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.instrumentation = instrumentation or Instrumentation()
+        # Соединение с Postgres, из которого индекс людей прогревается уже сохранёнными людьми
+        self.conn = conn
+        self.people = people if people is not None else IdentityIndex(table="person")
+        self.files: List[str] = []
+        self.documents = 0
+        self._file: Optional[IO[bytes]] = None
+        self._size = 0
+        # Номер первого файла этого экспорта
+        self._first_number = 1
+
+    def save_all_data(self, batches: Iterable[MovieBatch]):
+        for _batch in self.tee(batches):
+            pass
+
+    def tee(self, batches: Iterable[MovieBatch]) -> Iterator[MovieBatch]:
+        """Экспортирует пачки и отдаёт их дальше, например в PostgresSaver.save_all_data"""
+        self.start()
+        try:
+            for batch in batches:
+                self.save(batch)
+                yield batch
+            self.finish()
+        finally:
+            self.close()
+
+    def start(self):
+        os.makedirs(self.path, exist_ok=True)
+        self._first_number = self._last_number() + 1
+        if self.conn is not None:
+            warm_index(self.conn, self.people, "SELECT name, id FROM content.person")
+
+    def save(self, batch: MovieBatch):
+        with self.instrumentation.stage("export", rows=len(batch)):
+            for index, movie in enumerate(batch.movies):
+                people = [
+                    person._replace(id=self.people.resolve(person.name, person.id)[0]) for person in batch.people[index]
+                ]
+                document = self.document(movie, batch.genres[index], people, batch.roles[index])
+                action = {"index": {"_index": self.index, "_id": document["id"]}}
+                self._write(
+                    (
+                        json.dumps(action, ensure_ascii=False) + "\n" + json.dumps(document, ensure_ascii=False) + "\n"
+                    ).encode()
+                )
+        self.documents += len(batch)
+
+    def finish(self):
+        self.close()
+        logging.info("export: %s documents in %s files to %s", self.documents, len(self.files), self.path)
+
+    def close(self):
+        """Закрывает файл и индекс людей и после ошибки загрузки: иначе файл остаётся недописанным"""
+        self._close()
+        self.people.close()
+
+    @staticmethod
+    def document(movie: Movie, genres: Sequence[Genre], people: Sequence[Person], roles: Sequence[str]) -> dict:
+        """Документ фильма: люди сгруппированы по ролям, без повторов внутри роли"""
+        by_role = {WRITER: {}, DIRECTOR: {}, ACTOR: {}}
+        for person, role in zip(people, roles):
+            by_role[role].setdefault(person.id, person.name)
+        persons = {
+            role: [{"id": uuid_str(id_), "name": name} for id_, name in role_people.items()]
+            for role, role_people in by_role.items()
+        }
+        return {
+            "id": uuid_str(movie.id),
+            "title": movie.title,
+            "imdb_rating": movie.imdb_rating,
+            "description": movie.description,
+            "genre": list(dict.fromkeys(genre.genre for genre in genres)),
+            "directors": persons[DIRECTOR],
+            "actors": persons[ACTOR],
+            "writers": persons[WRITER],
+            # Отдельные поля имён для полнотекстового поиска
+            "directors_names": [person["name"] for person in persons[DIRECTOR]],
+            "actors_names": [person["name"] for person in persons[ACTOR]],
+            "writers_names": [person["name"] for person in persons[WRITER]],
+        }
+
+    def _write(self, pair: bytes):
+        # Действие и документ не разрываются между файлами: иначе _bulk отклонит оба файла
+        if self._file is not None and self._size + len(pair) > self.max_bytes:
+            self._close()
+        if self._file is None:
+            self._open()
+        self._file.write(pair)
+        self._size += len(pair)
+
+    def _last_number(self) -> int:
+        """Наибольший номер файла этого индекса, уже лежащего в каталоге, или 0"""
+        pattern = re.compile(rf"{re.escape(self.index)}-(\d+)\.ndjson(\.gz)?")
+        numbers = [int(match.group(1)) for match in map(pattern.fullmatch, os.listdir(self.path)) if match]
+        return max(numbers, default=0)
+
+    def _open(self):
+        name = os.path.join(self.path, f"{self.index}-{self._first_number + len(self.files):05d}.ndjson")
+        if self.compress:
+            name += ".gz"
+            self._file = gzip.open(name, "wb", compresslevel=6)
+        else:
+            # Файл живёт дольше вызова: его закрывают _close при смене файла и close после ошибки
+            self._file = open(name, "wb")  # noqa: SIM115
+        self.files.append(name)
+        self._size = 0
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,314 @@
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import Optional, Sequence
+
+from psycopg2.extensions import connection as _connection
+
+from sqlite_to_postgres.etl import FILM_WORK_COLUMNS, WARM_ITERSIZE, PostgresSaver
+from sqlite_to_postgres.instrumentation import Instrumentation
+from sqlite_to_postgres.records import MovieBatch, make_id, normalize_name, uuid_str
+from sqlite_to_postgres.writers import CopyWriter, TableWriter, upsert_clause
+
+SCHEMA = "staging"
+
+STAGING_DDL = """
+CREATE SCHEMA IF NOT EXISTS {schema};
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.film_work (LIKE content.film_work INCLUDING DEFAULTS);
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.person_film_work (
+    id uuid NOT NULL,
+    film_work_id uuid NOT NULL,
+    person_id uuid NOT NULL,
+    name text NOT NULL,
+    name_key text NOT NULL
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.genre_film_work (
+    id uuid NOT NULL,
+    film_work_id uuid NOT NULL,
+    genre_id uuid NOT NULL,
+    genre text NOT NULL,
+    genre_key text NOT NULL
+);
+-- Итог сопоставления: нормализованное имя -> id в content.*, is_new — такого имени в Postgres ещё нет
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.person_map (
+    name_key text PRIMARY KEY,
+    id uuid NOT NULL,
+    name text NOT NULL,
+    is_new boolean NOT NULL
+);
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.genre_map (
+    genre_key text PRIMARY KEY,
+    id uuid NOT NULL,
+    genre text NOT NULL,
+    is_new boolean NOT NULL
+);
+-- Люди и жанры, которые уже есть в content.*, с ключом из records.normalize_name
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.person_existing (name_key text NOT NULL, id uuid NOT NULL);
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.genre_existing (genre_key text NOT NULL, id uuid NOT NULL);
+-- id связей с людьми, которые сопоставились с человеком под другим id
+CREATE UNLOGGED TABLE IF NOT EXISTS {schema}.person_film_work_relink (
+    id uuid NOT NULL,
+    film_work_id uuid NOT NULL,
+    person_id uuid NOT NULL
+);
+"""
+
+STAGING_TABLES = (
+    "film_work",
+    "person_film_work",
+    "genre_film_work",
+    "person_map",
+    "genre_map",
+    "person_existing",
+    "genre_existing",
+    "person_film_work_relink",
+)
+
+
+def copy_name_keys(conn: _connection, cur, select_sql: str, table: str, columns: Sequence[str], writer: TableWriter):
+    """
+    Копирует в table строки select_sql вида (имя, значение) как (normalize_name(имя), значение).
+    Ключи считаются в Python той же функцией, что и при загрузке: в SQL её не повторить
+    (casefold, все виды пробелов), а расхождение давало бы одному имени два ключа.
+    Строки читаются серверным курсором и не загружаются в память целиком.
+    """
+    with conn.cursor(name=f"name_keys_{table.replace('.', '_')}") as source:
+        source.itersize = WARM_ITERSIZE
+        source.execute(select_sql)
+        while True:
+            rows = source.fetchmany(WARM_ITERSIZE)
+            if not rows:
+                break
+            writer.save(cur, table, columns, [(normalize_name(name), value) for name, value in rows])
+
+
+class StagingSaver(PostgresSaver):
+    """
+    Загрузка через промежуточные таблицы.
+    Пачки копируются в UNLOGGED-таблицы схемы staging: без WAL, индексов и внешних ключей.
+    Живые таблицы content.* не меняются до конца загрузки, а в finish() люди и жанры
+    сопоставляются с уже сохранёнными одним запросом на таблицу, и всё переносится
+    в content.* несколькими INSERT ... SELECT в одной транзакции.
+    Администраторы видят либо старый каталог, либо новый целиком, а ошибка в слиянии
+    откатывает всю загрузку.
+    Промежуточные таблицы не хранят состояние между прогонами и очищаются в start(),
+    поэтому режим не совместим с контрольными точками.
+    """
+
+    def __init__(
+        self,
+        conn: _connection,
+        writer: Optional[TableWriter] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        upsert: bool = True,
+        schema: str = SCHEMA,
+    ):
+        # В промежуточные таблицы строки только добавляются: COPY без ON CONFLICT
+        super().__init__(conn, writer=writer or CopyWriter(upsert=False), instrumentation=instrumentation)
+        if self.writer.upsert:
+            raise ValueError("StagingSaver needs a writer without upsert")
+        self.upsert = upsert
+        self.schema = schema
+        self.created_at = datetime.now(timezone.utc)
+
+    def start(self):
+        with self.conn.cursor() as cur:
+            cur.execute(STAGING_DDL.format(schema=self.schema))
+            cur.execute(f"TRUNCATE {', '.join(self._staging(table) for table in STAGING_TABLES)}")
+        self.conn.commit()
+
+    def save(self, batch: MovieBatch):
+        """
+        Копирует пачку в промежуточные таблицы. Пачки коммитятся, но в content.* не видны.
+        id связей считаются от детерминированного id человека. Если при слиянии он
+        сопоставится с человеком под другим id, id связи пересчитывается в merge().
+        """
+        with self.conn.cursor() as cur:
+            self._save(cur, self._staging("film_work"), FILM_WORK_COLUMNS, self.film_work_rows(batch, self.created_at))
+            self._save(
+                cur,
+                self._staging("person_film_work"),
+                ("id", "film_work_id", "person_id", "name", "name_key"),
+                [
+                    (
+                        uuid_str(make_id("person_film_work", movie_id, person.id)),
+                        uuid_str(movie_id),
+                        uuid_str(person.id),
+                        person.name,
+                        normalize_name(person.name),
+                    )
+                    for movie_id, people in batch.movie_people()
+                    for person in people
+                ],
+            )
+            self._save(
+                cur,
+                self._staging("genre_film_work"),
+                ("id", "film_work_id", "genre_id", "genre", "genre_key"),
+                [
+                    (
+                        uuid_str(make_id("genre_film_work", movie_id, normalize_name(genre.genre))),
+                        uuid_str(movie_id),
+                        uuid_str(genre.id),
+                        genre.genre,
+                        normalize_name(genre.genre),
+                    )
+                    for movie_id, genres in batch.movie_genres()
+                    for genre in genres
+                ],
+            )
+        self.conn.commit()
+        self.instrumentation.batch_done(len(batch))
+
+    def finish(self):
+        """Переносит промежуточные таблицы в content.* одной транзакцией"""
+        try:
+            with self.conn.cursor() as cur:
+                self.merge(cur)
+                cur.execute(f"TRUNCATE {', '.join(self._staging(table) for table in STAGING_TABLES)}")
+            with self.instrumentation.stage("commit"):
+                self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        logging.info("staging tables have been merged")
+
+    def merge(self, cur):
+        film_work_columns = ", ".join(FILM_WORK_COLUMNS)
+        # Статистика по свежезаполненным таблицам, чтобы планировщик выбрал хеш-соединения
+        cur.execute(f"ANALYZE {', '.join(self._staging(table) for table in STAGING_TABLES[:3])}")
+
+        self._merge(
+            cur,
+            "content.film_work",
+            f"""
+            INSERT INTO content.film_work AS t ({film_work_columns})
+            SELECT DISTINCT ON (id) {film_work_columns} FROM {self._staging("film_work")}
+            ORDER BY id
+            {self._conflict(FILM_WORK_COLUMNS, immutable=("created_at",))}
+            """,
+        )
+        for table, key, name in (("person", "name_key", "name"), ("genre", "genre_key", "genre")):
+            with self.instrumentation.stage(f"keys content.{table}"):
+                copy_name_keys(
+                    self.conn,
+                    cur,
+                    f"SELECT {name}, id FROM content.{table}",
+                    self._staging(f"{table}_existing"),
+                    (key, "id"),
+                    self.writer,
+                )
+        cur.execute(f"ANALYZE {self._staging('person_existing')}, {self._staging('genre_existing')}")
+
+        for table, key, name, source in (
+            ("person", "name_key", "name", "person_film_work"),
+            ("genre", "genre_key", "genre", "genre_film_work"),
+        ):
+            source_id = f"{table}_id"
+            self._merge(
+                cur,
+                f"{self.schema}.{table}_map",
+                f"""
+                INSERT INTO {self._staging(f"{table}_map")} ({key}, id, {name}, is_new)
+                SELECT s.{key}, coalesce(e.id, s.{source_id}), s.{name}, e.id IS NULL
+                FROM (
+                    SELECT DISTINCT ON ({key}) {key}, {source_id}, {name}
+                    FROM {self._staging(source)}
+                    ORDER BY {key}, {name}
+                ) s
+                LEFT JOIN (
+                    SELECT DISTINCT ON ({key}) {key}, id
+                    FROM {self._staging(f"{table}_existing")}
+                    ORDER BY {key}, id
+                ) e USING ({key})
+                """,
+            )
+            # Люди и жанры не обновляются: совпадение имени и означает, что это та же запись
+            self._merge(
+                cur,
+                f"content.{table}",
+                f"""
+                INSERT INTO content.{table} AS t (id, {name})
+                SELECT id, {name} FROM {self._staging(f"{table}_map")}
+                WHERE is_new
+                ORDER BY id
+                ON CONFLICT (id) DO NOTHING
+                """,
+            )
+
+        self.relink_people(cur)
+        self._merge(
+            cur,
+            "content.person_film_work",
+            f"""
+            INSERT INTO content.person_film_work AS t (id, film_work_id, person_id)
+            SELECT DISTINCT ON (1) coalesce(r.id, s.id), s.film_work_id, m.id
+            FROM {self._staging("person_film_work")} s
+            JOIN {self._staging("person_map")} m USING (name_key)
+            LEFT JOIN {self._staging("person_film_work_relink")} r
+                ON r.film_work_id = s.film_work_id AND r.person_id = m.id
+            ORDER BY 1
+            {self._conflict(("id", "film_work_id", "person_id"))}
+            """,
+        )
+        self._merge(
+            cur,
+            "content.genre_film_work",
+            f"""
+            INSERT INTO content.genre_film_work AS t (id, film_work_id, genre)
+            SELECT DISTINCT ON (id) id, film_work_id, genre
+            FROM {self._staging("genre_film_work")}
+            ORDER BY id
+            {self._conflict(("id", "film_work_id", "genre"))}
+            """,
+        )
+
+    def relink_people(self, cur):
+        """
+        id связей с людьми, сопоставленными с человеком под другим id, считаются от итогового id,
+        как в PostgresSaver.unify_people: иначе последовательная загрузка и загрузка через
+        staging давали бы одной связи разные id и дублировали её.
+        Таких людей обычно мало, поэтому в Python читаются только их связи.
+        """
+        relinked = 0
+        with self.conn.cursor(name="staging_relink_people") as source:
+            source.itersize = WARM_ITERSIZE
+            source.execute(
+                f"""
+                SELECT DISTINCT s.film_work_id, m.id
+                FROM {self._staging("person_film_work")} s
+                JOIN {self._staging("person_map")} m USING (name_key)
+                WHERE m.id <> s.person_id
+                """
+            )
+            while True:
+                rows = source.fetchmany(WARM_ITERSIZE)
+                if not rows:
+                    break
+                links = []
+                for movie_id, person_id in rows:
+                    movie_id, person_id = uuid.UUID(str(movie_id)).bytes, uuid.UUID(str(person_id)).bytes
+                    links.append(
+                        (
+                            uuid_str(make_id("person_film_work", movie_id, person_id)),
+                            uuid_str(movie_id),
+                            uuid_str(person_id),
+                        )
+                    )
+                self.writer.save(
+                    cur, self._staging("person_film_work_relink"), ("id", "film_work_id", "person_id"), links
+                )
+                relinked += len(links)
+        logging.info("relink %s links to people matched under another id", relinked)
+
+    def _merge(self, cur, table: str, sql: str):
+        with self.instrumentation.stage(f"merge {table}") as measurement:
+            cur.execute(sql)
+            measurement.rows = max(cur.rowcount, 0)
+        logging.info("merge %s: %s rows", table, measurement.rows)
+
+    def _conflict(self, columns, immutable=()) -> str:
+        return upsert_clause(columns, immutable) if self.upsert else ""
+
+    def _staging(self, table: str) -> str:
+        return f"{self.schema}.{table}"
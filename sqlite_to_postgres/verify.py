@@ -0,0 +1,356 @@
+"""
+Сверка загруженного каталога content.* с исходной базой SQLite.
+
+    python -m sqlite_to_postgres.verify db.sqlite
+
+Каждая таблица сравнивается по количеству строк и хешу содержимого, не зависящему
+от порядка строк: у каждой строки берётся 64-битный хеш её текстового представления,
+и хеши складываются по модулю 2**64 внутри диапазона ключей. Диапазон — первые depth
+шестнадцатеричных знаков md5 ключа, поэтому строки распределяются по диапазонам равномерно.
+В Postgres диапазоны считаются одним GROUP BY на таблицу, и в Python приходит
+16**depth строк агрегатов, а не сами таблицы. SQLite читается обычными пачками
+через SQLiteLoader, и строки получаются тем же преобразованием, что и при загрузке.
+
+При расхождении сверка сужается до различающихся диапазонов, а для первых max_ranges
+из них — до конкретных ключей: они ищутся вторым проходом по SQLite и запросом
+в Postgres только по этим диапазонам.
+
+Люди и жанры сравниваются по нормализованному имени, а не по id: индекс идентичности
+мог сопоставить их с записями, которые уже были в Postgres под другим id.
+Имена с обеих сторон нормализуются одной records.normalize_name: для Postgres ключи
+считаются в Python и копируются во временные таблицы на время прохода сверки.
+"""
+import argparse
+import hashlib
+import logging
+import sqlite3
+import struct
+import sys
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import psycopg2
+from psycopg2.extensions import connection as _connection
+
+from sqlite_to_postgres.etl import BATCH_SIZE, LOADERS
+from sqlite_to_postgres.instrumentation import Instrumentation
+from sqlite_to_postgres.records import MovieBatch, normalize_name, uuid_str
+from sqlite_to_postgres.staging import copy_name_keys
+from sqlite_to_postgres.writers import CopyWriter
+
+# 16**3 = 4096 диапазонов на таблицу
+DEPTH = 3
+# Для скольких различающихся диапазонов искать конкретные ключи
+MAX_RANGES = 16
+# Сколько ключей каждого вида показывать в отчёте
+MAX_KEYS = 20
+
+SEPARATOR = "\x1f"
+NULL = "\\N"
+HASH_MODULO = 2**64
+
+# Первые 64 бита md5 текстового представления строки как знаковое число
+ROW_HASH_SQL = "('x' || left(md5(row), 16))::bit(64)::bigint"
+
+# Рейтинг сравнивается по байтам double: round(numeric) в Postgres и форматирование float
+# в Python округляют по-разному, а текст float8 зависит от extra_float_digits сервера
+RATING_SQL = "encode(float8send(rating), 'hex')"
+
+# (количество строк, сумма хешей строк по модулю 2**64)
+Digest = Tuple[int, int]
+
+
+class Table(NamedTuple):
+    """Таблица Postgres и выражения для её ключа и текстового представления строки"""
+
+    name: str
+    source: str
+    key: str
+    columns: Sequence[str]
+
+    def row_sql(self) -> str:
+        return "concat_ws(%(separator)s, {})".format(
+            ", ".join(f"coalesce(({column})::text, %(null)s)" for column in self.columns)
+        )
+
+
+# Ключи имён из content.*, посчитанные records.normalize_name; таблицы удаляются вместе с транзакцией
+NAME_KEYS_DDL = """
+CREATE TEMPORARY TABLE verify_person_key (key text NOT NULL, id uuid NOT NULL) ON COMMIT DROP;
+CREATE TEMPORARY TABLE verify_genre_key (key text NOT NULL, genre text NOT NULL) ON COMMIT DROP;
+"""
+GENRE_NAMES_SQL = """
+SELECT genre, genre FROM (SELECT genre FROM content.genre UNION SELECT genre FROM content.genre_film_work) g
+"""
+
+TABLES = (
+    Table(
+        "content.film_work",
+        "content.film_work",
+        "id::text",
+        ("id", "title", RATING_SQL, "description", "type"),
+    ),
+    Table("content.person", "verify_person_key", "key", ("key",)),
+    Table("content.genre", "content.genre g JOIN verify_genre_key k USING (genre)", "k.key", ("k.key",)),
+    Table(
+        "content.person_film_work",
+        "content.person_film_work l LEFT JOIN verify_person_key p ON p.id = l.person_id",
+        "l.film_work_id::text",
+        ("l.film_work_id", "p.key"),
+    ),
+    Table(
+        "content.genre_film_work",
+        "content.genre_film_work l LEFT JOIN verify_genre_key g USING (genre)",
+        "l.film_work_id::text",
+        ("l.film_work_id", "g.key"),
+    ),
+)
+
+
+class TableReport(NamedTuple):
+    table: str
+    source_rows: int
+    target_rows: int
+    # Различающиеся диапазоны md5 ключа
+    ranges: List[str]
+    # Ключи, которых нет в Postgres, лишние в Postgres и с разным содержимым
+    missing: List[str]
+    unexpected: List[str]
+    changed: List[str]
+
+    @property
+    def ok(self) -> bool:
+        return not self.ranges
+
+
+def key_range(key: str, depth: int = DEPTH) -> str:
+    return hashlib.md5(key.encode()).hexdigest()[:depth]  # nosec
+
+
+def rating_text(rating: Optional[float]) -> Optional[str]:
+    """Рейтинг в том же виде, что RATING_SQL: байты double в сетевом порядке"""
+    return None if rating is None else struct.pack(">d", rating).hex()
+
+
+def row_hash(values: Iterable[Optional[str]]) -> int:
+    """Первые 64 бита md5 строки, как ('x' || left(md5(row), 16))::bit(64) в Postgres"""
+    row = SEPARATOR.join(NULL if value is None else value for value in values)
+    return int.from_bytes(hashlib.md5(row.encode()).digest()[:8], "big")  # nosec
+
+
+class DigestBuilder:
+    """Количество строк и сумма их хешей по ключам или диапазонам ключей"""
+
+    def __init__(self, depth: int = DEPTH, ranges: Optional[Set[str]] = None):
+        self.depth = depth
+        # Если заданы диапазоны, сумма считается по каждому ключу этих диапазонов
+        self.ranges = ranges
+        self.digests: Dict[str, List[int]] = {}
+
+    def add(self, key: str, rows: Iterable[Sequence[Optional[str]]]):
+        bucket = key_range(key, self.depth)
+        if self.ranges is not None:
+            if bucket not in self.ranges:
+                return
+            bucket = key
+        hashes = [row_hash(row) for row in rows]
+        if not hashes:
+            # Фильм без людей или жанров не даёт строк в Postgres, и пустого диапазона там не будет
+            return
+        digest = self.digests.setdefault(bucket, [0, 0])
+        digest[0] += len(hashes)
+        digest[1] = (digest[1] + sum(hashes)) % HASH_MODULO
+
+    def result(self) -> Dict[str, Digest]:
+        return {bucket: tuple(digest) for bucket, digest in self.digests.items()}
+
+
+def source_digests(
+    batches: Iterable[MovieBatch], depth: int = DEPTH, ranges: Optional[Dict[str, Set[str]]] = None
+) -> Dict[str, Dict[str, Digest]]:
+    """
+    Агрегаты таблиц content.*, которые должны получиться из пачек.
+    :param ranges: таблица -> диапазоны; если задано, агрегаты считаются по ключам
+        только этих диапазонов и только для этих таблиц
+    """
+    builders = {
+        table.name: DigestBuilder(depth, None if ranges is None else ranges.get(table.name, set())) for table in TABLES
+    }
+    # Люди и жанры общие для всех фильмов: различные имена копятся до конца прохода
+    people: Set[str] = set()
+    genres: Set[str] = set()
+
+    for batch in batches:
+        keys = {movie.id: uuid_str(movie.id) for movie in batch.movies}
+        for movie in batch.movies:
+            key = keys[movie.id]
+            row = (key, movie.title, rating_text(movie.imdb_rating), movie.description, movie.type)
+            builders["content.film_work"].add(key, [row])
+        for movie_id, movie_people in batch.movie_people():
+            names = {normalize_name(person.name) for person in movie_people}
+            people.update(names)
+            builders["content.person_film_work"].add(keys[movie_id], [(keys[movie_id], name) for name in names])
+        for movie_id, movie_genres in batch.movie_genres():
+            names = {normalize_name(genre.genre) for genre in movie_genres}
+            genres.update(names)
+            builders["content.genre_film_work"].add(keys[movie_id], [(keys[movie_id], name) for name in names])
+
+    for name in people:
+        builders["content.person"].add(name, [(name,)])
+    for name in genres:
+        builders["content.genre"].add(name, [(name,)])
+    return {table: builder.result() for table, builder in builders.items()}
+
+
+def create_name_keys(pg_conn: _connection, cur):
+    """
+    Ключи людей и жанров Postgres для TABLES. Считаются в Python той же records.normalize_name,
+    что и ключи SQLite: повторить её в SQL точно нельзя, и сверка находила бы несуществующие расхождения.
+    """
+    cur.execute(NAME_KEYS_DDL)
+    writer = CopyWriter(upsert=False)
+    copy_name_keys(pg_conn, cur, "SELECT name, id FROM content.person", "verify_person_key", ("key", "id"), writer)
+    copy_name_keys(pg_conn, cur, GENRE_NAMES_SQL, "verify_genre_key", ("key", "genre"), writer)
+    cur.execute("ANALYZE verify_person_key, verify_genre_key")
+
+
+def target_digests(cur, table: Table, depth: int = DEPTH, ranges: Optional[Set[str]] = None) -> Dict[str, Digest]:
+    """
+    Агрегаты таблицы Postgres по диапазонам ключей, а если заданы ranges —
+    по ключам только этих диапазонов. Вся работа идёт на стороне Postgres.
+    """
+    key_range_sql = "left(md5(key), %(depth)s)"
+    group = key_range_sql if ranges is None else "key"
+    where = "" if ranges is None else f"WHERE {key_range_sql} = ANY(%(ranges)s)"
+    cur.execute(
+        f"""
+        SELECT {group}, count(*), sum({ROW_HASH_SQL})
+        FROM (SELECT {table.key} AS key, {table.row_sql()} AS row FROM {table.source}) t
+        {where}
+        GROUP BY 1
+        """,  # nosec
+        {"depth": depth, "separator": SEPARATOR, "null": NULL, "ranges": sorted(ranges or ())},
+    )
+    return {bucket: (count, int(total) % HASH_MODULO) for bucket, count, total in cur.fetchall()}
+
+
+def differing(source: Dict[str, Digest], target: Dict[str, Digest]) -> List[str]:
+    return sorted(bucket for bucket in source.keys() | target.keys() if source.get(bucket) != target.get(bucket))
+
+
+def verify(
+    load_batches: Callable[[], Iterable[MovieBatch]],
+    pg_conn: _connection,
+    depth: int = DEPTH,
+    max_ranges: int = MAX_RANGES,
+    max_keys: int = MAX_KEYS,
+    instrumentation: Optional[Instrumentation] = None,
+) -> List[TableReport]:
+    """
+    :param load_batches: функция без аргументов, которая отдаёт пачки SQLite заново,
+        например lambda: loader.load_movies(); второй раз она вызывается только при расхождениях
+    """
+    instrumentation = instrumentation or Instrumentation()
+    with instrumentation.stage("verify source"):
+        source = source_digests(load_batches(), depth)
+
+    target = {}
+    with pg_conn.cursor() as cur:
+        with instrumentation.stage("verify name keys"):
+            create_name_keys(pg_conn, cur)
+        for table in TABLES:
+            with instrumentation.stage(f"verify {table.name}") as measurement:
+                target[table.name] = target_digests(cur, table, depth)
+                measurement.rows = sum(count for count, _total in target[table.name].values())
+    pg_conn.rollback()
+
+    ranges = {table.name: differing(source[table.name], target[table.name]) for table in TABLES}
+    narrowed = {table: set(table_ranges[:max_ranges]) for table, table_ranges in ranges.items() if table_ranges}
+    source_keys, target_keys = {}, {}
+    if narrowed:
+        logging.warning("verify: %s differ, look for keys", ", ".join(sorted(narrowed)))
+        with instrumentation.stage("verify source keys"):
+            source_keys = source_digests(load_batches(), depth, narrowed)
+        with pg_conn.cursor() as cur:
+            create_name_keys(pg_conn, cur)
+            for table in TABLES:
+                if table.name in narrowed:
+                    with instrumentation.stage(f"verify {table.name} keys"):
+                        target_keys[table.name] = target_digests(cur, table, depth, narrowed[table.name])
+        pg_conn.rollback()
+
+    reports = []
+    for table in TABLES:
+        table_source = source_keys.get(table.name, {})
+        table_target = target_keys.get(table.name, {})
+        reports.append(
+            TableReport(
+                table=table.name,
+                source_rows=sum(count for count, _total in source[table.name].values()),
+                target_rows=sum(count for count, _total in target[table.name].values()),
+                ranges=ranges[table.name],
+                missing=sorted(table_source.keys() - table_target.keys())[:max_keys],
+                unexpected=sorted(table_target.keys() - table_source.keys())[:max_keys],
+                changed=[
+                    key
+                    for key in sorted(table_source.keys() & table_target.keys())
+                    if table_source[key] != table_target[key]
+                ][:max_keys],
+            )
+        )
+    return reports
+
+
+def log_reports(reports: Sequence[TableReport]):
+    for report in reports:
+        if report.ok:
+            logging.info("verify %s: %s rows match", report.table, report.source_rows)
+            continue
+        logging.error(
+            "verify %s: %s rows in SQLite, %s in Postgres, %s differing key ranges %s",
+            report.table,
+            report.source_rows,
+            report.target_rows,
+            len(report.ranges),
+            report.ranges[:MAX_KEYS],
+        )
+        for kind in ("missing", "unexpected", "changed"):
+            keys = getattr(report, kind)
+            if keys:
+                logging.error("verify %s: %s keys %s", report.table, kind, keys)
+
+
+def _batches(sqlite_conn: sqlite3.Connection, extraction: str, batch_size: int, workers: int) -> Iterator[MovieBatch]:
+    yield from LOADERS[extraction](sqlite_conn).load_movies(batch_size, workers)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Сверка content.* в Postgres с исходной базой SQLite")
+    parser.add_argument("dataset", nargs="?", default="db.sqlite", help="Файл SQLite, из которого шла загрузка")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Количество процессов для преобразования данных")
+    parser.add_argument("--extraction", choices=sorted(LOADERS), default="group_concat")
+    parser.add_argument("--depth", type=int, default=DEPTH, help="Знаков md5 ключа в диапазоне: 16**depth диапазонов")
+    parser.add_argument("--max-ranges", type=int, default=MAX_RANGES, help="Для скольких диапазонов искать ключи")
+    args = parser.parse_args()
+
+    dsl = {
+        "dbname": "movies",
+        "user": "postgres",
+        "password": "postgres",
+        "host": "localhost",
+        "port": 5432,
+    }
+    instrumentation = Instrumentation()
+    with sqlite3.connect(args.dataset) as sqlite_conn, psycopg2.connect(**dsl) as pg_conn:
+        reports = verify(
+            lambda: _batches(sqlite_conn, args.extraction, args.batch_size, args.workers),
+            pg_conn,
+            depth=args.depth,
+            max_ranges=args.max_ranges,
+            instrumentation=instrumentation,
+        )
+    log_reports(reports)
+    instrumentation.log_report()
+    sys.exit(0 if all(report.ok for report in reports) else 1)
@@ -0,0 +1,163 @@
+import abc
+import io
+import logging
+import time
+from collections import defaultdict
+from typing import Iterable, Sequence
+
+from psycopg2.extras import execute_batch
+
+PAGE_SIZE = 5_000
+
+
+def upsert_clause(columns: Sequence[str], immutable: Sequence[str] = ()) -> str:
+    """
+    ON CONFLICT для таблиц с детерминированными id.
+    Строка обновляется только если её содержимое изменилось, поэтому
+    повторная загрузка неизменившихся данных не переписывает строки в таблице.
+    :param immutable: колонки, которые не обновляются у существующих строк (например, created_at)
+    """
+    updated = [column for column in columns if column != "id" and column not in immutable]
+    if not updated:
+        return " ON CONFLICT (id) DO NOTHING"
+    assignments = ", ".join(f"{column} = EXCLUDED.{column}" for column in updated)
+    current = ", ".join(f"t.{column}" for column in updated)
+    excluded = ", ".join(f"EXCLUDED.{column}" for column in updated)
+    return f" ON CONFLICT (id) DO UPDATE SET {assignments} WHERE ({current}) IS DISTINCT FROM ({excluded})"
+
+
+class TableWriter(abc.ABC):
+    """
+    Базовый класс движка записи в Postgres.
+    Считает количество строк и время записи по каждой таблице,
+    чтобы можно было сравнивать движки между собой.
+    При upsert=True строки вставляются через INSERT ... ON CONFLICT,
+    и повторный прогон ETL не создаёт дублей.
+    """
+
+    name = ""
+
+    def __init__(self, upsert: bool = True):
+        self.upsert = upsert
+        self.stats = defaultdict(lambda: {"rows": 0, "seconds": 0.0})
+
+    def save(self, cur, table: str, columns: Sequence[str], rows: Sequence[tuple], immutable: Sequence[str] = ()):
+        started = time.perf_counter()
+        conflict = upsert_clause(columns, immutable) if self.upsert else ""
+        self._write(cur, table, columns, rows, conflict)
+        stats = self.stats[table]
+        stats["rows"] += len(rows)
+        stats["seconds"] += time.perf_counter() - started
+
+    @abc.abstractmethod
+    def _write(self, cur, table: str, columns: Sequence[str], rows: Sequence[tuple], conflict: str):
+        """Записывает строки в таблицу; conflict — ON CONFLICT из upsert_clause или пустая строка"""
+
+    def report(self) -> dict:
+        """
+        :return: словарь вида
+        {
+            "content.film_work": {"rows": 999, "seconds": 0.1, "rows_per_sec": 9990.0},
+            ...
+        }
+        """
+        report = {}
+        for table, stats in self.stats.items():
+            seconds = stats["seconds"]
+            report[table] = {
+                "rows": stats["rows"],
+                "seconds": round(seconds, 3),
+                "rows_per_sec": round(stats["rows"] / seconds, 1) if seconds else None,
+            }
+        return report
+
+    def log_report(self):
+        for table, stats in self.report().items():
+            logging.info(
+                "[%s] %s: %s rows in %ss (%s rows/sec)",
+                self.name,
+                table,
+                stats["rows"],
+                stats["seconds"],
+                stats["rows_per_sec"],
+            )
+
+
+class ExecuteBatchWriter(TableWriter):
+    """Вставка через psycopg2.extras.execute_batch: один INSERT на строку, отправленные страницами."""
+
+    name = "execute_batch"
+
+    def __init__(self, upsert: bool = True, page_size: int = PAGE_SIZE):
+        super().__init__(upsert)
+        self.page_size = page_size
+
+    def _write(self, cur, table: str, columns: Sequence[str], rows: Sequence[tuple], conflict: str):
+        placeholders = ", ".join(["%s"] * len(columns))
+        execute_batch(
+            cur,
+            f"INSERT INTO {table} AS t ({', '.join(columns)}) VALUES ({placeholders}){conflict}",
+            rows,
+            page_size=self.page_size,
+        )
+
+
+def _copy_value(value) -> str:
+    """Экранирует значение для текстового формата COPY"""
+    if value is None:
+        return r"\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_lines(rows: Iterable[tuple]) -> Iterable[str]:
+    for row in rows:
+        yield "\t".join([_copy_value(value) for value in row]) + "\n"
+
+
+class CopyWriter(TableWriter):
+    """
+    Вставка через COPY ... FROM STDIN.
+    Пачка сериализуется в текстовый формат COPY в буфер в памяти
+    и отправляется одной командой через copy_expert.
+    COPY не умеет ON CONFLICT, поэтому при upsert пачка сначала копируется
+    во временную таблицу и переносится в целевую одним INSERT ... SELECT.
+    """
+
+    name = "copy"
+
+    def _write(self, cur, table: str, columns: Sequence[str], rows: Sequence[tuple], conflict: str):
+        if not rows:
+            return
+        if conflict:
+            # Одна команда INSERT ... ON CONFLICT не может обновить строку дважды. Остаётся последняя
+            # строка с каждым id, как после построчных INSERT в ExecuteBatchWriter
+            id_index = list(columns).index("id")
+            rows = list({row[id_index]: row for row in rows}.values())
+        buffer = io.StringIO()
+        buffer.writelines(_copy_lines(rows))
+        buffer.seek(0)
+        column_list = ", ".join(columns)
+        if not conflict:
+            cur.copy_expert(f"COPY {table} ({column_list}) FROM STDIN", buffer)
+            return
+
+        staging = f"tmp_{table.split('.')[-1]}"
+        cur.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        cur.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN", buffer)
+        cur.execute(f"INSERT INTO {table} AS t ({column_list}) SELECT {column_list} FROM {staging}{conflict}")
+        cur.execute(f"TRUNCATE {staging}")
+
+
+WRITERS = {
+    ExecuteBatchWriter.name: ExecuteBatchWriter,
+    CopyWriter.name: CopyWriter,
+}
+
+
+def get_writer(engine: str, **kwargs) -> TableWriter:
+    try:
+        return WRITERS[engine](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown writer engine: {engine}. Available: {', '.join(WRITERS)}")